@@ -24,6 +24,31 @@ def create_app(config_name=None):
     # Create database tables
     with app.app_context():
         db.create_all()
+        
+        # create_all() skips existing tables, so add indexes introduced later
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        
+        # Seed the dashboard counters (also registers their ORM listeners)
+        from app.stats_service import ensure_stats_snapshot
+        ensure_stats_snapshot()
+        
+        # Version rows used for ETags on the JSON APIs
+        from app.versioning import ensure_data_versions
+        ensure_data_versions('employees', 'attendance', 'salary_records')
+        
+        # Attendance rollup for analytics
+        from app.analytics_service import ensure_rollup
+        ensure_rollup()
+        
+        # Per-employee monthly attendance maps for range stats and heatmaps
+        from app.attendance_map_service import ensure_attendance_maps
+        ensure_attendance_maps()
+        
+        # Employee search index (FTS5 on SQLite, pg_trgm on PostgreSQL)
+        from app.search_service import init_search_index
+        init_search_index(app)
     
     # Configure logging
     if not app.debug:
@@ -46,6 +71,10 @@ def create_app(config_name=None):
     app.register_blueprint(attendance_bp, url_prefix='/attendance')
     app.register_blueprint(salary_bp, url_prefix='/salary')
     
+    # CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+    
     # Initialize AI client at startup to cache it
     with app.app_context():
         from app.ai_service import get_ai_client
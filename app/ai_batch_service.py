@@ -0,0 +1,161 @@
+"""Batched AI prompts: many insight requests answered by one completion.
+
+Each item is an ordinary single-insight prompt (from the ``*_messages``
+builders in :mod:`app.ai_service`). :func:`run_batched` packs items into
+batches sized by an estimated token budget - the prompt must fit
+``AI_BATCH_PROMPT_TOKENS`` and the expected answers ``AI_BATCH_COMPLETION_TOKENS``,
+with at most ``AI_BATCH_MAX_ITEMS`` items - and asks for a JSON array with
+one answer per item::
+
+    [{"id": 1, "answer": "..."}, {"id": 2, "answer": "..."}]
+
+Answers are validated item by item. Only the items that are missing, empty
+or malformed are retried, in new batches; when a whole response cannot be
+parsed the batch size is halved for the next attempt. Each accepted answer
+is stored exactly as if its single prompt had been sent (response cache
+and ``ai_insights``), so the regular endpoints find it.
+"""
+import json
+import re
+import time
+from flask import current_app
+from app.ai_breaker_service import CircuitOpenError
+
+MAX_ANSWER_CHARS = 500
+ANSWER_TOKENS = 160  # ~500 characters plus JSON framing
+PROMPT_OVERHEAD_TOKENS = 200
+COMPLETION_OVERHEAD_TOKENS = 50
+
+_INSTRUCTIONS = """You will receive {count} independent requests, each introduced by "### Request <id>".
+Answer every request on its own, following its instructions, in at most {chars} characters.
+Respond with ONLY a JSON array and no other text, one object per request:
+[{{"id": <id>, "answer": "<your answer>"}}]"""
+
+_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+class BatchItem:
+    """One insight request inside a batch run."""
+
+    def __init__(self, messages, scope=None, kind=None):
+        self.messages = messages
+        self.scope = scope
+        self.kind = kind
+        self.answer = None
+        self.attempts = 0
+        self.unavailable = False
+
+    @property
+    def prompt(self):
+        return self.messages[-1]['content']
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def plan_batches(items, max_items, prompt_tokens, completion_tokens):
+    """Split ``items`` into consecutive batches that fit the item and token budgets."""
+    batches, batch, used = [], [], PROMPT_OVERHEAD_TOKENS
+    per_batch = max(1, min(max_items, (completion_tokens - COMPLETION_OVERHEAD_TOKENS) // ANSWER_TOKENS))
+    for item in items:
+        cost = estimate_tokens(item.prompt) + 10
+        if batch and (len(batch) >= per_batch or used + cost > prompt_tokens):
+            batches.append(batch)
+            batch, used = [], PROMPT_OVERHEAD_TOKENS
+        batch.append(item)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def batch_messages(items):
+    """One user message carrying every item's prompt."""
+    parts = [_INSTRUCTIONS.format(count=len(items), chars=MAX_ANSWER_CHARS)]
+    for number, item in enumerate(items, start=1):
+        parts.append(f'### Request {number}\n{item.prompt}')
+    return [{'role': 'user', 'content': '\n\n'.join(parts)}]
+
+
+def parse_answers(content, count):
+    """``{number: answer}`` for the well-formed entries of a batch response (numbers are 1-based)."""
+    if not content:
+        return {}
+    text = _FENCE.sub('', content.strip())
+    start, end = text.find('['), text.rfind(']')
+    if start == -1 or end <= start:
+        return {}
+    try:
+        entries = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(entries, list):
+        return {}
+
+    answers = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            number = int(entry.get('id'))
+        except (TypeError, ValueError):
+            continue
+        answer = entry.get('answer')
+        if 1 <= number <= count and number not in answers and isinstance(answer, str) and answer.strip():
+            answers[number] = answer.strip()[:MAX_ANSWER_CHARS]
+    return answers
+
+
+def run_batched(ai, items, max_items=None, attempts=None, throttle=None):
+    """Answer ``items`` (:class:`BatchItem`) with batched completions.
+
+    ``throttle`` is called before every upstream request (e.g. a rate
+    limiter). Returns the number of upstream requests made; each item ends
+    with ``answer`` set, or ``None`` after ``attempts`` tries (``unavailable``
+    when the circuit breaker refused the call).
+    """
+    config = current_app.config
+    max_items = max_items or config['AI_BATCH_MAX_ITEMS']
+    attempts = attempts or config['AI_BATCH_ATTEMPTS']
+    temperature = ai.insight_temperature
+    requests_made = 0
+
+    pending = list(items)
+    for _ in range(attempts):
+        if not pending:
+            break
+        failed, unparsable = [], False
+        for batch in plan_batches(pending, max_items, config['AI_BATCH_PROMPT_TOKENS'],
+                                  config['AI_BATCH_COMPLETION_TOKENS']):
+            if throttle:
+                throttle()
+            for item in batch:
+                item.attempts += 1
+            try:
+                content = ai._complete(
+                    batch_messages(batch), temperature,
+                    max_tokens=len(batch) * ANSWER_TOKENS + COMPLETION_OVERHEAD_TOKENS
+                )
+            except CircuitOpenError as e:
+                for item in batch:
+                    item.unavailable = True
+                time.sleep(min(e.retry_after, 60))
+                failed.extend(batch)
+                continue
+            requests_made += 1
+
+            answers = parse_answers(content, len(batch))
+            unparsable = unparsable or (not answers and len(batch) > 1)
+            for number, item in enumerate(batch, start=1):
+                if number in answers:
+                    item.answer = answers[number]
+                    item.unavailable = False
+                    ai.remember(item.messages, temperature, item.answer, scope=item.scope, kind=item.kind)
+                else:
+                    failed.append(item)
+        if unparsable:
+            max_items = max(1, max_items // 2)
+        pending = failed
+    return requests_made
@@ -0,0 +1,209 @@
+"""Circuit breaker for the AI upstream, shared by all workers.
+
+State lives in ``ai_circuit_breakers`` (one row per upstream) and call
+outcomes in ``ai_circuit_buckets``: per-breaker counters in
+``BUCKET_SECONDS`` buckets, summed over the last
+``AI_BREAKER_WINDOW_SECONDS`` to form the rolling window.
+
+* **closed** - calls go through. Once the window holds at least
+  ``AI_BREAKER_MIN_CALLS`` calls and the share that failed or took longer
+  than ``AI_BREAKER_SLOW_SECONDS`` reaches ``AI_BREAKER_FAILURE_RATE``, the
+  breaker opens.
+* **open** - calls fail immediately with :class:`CircuitOpenError` for
+  ``AI_BREAKER_COOLDOWN_SECONDS``.
+* **half_open** - after the cool-down one caller (whichever wins a
+  conditional UPDATE) makes a trial call; everyone else still fails fast.
+  Success closes the breaker, failure re-opens it. A trial that never
+  reports back expires after ``AI_BREAKER_PROBE_SECONDS``.
+
+Every transition is a conditional UPDATE, so concurrent workers agree on a
+single outcome. Database problems never block a call: the breaker then
+behaves as closed.
+"""
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from app.models import db, AICircuitBreaker, AICircuitBucket
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+BUCKET_SECONDS = 10
+
+_DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the breaker is open."""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f'AI service temporarily unavailable; retry in {self.retry_after}s')
+
+
+class CircuitBreaker:
+    """Database-backed breaker for one upstream, identified by ``name``."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def _config(self, key):
+        return current_app.config[f'AI_BREAKER_{key}']
+
+    def _state_row(self, connection):
+        table = AICircuitBreaker.__table__
+        row = connection.execute(select(table).where(table.c.name == self.name)).first()
+        if row is None:
+            insert = _DIALECT_INSERTS.get(connection.dialect.name)
+            values = {'name': self.name, 'state': CLOSED, 'updated_at': datetime.utcnow()}
+            if insert is not None:
+                connection.execute(insert(table).values(values).on_conflict_do_nothing(index_elements=['name']))
+            else:
+                connection.execute(table.insert().values(values))
+            row = connection.execute(select(table).where(table.c.name == self.name)).first()
+        return row
+
+    def before_call(self):
+        """Return True if this caller is the half-open trial, False for a normal call.
+
+        Raises :class:`CircuitOpenError` when the call must not be made.
+        """
+        if not has_app_context():
+            return False
+        table = AICircuitBreaker.__table__
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as connection:
+                row = self._state_row(connection)
+                if row.state == CLOSED:
+                    return False
+                deadline = row.open_until if row.state == OPEN else row.probe_until
+                if deadline is not None and deadline > now:
+                    raise CircuitOpenError((deadline - now).total_seconds())
+                # Cool-down over (or the previous trial never reported back): try to run the trial
+                expired = table.c.open_until <= now if row.state == OPEN else table.c.probe_until <= now
+                claimed = connection.execute(
+                    update(table)
+                    .where(table.c.name == self.name, table.c.state == row.state, expired)
+                    .values(state=HALF_OPEN, probe_until=now + timedelta(seconds=self._config('PROBE_SECONDS')),
+                            updated_at=now)
+                ).rowcount
+        except SQLAlchemyError as e:
+            logger.warning('AI circuit breaker unavailable, allowing call: %s', e)
+            return False
+        if not claimed:
+            raise CircuitOpenError(1)
+        return True
+
+    def record(self, probe, ok, seconds):
+        """Report the outcome of a call allowed by :meth:`before_call`."""
+        if not has_app_context():
+            return
+        bad = not ok or seconds >= self._config('SLOW_SECONDS')
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as connection:
+                if probe:
+                    self._finish_probe(connection, bad, now)
+                else:
+                    self._count(connection, ok, bad, now)
+        except SQLAlchemyError as e:
+            logger.warning('AI circuit breaker could not record a call: %s', e)
+
+    def _finish_probe(self, connection, bad, now):
+        table = AICircuitBreaker.__table__
+        if bad:
+            values = {'state': OPEN, 'opened_at': now, 'probe_until': None, 'updated_at': now,
+                      'open_until': now + timedelta(seconds=self._config('COOLDOWN_SECONDS'))}
+        else:
+            values = {'state': CLOSED, 'opened_at': None, 'open_until': None, 'probe_until': None, 'updated_at': now}
+            self._reset_window(connection)
+        connection.execute(update(table).where(table.c.name == self.name, table.c.state == HALF_OPEN).values(**values))
+
+    def _count(self, connection, ok, bad, now):
+        buckets = AICircuitBucket.__table__
+        epoch = int(time.time())
+        values = {'name': self.name, 'bucket_start': epoch - epoch % BUCKET_SECONDS, 'calls': 1,
+                  'failures': 0 if ok else 1, 'slow_calls': 1 if ok and bad else 0}
+        insert = _DIALECT_INSERTS.get(connection.dialect.name)
+        if insert is not None:
+            statement = insert(buckets).values(values)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=['name', 'bucket_start'],
+                set_={column: buckets.c[column] + statement.excluded[column]
+                      for column in ('calls', 'failures', 'slow_calls')}
+            ))
+        else:
+            connection.execute(buckets.insert().values(values))
+
+        window_start = epoch - self._config('WINDOW_SECONDS')
+        connection.execute(buckets.delete().where(buckets.c.name == self.name, buckets.c.bucket_start < window_start))
+        calls, failures, slow_calls = self._window(connection, window_start)
+        if calls < self._config('MIN_CALLS') or (failures + slow_calls) / calls < self._config('FAILURE_RATE'):
+            return
+
+        table = AICircuitBreaker.__table__
+        opened = connection.execute(
+            update(table).where(table.c.name == self.name, table.c.state == CLOSED).values(
+                state=OPEN, opened_at=now, probe_until=None, updated_at=now,
+                open_until=now + timedelta(seconds=self._config('COOLDOWN_SECONDS'))
+            )
+        ).rowcount
+        if opened:
+            logger.warning('AI circuit breaker %s opened: %d of %d calls failed or slow',
+                           self.name, failures + slow_calls, calls)
+            self._reset_window(connection)
+
+    def _window(self, connection, window_start):
+        buckets = AICircuitBucket.__table__
+        calls, failures, slow_calls = connection.execute(
+            select(func.coalesce(func.sum(buckets.c.calls), 0),
+                   func.coalesce(func.sum(buckets.c.failures), 0),
+                   func.coalesce(func.sum(buckets.c.slow_calls), 0))
+            .where(buckets.c.name == self.name, buckets.c.bucket_start >= window_start)
+        ).one()
+        return int(calls), int(failures), int(slow_calls)
+
+    def _reset_window(self, connection):
+        buckets = AICircuitBucket.__table__
+        connection.execute(buckets.delete().where(buckets.c.name == self.name))
+
+    def status(self):
+        """Current state, rolling-window counts and thresholds."""
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            row = self._state_row(connection)
+            calls, failures, slow_calls = self._window(connection, int(time.time()) - self._config('WINDOW_SECONDS'))
+        deadline = row.open_until if row.state == OPEN else row.probe_until if row.state == HALF_OPEN else None
+        return {
+            'name': self.name,
+            'state': row.state,
+            'opened_at': row.opened_at.isoformat() if row.opened_at else None,
+            'retry_after': max(1, math.ceil((deadline - now).total_seconds())) if deadline and deadline > now else 0,
+            'window': {
+                'seconds': self._config('WINDOW_SECONDS'),
+                'calls': calls,
+                'failures': failures,
+                'slow_calls': slow_calls,
+                'failure_rate': round((failures + slow_calls) / calls, 3) if calls else None
+            },
+            'thresholds': {
+                'min_calls': self._config('MIN_CALLS'),
+                'failure_rate': self._config('FAILURE_RATE'),
+                'slow_seconds': self._config('SLOW_SECONDS'),
+                'cooldown_seconds': self._config('COOLDOWN_SECONDS')
+            }
+        }
+
+
+openrouter_breaker = CircuitBreaker('openrouter')
@@ -0,0 +1,189 @@
+"""Database-backed cache for OpenRouter completions.
+
+Responses are keyed by a SHA-256 of ``(model, messages, temperature)`` and
+stored in ``ai_response_cache``, so every gunicorn worker shares them. An
+entry lives for ``AI_CACHE_TTL`` seconds; beyond ``AI_CACHE_MAX_ENTRIES``
+the least recently used entries are evicted.
+
+Entries carry a ``scope`` (``employee:<id>`` or ``department:<name>``).
+Flushes that write an Employee or Attendance row delete the scopes of the
+employees involved and of their departments, so an insight is regenerated
+once its underlying data changes. Bulk writes that bypass the ORM call
+:func:`invalidate` themselves.
+
+Cache reads and writes use their own short transactions and never raise:
+a database problem degrades to an uncached upstream call.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from itertools import chain
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from app.models import db, Employee, Attendance, AIResponseCache
+from app.stats_service import _previous
+
+logger = logging.getLogger(__name__)
+
+IN_CHUNK_SIZE = 1000
+
+_DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+_counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0, 'invalidated': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _counters_lock:
+        _counters[name] += amount
+
+
+def cache_key(model, messages, temperature):
+    payload = json.dumps([model, messages, temperature], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def employee_scope(employee_id):
+    return f'employee:{employee_id}'
+
+
+def department_scope(department):
+    return f'department:{department}'
+
+
+# ==================== LOOKUP & STORE ====================
+def get(key):
+    """Return the cached response for ``key`` or ``None`` (expired entries miss)."""
+    if not has_app_context():
+        return None
+    table = AIResponseCache.__table__
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as connection:
+            response = connection.execute(
+                select(table.c.response).where(table.c.key == key, table.c.expires_at > now)
+            ).scalar()
+            if response is not None:
+                connection.execute(
+                    table.update().where(table.c.key == key)
+                    .values(hits=table.c.hits + 1, last_used_at=now)
+                )
+    except SQLAlchemyError as e:
+        logger.warning('AI cache lookup failed: %s', e)
+        return None
+    _count('hits' if response is not None else 'misses')
+    return response
+
+
+def put(key, response, model, scope=None):
+    """Store ``response`` under ``key`` and evict expired / least recently used entries."""
+    if not has_app_context():
+        return
+    table = AIResponseCache.__table__
+    now = datetime.utcnow()
+    row = {
+        'key': key, 'scope': scope, 'model': model, 'response': response, 'hits': 0,
+        'created_at': now, 'last_used_at': now,
+        'expires_at': now + timedelta(seconds=current_app.config.get('AI_CACHE_TTL', 24 * 3600))
+    }
+    try:
+        with db.engine.begin() as connection:
+            insert = _DIALECT_INSERTS.get(connection.dialect.name)
+            if insert is None:
+                connection.execute(table.delete().where(table.c.key == key))
+                connection.execute(table.insert().values(row))
+            else:
+                statement = insert(table).values(row)
+                connection.execute(statement.on_conflict_do_update(
+                    index_elements=['key'],
+                    set_={name: statement.excluded[name] for name in row if name != 'key'}
+                ))
+            evicted = _evict(connection, now)
+    except SQLAlchemyError as e:
+        logger.warning('AI cache store failed: %s', e)
+        return
+    _count('stores')
+    if evicted:
+        _count('evicted', evicted)
+
+
+def _evict(connection, now):
+    table = AIResponseCache.__table__
+    evicted = connection.execute(table.delete().where(table.c.expires_at <= now)).rowcount
+    excess = connection.execute(select(func.count()).select_from(table)).scalar() \
+        - current_app.config.get('AI_CACHE_MAX_ENTRIES', 5000)
+    if excess > 0:
+        oldest = select(table.c.key).order_by(table.c.last_used_at).limit(excess)
+        evicted += connection.execute(table.delete().where(table.c.key.in_(oldest))).rowcount
+    return evicted
+
+
+# ==================== INVALIDATION ====================
+def invalidate(connection, employee_ids=(), departments=()):
+    """Delete entries for the given employees, their departments and ``departments``."""
+    employee_ids = [employee_id for employee_id in set(employee_ids) if employee_id is not None]
+    departments = {department for department in departments if department}
+    if not employee_ids and not departments:
+        return 0
+
+    emp = Employee.__table__
+    for start in range(0, len(employee_ids), IN_CHUNK_SIZE):
+        departments.update(connection.execute(
+            select(emp.c.department).where(emp.c.id.in_(employee_ids[start:start + IN_CHUNK_SIZE])).distinct()
+        ).scalars())
+    scopes = [employee_scope(employee_id) for employee_id in employee_ids]
+    scopes.extend(department_scope(department) for department in departments)
+
+    table = AIResponseCache.__table__
+    deleted = 0
+    for start in range(0, len(scopes), IN_CHUNK_SIZE):
+        deleted += connection.execute(
+            table.delete().where(table.c.scope.in_(scopes[start:start + IN_CHUNK_SIZE]))
+        ).rowcount
+    if deleted:
+        _count('invalidated', deleted)
+    return deleted
+
+
+@event.listens_for(db.session, 'after_flush')
+def _invalidate_flushed(session, flush_context):
+    employee_ids, departments = set(), set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Employee):
+            employee_ids.add(obj.id)
+            departments.update((obj.department, _previous(obj, 'department')))
+        elif isinstance(obj, Attendance):
+            employee_ids.update((obj.employee_id, _previous(obj, 'employee_id')))
+    if employee_ids or departments:
+        invalidate(session.connection(), employee_ids, departments)
+
+
+def clear():
+    """Delete every cached response; returns the number removed."""
+    with db.engine.begin() as connection:
+        return connection.execute(AIResponseCache.__table__.delete()).rowcount
+
+
+def get_cache_stats():
+    """Entry counts from the shared table plus this worker's hit/miss counters."""
+    table = AIResponseCache.__table__
+    entries, stored_hits = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(table.c.hits), 0)).select_from(table)
+    ).one()
+    with _counters_lock:
+        worker = dict(_counters)
+    lookups = worker['hits'] + worker['misses']
+    return {
+        'entries': entries,
+        'max_entries': current_app.config.get('AI_CACHE_MAX_ENTRIES', 5000),
+        'ttl_seconds': current_app.config.get('AI_CACHE_TTL', 24 * 3600),
+        'entry_hits': int(stored_hits),
+        'worker': {**worker, 'hit_rate': round(100.0 * worker['hits'] / lookups, 1) if lookups else None}
+    }
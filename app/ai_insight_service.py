@@ -0,0 +1,284 @@
+"""Stored AI insights and their batch precomputation.
+
+``ai_insights`` keeps the latest insight per (kind, scope) - kinds
+``salary``, ``performance``, ``attendance`` for ``employee:<id>`` and
+``department`` for ``department:<name>`` - together with the hash of the
+prompt it answers and when it was generated. An insight is *fresh* while
+the prompt built from current data hashes the same and it is younger than
+``AI_INSIGHT_MAX_AGE_HOURS``; :meth:`OpenRouterAI._call_api` serves fresh
+insights without touching the upstream and stores every new one.
+
+:func:`precompute_insights` (``flask ai-precompute``) walks all active
+employees and every department, skips fresh insights and generates the
+rest under a concurrency limit and a token-bucket rate limit, so users
+normally find the insight already stored. Stale insights are sent several
+to a request (see :mod:`app.ai_batch_service`) unless the batch size is 1.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, date, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from app.models import db, Employee, AIInsight
+from app.ai_cache_service import cache_key, employee_scope, department_scope
+from app.ai_breaker_service import CircuitOpenError
+from app.ai_batch_service import BatchItem, run_batched
+from app.analytics_service import department_status_counts
+from app.employee_summary_service import get_employee_summaries
+
+DEPARTMENT_WINDOW_DAYS = 30
+EMPLOYEE_CHUNK_SIZE = 500
+
+_DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+# ==================== PROMPT INPUTS ====================
+def years_of_experience(employee):
+    """Years since joining, rounded so the prompt (and its hash) is stable day to day."""
+    if not employee.joining_date:
+        return None
+    return round((datetime.now() - employee.joining_date).days / 365.25, 1)
+
+
+def months_employed(employee):
+    if not employee.joining_date:
+        return 0
+    return (datetime.now() - employee.joining_date).days // 30
+
+
+def employee_insight_messages(ai, employee, summary):
+    """``{kind: messages}`` for the three employee insights."""
+    return {
+        'salary': ai.salary_recommendation_messages(
+            employee.name, employee.position, employee.department, employee.salary,
+            years_of_experience(employee)
+        ),
+        'performance': ai.performance_insight_messages(
+            employee.name, employee.department, summary.attendance_score, months_employed(employee)
+        ),
+        'attendance': ai.attendance_analysis_messages(
+            employee.name, summary.present_days, summary.missed_days, summary.total_days
+        )
+    }
+
+
+def department_attendance(department, start=None, end=None):
+    """Present share (%) of the department's attendance records in the window, from the rollup."""
+    status_counts = department_status_counts(department, start, end)
+    total_records = sum(status_counts.values())
+    return (status_counts.get('Present', 0) / total_records * 100) if total_records else 0
+
+
+def default_department_window():
+    return date.today() - timedelta(days=DEPARTMENT_WINDOW_DAYS), None
+
+
+# ==================== STORAGE ====================
+def _is_fresh(prompt_hash, generated_at, current_hash):
+    max_age = timedelta(hours=current_app.config.get('AI_INSIGHT_MAX_AGE_HOURS', 7 * 24))
+    return prompt_hash == current_hash and generated_at > datetime.utcnow() - max_age
+
+
+def fresh_insight(kind, scope, prompt_hash):
+    """Stored text for (kind, scope) if it answers ``prompt_hash`` and is not too old, else None."""
+    if not has_app_context():
+        return None
+    table = AIInsight.__table__
+    try:
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(table.c.prompt_hash, table.c.generated_at, table.c.text)
+                .where(table.c.kind == kind, table.c.scope == scope)
+            ).first()
+    except SQLAlchemyError as e:
+        current_app.logger.warning('AI insight lookup failed: %s', e)
+        return None
+    if row is None or not _is_fresh(row.prompt_hash, row.generated_at, prompt_hash):
+        return None
+    return row.text
+
+
+def save_insight(kind, scope, prompt_hash, text, model):
+    """Insert or replace the stored insight for (kind, scope)."""
+    if not has_app_context():
+        return
+    table = AIInsight.__table__
+    values = {'kind': kind, 'scope': scope, 'prompt_hash': prompt_hash, 'text': text, 'model': model,
+              'generated_at': datetime.utcnow()}
+    try:
+        with db.engine.begin() as connection:
+            insert = _DIALECT_INSERTS.get(connection.dialect.name)
+            if insert is None:
+                connection.execute(table.delete().where(table.c.kind == kind, table.c.scope == scope))
+                connection.execute(table.insert().values(values))
+            else:
+                statement = insert(table).values(values)
+                connection.execute(statement.on_conflict_do_update(
+                    index_elements=['kind', 'scope'],
+                    set_={name: statement.excluded[name] for name in ('prompt_hash', 'text', 'model', 'generated_at')}
+                ))
+    except SQLAlchemyError as e:
+        current_app.logger.warning('AI insight store failed: %s', e)
+
+
+@event.listens_for(Employee, 'after_delete')
+def _employee_deleted(mapper, connection, target):
+    table = AIInsight.__table__
+    connection.execute(table.delete().where(table.c.scope == employee_scope(target.id)))
+
+
+# ==================== PRECOMPUTATION ====================
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, at most ``burst`` saved up."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class PrecomputeReport:
+    """Counts from one precomputation pass."""
+
+    def __init__(self):
+        self.considered = 0
+        self.fresh = 0
+        self.generated = 0
+        self.failed = 0
+        self.unavailable = 0
+        self.requests = 0
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return {
+            'considered': self.considered,
+            'fresh': self.fresh,
+            'generated': self.generated,
+            'failed': self.failed,
+            'unavailable': self.unavailable,
+            'requests': self.requests,
+            'seconds': round(self.seconds, 3)
+        }
+
+
+def _insight_requests(ai):
+    """Yield ``(kind, scope, messages)`` for every active employee and every department."""
+    last_id = 0
+    while True:
+        employees = Employee.query.filter(Employee.status == 'Active', Employee.id > last_id) \
+            .order_by(Employee.id).limit(EMPLOYEE_CHUNK_SIZE).all()
+        if not employees:
+            break
+        last_id = employees[-1].id
+        summaries = get_employee_summaries([employee.id for employee in employees])
+        for employee in employees:
+            for kind, messages in employee_insight_messages(ai, employee, summaries[employee.id]).items():
+                yield kind, employee_scope(employee.id), messages
+        db.session.expunge_all()
+
+    start, end = default_department_window()
+    departments = db.session.query(Employee.department, func.count(Employee.id), func.avg(Employee.salary)) \
+        .group_by(Employee.department).order_by(Employee.department).all()
+    for department, total_employees, avg_salary in departments:
+        messages = ai.department_insights_messages(
+            department, total_employees, avg_salary, department_attendance(department, start, end)
+        )
+        yield 'department', department_scope(department), messages
+
+
+def precompute_insights(ai, concurrency=None, rate=None, burst=None, force=False, batch_size=None, on_progress=None):
+    """Generate every missing or stale insight; returns a :class:`PrecomputeReport`.
+
+    ``force`` regenerates fresh insights too. ``batch_size`` (default
+    ``AI_BATCH_MAX_ITEMS``) insights share an upstream request; 1 sends one
+    request per insight. ``on_progress`` is called with the report after
+    each finished task.
+    """
+    config = current_app.config
+    concurrency = concurrency or config['AI_PRECOMPUTE_CONCURRENCY']
+    batch_size = batch_size or config['AI_BATCH_MAX_ITEMS']
+    bucket = TokenBucket(rate or config['AI_PRECOMPUTE_RATE'], burst or config['AI_PRECOMPUTE_BURST'])
+    temperature = ai.insight_temperature
+    app = current_app._get_current_object()
+    report = PrecomputeReport()
+    started = time.perf_counter()
+
+    table = AIInsight.__table__
+    stored = {
+        (row.kind, row.scope): (row.prompt_hash, row.generated_at)
+        for row in db.session.execute(select(table.c.kind, table.c.scope, table.c.prompt_hash, table.c.generated_at))
+    }
+
+    def generate(item):
+        bucket.acquire()
+        with app.app_context():
+            try:
+                text = ai._call_api(item.messages, temperature=temperature, scope=item.scope, kind=item.kind,
+                                    refresh=force)
+            except CircuitOpenError as e:
+                # Upstream is down: back off for the cool-down instead of failing every queued item at once
+                time.sleep(min(e.retry_after, 60))
+                return ['unavailable'], 1
+        return ['generated' if text else 'failed'], 1
+
+    def generate_batch(items):
+        with app.app_context():
+            requests_made = run_batched(ai, items, max_items=batch_size, throttle=bucket.acquire)
+        outcomes = ['generated' if item.answer else 'unavailable' if item.unavailable else 'failed' for item in items]
+        return outcomes, requests_made
+
+    def collect(futures):
+        for future in futures:
+            outcomes, requests_made = future.result()
+            for outcome in outcomes:
+                setattr(report, outcome, getattr(report, outcome) + 1)
+            report.requests += requests_made
+            if on_progress:
+                on_progress(report)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ai-precompute') as executor:
+        pending, group = set(), []
+        for kind, scope, messages in _insight_requests(ai):
+            report.considered += 1
+            previous = stored.get((kind, scope))
+            if not force and previous and _is_fresh(*previous, cache_key(ai.model, messages, temperature)):
+                report.fresh += 1
+                continue
+            item = BatchItem(messages, scope=scope, kind=kind)
+            if batch_size <= 1:
+                pending.add(executor.submit(generate, item))
+            else:
+                group.append(item)
+                if len(group) >= batch_size:
+                    pending.add(executor.submit(generate_batch, group))
+                    group = []
+            if len(pending) >= concurrency * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        if group:
+            pending.add(executor.submit(generate_batch, group))
+        collect(pending)
+
+    report.seconds = time.perf_counter() - started
+    return report
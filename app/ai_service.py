@@ -2,59 +2,292 @@
 Integrates GPT-OSS-120B for salary recommendations, performance insights, and analysis.
 """
 import os
+import queue
+import random
 import requests
 import json
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
 from functools import lru_cache
+from flask import current_app
+from app import ai_cache_service, ai_insight_service, ai_singleflight_service
+from app.ai_breaker_service import openrouter_breaker, CircuitOpenError
+
+DEFAULT_BASE_URL = 'https://openrouter.ai/api/v1'
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RESPONSE_CHARS = 500
+
+FALLBACKS = {
+    'salary': "Unable to generate recommendation at this time.",
+    'performance': "Unable to generate insight at this time.",
+    'attendance': "Unable to generate analysis at this time.",
+    'department': "Unable to generate insight at this time.",
+}
 
 class OpenRouterAI:
     """OpenRouter AI client for intelligent employee insights."""
     
+    insight_temperature = 0.5
+    
     def __init__(self):
         self.api_key = os.environ.get('OPENROUTER_API_KEY')
         self.model = 'openrouter/auto'  # Will use GPT-OSS-120B (free)
-        self.api_url = 'https://openrouter.ai/api/v1/chat/completions'
+        # Point OPENROUTER_BASE_URL at a local stub server for tests and benchmarks
+        self.base_url = os.environ.get('OPENROUTER_BASE_URL', DEFAULT_BASE_URL).rstrip('/')
+        self.api_url = f'{self.base_url}/chat/completions'
+        self.connect_timeout = float(os.environ.get('OPENROUTER_CONNECT_TIMEOUT', 3.05))
+        self.read_timeout = float(os.environ.get('OPENROUTER_READ_TIMEOUT', 30))
+        self.max_retries = int(os.environ.get('OPENROUTER_MAX_RETRIES', 2))
+        self.backoff_base = float(os.environ.get('OPENROUTER_BACKOFF_BASE', 0.5))
+        self.backoff_max = float(os.environ.get('OPENROUTER_BACKOFF_MAX', 8))
+        self.pool_size = int(os.environ.get('OPENROUTER_POOL_SIZE', 10))
         if not self.api_key:
             raise ValueError('OPENROUTER_API_KEY not set in .env')
+        self._adapter = None
+        self._adapter_pid = None
+        self._adapter_lock = threading.Lock()
+        self._local = threading.local()
     
-    def _call_api(self, messages, temperature=0.7):
-        """Make a request to OpenRouter API."""
-        try:
-            headers = {
+    def _session(self):
+        """Keep-alive session for the calling thread.
+        
+        Every thread gets its own ``requests.Session`` (sessions are not
+        thread-safe) but they all mount one ``HTTPAdapter`` whose connection
+        pool is shared, so TLS connections to the upstream are reused across
+        requests and threads. The adapter is recreated after a fork so worker
+        processes never share sockets with the master.
+        """
+        pid = os.getpid()
+        with self._adapter_lock:
+            if self._adapter is None or self._adapter_pid != pid:
+                self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+                self._adapter_pid = pid
+            adapter = self._adapter
+        session = getattr(self._local, 'session', None)
+        if session is None or self._local.adapter is not adapter:
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
                 'Authorization': f'Bearer {self.api_key}',
                 'Content-Type': 'application/json',
                 'HTTP-Referer': 'http://localhost:5000',
                 'X-Title': 'Employee Management System'
-            }
-            payload = {
-                'model': self.model,
-                'messages': messages,
-                'temperature': temperature,
-                'max_tokens': 500
-            }
-            response = requests.post(self.api_url, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            if 'choices' in data and len(data['choices']) > 0:
-                choice = data['choices'][0]
-                message = choice.get('message', {})
-                content = message.get('content', '').strip()
-                
-                # If content is empty but there's reasoning (some models), use that
-                if not content and 'reasoning' in message:
-                    content = message['reasoning'].strip()
-                
-                # Limit response to 500 characters for UI
-                return content[:500] if content else None
-            return None
+            })
+            self._local.session = session
+            self._local.adapter = adapter
+        return session
+    
+    def _backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retry ``attempt`` (0-based): Retry-After if sane, else full jitter."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    def _post(self, payload, stream=False):
+        """POST to the chat completions URL, retrying connection failures and 429/5xx.
+        
+        Read timeouts are not retried: the request may still be running
+        upstream and a retry would double the wait.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._session().post(
+                    self.api_url, json=payload, timeout=(self.connect_timeout, self.read_timeout), stream=stream
+                )
+            except requests.exceptions.ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                response.close()
+                time.sleep(self._backoff(attempt, response.headers.get('Retry-After')))
+                continue
+            return response
+    
+    def _call_api(self, messages, temperature=0.7, scope=None, kind=None, refresh=False):
+        """Make a request to OpenRouter API, answering from stored insights or the response cache when possible.
+
+        ``scope`` (e.g. ``employee:12``) lets the cached response be invalidated
+        when that employee's or department's data changes. With ``kind`` as
+        well, the answer is kept in ``ai_insights`` and served from there while
+        fresh. Identical concurrent requests share one upstream call.
+        ``refresh`` skips the lookups and always calls the upstream.
+        """
+        key = ai_cache_service.cache_key(self.model, messages, temperature)
+        if not refresh:
+            stored = ai_insight_service.fresh_insight(kind, scope, key) if scope and kind else None
+            if stored is not None:
+                return stored
+            cached = ai_cache_service.get(key)
+            if cached is not None:
+                if scope and kind:
+                    ai_insight_service.save_insight(kind, scope, key, cached, self.model)
+                return cached
+            # Identical requests already in flight (here or in another worker) share one upstream call
+            return ai_singleflight_service.call(
+                key, lambda: self._fetch(messages, temperature, scope, kind), lookup=lambda: ai_cache_service.get(key)
+            )
+        return self._fetch(messages, temperature, scope, kind)
+    
+    def _fetch(self, messages, temperature, scope=None, kind=None):
+        """Upstream answer to ``messages``, truncated for the UI and remembered; None on failure."""
+        content = self._complete(messages, temperature)
+        # Limit response to 500 characters for UI
+        content = content[:MAX_RESPONSE_CHARS] if content else None
+        if content:
+            self.remember(messages, temperature, content, scope=scope, kind=kind)
+        return content
+    
+    def remember(self, messages, temperature, content, scope=None, kind=None):
+        """Store an answer to ``messages`` in the response cache (and ``ai_insights`` given scope and kind)."""
+        key = ai_cache_service.cache_key(self.model, messages, temperature)
+        ai_cache_service.put(key, content, self.model, scope)
+        if scope and kind:
+            ai_insight_service.save_insight(kind, scope, key, content, self.model)
+    
+    def _complete(self, messages, temperature, max_tokens=500):
+        """One upstream completion through the circuit breaker; returns the text or None on failure.
+        
+        Raises CircuitOpenError while the upstream is considered down.
+        """
+        probe = openrouter_breaker.before_call()
+        started = time.perf_counter()
+        ok = False
+        try:
+            content = self._request(messages, temperature, max_tokens=max_tokens)
+            ok = True
         except requests.exceptions.RequestException as e:
             print(f'OpenRouter API error: {str(e)}')
-            return None
+            content = None
         except Exception as e:
             print(f'Unexpected error in AI call: {str(e)}')
-            return None
+            content = None
+        openrouter_breaker.record(probe, ok, time.perf_counter() - started)
+        return content
     
-    def get_salary_recommendation(self, employee_name, position, department, current_salary, years_exp=None):
-        """Get AI-powered salary recommendation."""
+    def _request(self, messages, temperature, max_tokens=500):
+        """Send one chat completion request; returns the text (None if empty), raises on failure."""
+        payload = {
+            'model': self.model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens
+        }
+        response = self._post(payload)
+        response.raise_for_status()
+        data = response.json()
+        if 'choices' in data and len(data['choices']) > 0:
+            choice = data['choices'][0]
+            message = choice.get('message', {})
+            content = message.get('content', '').strip()
+            
+            # If content is empty but there's reasoning (some models), use that
+            if not content and 'reasoning' in message:
+                content = message['reasoning'].strip()
+            
+            return content or None
+        return None
+    
+    def stream_api(self, messages, temperature=0.7, scope=None, kind=None):
+        """Like :meth:`_call_api` but yield the answer in pieces as the upstream streams it.
+        
+        Stored and cached answers are yielded as a single piece. The
+        500-character limit is applied while streaming: once reached, the
+        upstream response is closed. The complete answer is cached (and
+        stored with ``kind``) afterwards. Identical concurrent streams share
+        one upstream call. Raises CircuitOpenError before the first piece
+        while the upstream is considered down.
+        """
+        key = ai_cache_service.cache_key(self.model, messages, temperature)
+        stored = ai_insight_service.fresh_insight(kind, scope, key) if scope and kind else None
+        if stored is None:
+            stored = ai_cache_service.get(key)
+        if stored is not None:
+            yield stored
+            return
+        
+        yield from ai_singleflight_service.stream(
+            key, lambda: self._stream_fetch(messages, temperature, scope, kind), lookup=lambda: ai_cache_service.get(key)
+        )
+    
+    def _stream_fetch(self, messages, temperature, scope=None, kind=None):
+        """Stream the upstream answer to ``messages`` (see :meth:`stream_api`), remembering it when complete."""
+        probe = openrouter_breaker.before_call()
+        started = time.perf_counter()
+        deltas = self._stream_request(messages, temperature)
+        pieces, length, failed = [], 0, False
+        try:
+            for delta in deltas:
+                if not length:
+                    delta = delta.lstrip()
+                piece = delta[:MAX_RESPONSE_CHARS - length]
+                if piece:
+                    pieces.append(piece)
+                    length += len(piece)
+                    yield piece
+                if length >= MAX_RESPONSE_CHARS:
+                    break
+        except requests.exceptions.RequestException as e:
+            print(f'OpenRouter API error: {str(e)}')
+            failed = True
+        except Exception as e:
+            print(f'Unexpected error in AI call: {str(e)}')
+            failed = True
+        finally:
+            # Also reached when the client disconnects mid-stream; that is not an upstream failure
+            deltas.close()
+            openrouter_breaker.record(probe, not failed, time.perf_counter() - started)
+        
+        content = ''.join(pieces).strip()
+        if not failed and content:
+            self.remember(messages, temperature, content, scope=scope, kind=kind)
+    
+    def _stream_request(self, messages, temperature, max_tokens=500):
+        """Yield text deltas from a streamed chat completion (``stream: true``); raises on failure."""
+        payload = {
+            'model': self.model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'stream': True
+        }
+        response = self._post(payload, stream=True)
+        with response:
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            reasoning = []
+            produced = False
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; ':' lines are keep-alive comments
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                error = chunk.get('error')
+                if error:
+                    raise ValueError(error.get('message', 'Streaming error') if isinstance(error, dict) else str(error))
+                for choice in chunk.get('choices') or []:
+                    delta = choice.get('delta') or {}
+                    if delta.get('content'):
+                        produced = True
+                        yield delta['content']
+                    elif delta.get('reasoning'):
+                        reasoning.append(delta['reasoning'])
+            # Some models only produce reasoning; fall back to it like the non-streaming call
+            if not produced and reasoning:
+                yield ''.join(reasoning)
+    
+    def salary_recommendation_messages(self, employee_name, position, department, current_salary, years_exp=None):
+        """Chat messages asking for a salary recommendation."""
         prompt = f"""Analyze this employee's salary based on market standards and provide a brief recommendation.
 
 Employee: {employee_name}
@@ -65,11 +298,16 @@ Years of Experience: {years_exp or 'Unknown'}
 
 Provide a brief recommendation (2-3 sentences) on whether the salary is competitive, below market, or above market. Be concise."""
         
-        messages = [{'role': 'user', 'content': prompt}]
-        return self._call_api(messages, temperature=0.5) or "Unable to generate recommendation at this time."
+        return [{'role': 'user', 'content': prompt}]
     
-    def get_performance_insight(self, employee_name, department, attendance_score, months_employed):
-        """Get AI-powered performance insight."""
+    def get_salary_recommendation(self, employee_name, position, department, current_salary, years_exp=None,
+                                  scope=None, kind='salary'):
+        """Get AI-powered salary recommendation."""
+        messages = self.salary_recommendation_messages(employee_name, position, department, current_salary, years_exp)
+        return self._call_api(messages, temperature=self.insight_temperature, scope=scope, kind=kind) or FALLBACKS['salary']
+    
+    def performance_insight_messages(self, employee_name, department, attendance_score, months_employed):
+        """Chat messages asking for a performance insight."""
         prompt = f"""Provide a brief professional insight on this employee's performance and engagement.
 
 Employee: {employee_name}
@@ -79,11 +317,16 @@ Months Employed: {months_employed}
 
 Provide 2-3 sentences assessing their engagement level and suggesting areas for improvement or recognition. Be constructive and professional."""
         
-        messages = [{'role': 'user', 'content': prompt}]
-        return self._call_api(messages, temperature=0.5) or "Unable to generate insight at this time."
+        return [{'role': 'user', 'content': prompt}]
     
-    def get_attendance_analysis(self, employee_name, present_days, absent_days, total_days):
-        """Analyze attendance patterns."""
+    def get_performance_insight(self, employee_name, department, attendance_score, months_employed,
+                                scope=None, kind='performance'):
+        """Get AI-powered performance insight."""
+        messages = self.performance_insight_messages(employee_name, department, attendance_score, months_employed)
+        return self._call_api(messages, temperature=self.insight_temperature, scope=scope, kind=kind) or FALLBACKS['performance']
+    
+    def attendance_analysis_messages(self, employee_name, present_days, absent_days, total_days):
+        """Chat messages asking for an attendance analysis."""
         attendance_pct = (present_days / total_days * 100) if total_days > 0 else 0
         prompt = f"""Analyze this employee's attendance pattern and provide actionable feedback.
 
@@ -95,11 +338,16 @@ Attendance Rate: {attendance_pct:.1f}%
 
 Provide 2-3 sentences analyzing trends and suggestions. Be professional and fair."""
         
-        messages = [{'role': 'user', 'content': prompt}]
-        return self._call_api(messages, temperature=0.5) or "Unable to generate analysis at this time."
+        return [{'role': 'user', 'content': prompt}]
     
-    def get_department_insights(self, department_name, total_employees, avg_salary, avg_attendance):
-        """Get insights for a department."""
+    def get_attendance_analysis(self, employee_name, present_days, absent_days, total_days,
+                                scope=None, kind='attendance'):
+        """Analyze attendance patterns."""
+        messages = self.attendance_analysis_messages(employee_name, present_days, absent_days, total_days)
+        return self._call_api(messages, temperature=self.insight_temperature, scope=scope, kind=kind) or FALLBACKS['attendance']
+    
+    def department_insights_messages(self, department_name, total_employees, avg_salary, avg_attendance):
+        """Chat messages asking for department insights."""
         prompt = f"""Provide a brief strategic insight on this department's performance and health.
 
 Department: {department_name}
@@ -109,8 +357,109 @@ Average Attendance: {avg_attendance:.1f}%
 
 Provide 2-3 sentences on department strength and areas for improvement. Be strategic and constructive."""
         
-        messages = [{'role': 'user', 'content': prompt}]
-        return self._call_api(messages, temperature=0.5) or "Unable to generate insight at this time."
+        return [{'role': 'user', 'content': prompt}]
+    
+    def get_department_insights(self, department_name, total_employees, avg_salary, avg_attendance,
+                                scope=None, kind='department'):
+        """Get insights for a department."""
+        messages = self.department_insights_messages(department_name, total_employees, avg_salary, avg_attendance)
+        return self._call_api(messages, temperature=self.insight_temperature, scope=scope, kind=kind) or FALLBACKS['department']
+    
+    def call_concurrently(self, requests_by_name, scope=None, timeout=25):
+        """Run several prompts in parallel and wait at most ``timeout`` seconds.
+        
+        ``requests_by_name`` maps an insight kind to its chat messages. Returns
+        ``{name: {'text', 'status', 'seconds'}}`` where status is ``ok``,
+        ``failed`` (no usable answer), ``timeout`` or ``unavailable`` (circuit
+        breaker open; the entry also carries ``retry_after``). Calls still
+        running at the deadline finish in the background and land in the
+        response cache.
+        """
+        app = current_app._get_current_object()
+        started = time.perf_counter()
+        
+        def run(name, messages):
+            with app.app_context():
+                text = self._call_api(messages, temperature=self.insight_temperature, scope=scope, kind=name)
+            return text, time.perf_counter() - started
+        
+        executor = _get_executor(app.config.get('AI_MAX_CONCURRENCY', 8))
+        futures = {name: executor.submit(run, name, messages) for name, messages in requests_by_name.items()}
+        wait(futures.values(), timeout=timeout)
+        
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                results[name] = {'text': None, 'status': 'timeout', 'seconds': round(time.perf_counter() - started, 3)}
+                continue
+            try:
+                text, seconds = future.result()
+            except CircuitOpenError as e:
+                results[name] = {'text': None, 'status': 'unavailable', 'retry_after': e.retry_after,
+                                 'seconds': round(time.perf_counter() - started, 3)}
+                continue
+            except Exception as e:
+                print(f'Unexpected error in concurrent AI call: {str(e)}')
+                text, seconds = None, time.perf_counter() - started
+            results[name] = {'text': text, 'status': 'ok' if text else 'failed', 'seconds': round(seconds, 3)}
+        return results
+    
+    def stream_concurrently(self, requests_by_name, scope=None, timeout=25):
+        """Streaming counterpart of :meth:`call_concurrently`.
+        
+        Yields ``(name, 'token', text)`` as pieces arrive from any of the
+        concurrent calls and ``(name, 'done', result)`` once a call finishes,
+        with ``result`` shaped like a :meth:`call_concurrently` entry. Calls
+        still running at the deadline are reported as ``timeout``.
+        """
+        app = current_app._get_current_object()
+        started = time.perf_counter()
+        events = queue.Queue()
+        
+        def run(name, messages):
+            pieces = []
+            try:
+                with app.app_context():
+                    for piece in self.stream_api(messages, temperature=self.insight_temperature, scope=scope, kind=name):
+                        pieces.append(piece)
+                        events.put((name, 'token', piece))
+                text = ''.join(pieces).strip()
+                result = {'text': text or None, 'status': 'ok' if text else 'failed'}
+            except CircuitOpenError as e:
+                result = {'text': None, 'status': 'unavailable', 'retry_after': e.retry_after}
+            except Exception as e:
+                print(f'Unexpected error in concurrent AI call: {str(e)}')
+                result = {'text': None, 'status': 'failed'}
+            result['seconds'] = round(time.perf_counter() - started, 3)
+            events.put((name, 'done', result))
+        
+        executor = _get_executor(app.config.get('AI_MAX_CONCURRENCY', 8))
+        for name, messages in requests_by_name.items():
+            executor.submit(run, name, messages)
+        
+        remaining = set(requests_by_name)
+        deadline = started + timeout
+        while remaining:
+            try:
+                name, event, payload = events.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if event == 'done':
+                remaining.discard(name)
+            yield name, event, payload
+        for name in remaining:
+            yield name, 'done', {'text': None, 'status': 'timeout', 'seconds': round(time.perf_counter() - started, 3)}
+
+# Shared pool for concurrent upstream calls (per worker process)
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='openrouter')
+        return _executor
 
 
 # Global instance
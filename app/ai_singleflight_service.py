@@ -0,0 +1,274 @@
+"""Single-flight coalescing of identical concurrent AI calls.
+
+Calls are identified by their response cache key (a hash of model, prompt
+and temperature). Within a worker the first caller for a key is the
+*leader* and makes the upstream call; identical calls arriving while it is
+in flight wait on the same :class:`Flight` and share its result. Streaming
+followers receive the pieces as the leader yields them.
+
+Across workers the leader first takes a lease in ``ai_inflight``
+(``locked_by``/``lease_expires_at``). While another worker holds it, the
+leader polls the response cache every ``AI_SINGLEFLIGHT_POLL_SECONDS`` for
+that worker's answer. A lease released without an answer (the call failed)
+or expired after ``AI_SINGLEFLIGHT_LEASE_SECONDS`` is claimed and the call
+made here instead.
+
+Per-worker counters record the upstream calls made and those saved by
+sharing. Database problems never block a call: without the lease the
+worker simply calls the upstream itself.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import select, func, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app.models import db, AIInFlight
+
+logger = logging.getLogger(__name__)
+
+_DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+_counters = {'upstream_calls': 0, 'shared_in_worker': 0, 'shared_across_workers': 0}
+_counters_lock = threading.Lock()
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+class Flight:
+    """An upstream call in progress in this worker, shared with identical calls."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.pieces = []
+        self.finished = False
+        self.result = None
+        self.error = None
+
+    def publish(self, piece):
+        with self._condition:
+            self.pieces.append(piece)
+            self._condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._condition:
+            self.result, self.error, self.finished = result, error, True
+            self._condition.notify_all()
+
+    def wait(self):
+        """Block until the leader finishes; return its result or raise its error."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.finished)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def follow(self):
+        """Yield the leader's pieces as they are published, then raise its error if it failed."""
+        seen = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.finished or len(self.pieces) > seen)
+                pieces, finished = self.pieces[seen:], self.finished
+            seen += len(pieces)
+            yield from pieces
+            if finished:
+                break
+        if self.error is not None:
+            raise self.error
+        if not seen and self.result:
+            # The leader was a non-streaming call
+            yield self.result
+
+
+def _join(key):
+    """Return ``(flight, leader)``: the flight in progress for ``key``, or a new one we lead."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = Flight()
+        return flight, True
+
+
+def _land(key, flight, result=None, error=None):
+    with _flights_lock:
+        _flights.pop(key, None)
+    flight.finish(result, error)
+
+
+# ==================== CROSS-WORKER LEASE ====================
+def _claim(key, worker):
+    """Take the lease for ``key`` if it is free or expired; True when we hold it (or cannot tell)."""
+    if not has_app_context():
+        return True
+    table = AIInFlight.__table__
+    now = datetime.utcnow()
+    values = {'key': key, 'locked_by': worker, 'started_at': now,
+              'lease_expires_at': now + timedelta(seconds=current_app.config.get('AI_SINGLEFLIGHT_LEASE_SECONDS', 45))}
+    try:
+        with db.engine.begin() as connection:
+            insert = _DIALECT_INSERTS.get(connection.dialect.name)
+            if insert is None:
+                connection.execute(table.delete().where(table.c.key == key, table.c.lease_expires_at < now))
+                connection.execute(table.insert().values(values))
+                return True
+            statement = insert(table).values(values)
+            return connection.execute(statement.on_conflict_do_update(
+                index_elements=['key'],
+                set_={name: statement.excluded[name] for name in values if name != 'key'},
+                where=table.c.lease_expires_at < now
+            )).rowcount == 1
+    except IntegrityError:
+        return False
+    except SQLAlchemyError as e:
+        logger.warning('AI single-flight lease unavailable, calling upstream: %s', e)
+        return True
+
+
+def _release(key, worker):
+    """Drop our lease on ``key`` along with any leases that expired without being released."""
+    if not has_app_context():
+        return
+    table = AIInFlight.__table__
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(table.delete().where(or_(
+                and_(table.c.key == key, table.c.locked_by == worker),
+                table.c.lease_expires_at < datetime.utcnow()
+            )))
+    except SQLAlchemyError as e:
+        logger.warning('AI single-flight lease release failed: %s', e)
+
+
+def _wait_for_other_workers(key, worker, lookup):
+    """Claim the lease for ``key``, polling ``lookup`` while another worker holds it.
+
+    Returns that worker's answer if it appears, else ``None`` once the lease is ours.
+    """
+    waited = False
+    while not _claim(key, worker):
+        waited = True
+        time.sleep(current_app.config.get('AI_SINGLEFLIGHT_POLL_SECONDS', 0.2))
+        answer = lookup()
+        if answer is not None:
+            return answer
+    if waited:
+        # The other worker may have stored its answer just before releasing the lease
+        answer = lookup()
+        if answer is not None:
+            _release(key, worker)
+            return answer
+    return None
+
+
+# ==================== COALESCED CALLS ====================
+def call(key, compute, lookup):
+    """Return ``compute()``, making one call for all identical concurrent requests.
+
+    ``lookup()`` reads an answer stored by another worker (the response
+    cache), so ``compute`` must store its answer before returning.
+    Exceptions from ``compute`` reach every waiting caller.
+    """
+    flight, leader = _join(key)
+    if not leader:
+        _count('shared_in_worker')
+        return flight.wait()
+
+    try:
+        worker = _worker_id()
+        result = _wait_for_other_workers(key, worker, lookup)
+        if result is not None:
+            _count('shared_across_workers')
+        else:
+            _count('upstream_calls')
+            try:
+                result = compute()
+            finally:
+                _release(key, worker)
+    except BaseException as e:
+        _land(key, flight, error=e)
+        raise
+    _land(key, flight, result=result)
+    return result
+
+
+def stream(key, compute, lookup):
+    """Streaming form of :func:`call`: ``compute()`` returns a generator of pieces.
+
+    Followers in this worker receive the pieces as the leader yields them;
+    a shared answer from another worker arrives as a single piece. If the
+    leader's client goes away mid-stream, followers end with what was sent.
+    """
+    flight, leader = _join(key)
+    if not leader:
+        _count('shared_in_worker')
+        yield from flight.follow()
+        return
+
+    sent, error, completed = [], None, False
+    try:
+        worker = _worker_id()
+        answer = _wait_for_other_workers(key, worker, lookup)
+        if answer is not None:
+            _count('shared_across_workers')
+            sent.append(answer)
+            flight.publish(answer)
+            yield answer
+        else:
+            _count('upstream_calls')
+            pieces = compute()
+            try:
+                for piece in pieces:
+                    sent.append(piece)
+                    flight.publish(piece)
+                    yield piece
+            finally:
+                pieces.close()
+                _release(key, worker)
+        completed = True
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _land(key, flight, result=(''.join(sent).strip() or None) if completed else None, error=error)
+
+
+def get_singleflight_stats():
+    """This worker's coalescing counters plus the calls currently in flight."""
+    with _counters_lock:
+        worker = dict(_counters)
+    with _flights_lock:
+        in_flight = len(_flights)
+    leases = db.session.execute(
+        select(func.count()).select_from(AIInFlight.__table__)
+        .where(AIInFlight.__table__.c.lease_expires_at >= datetime.utcnow())
+    ).scalar()
+    requests_served = sum(worker.values())
+    saved = worker['shared_in_worker'] + worker['shared_across_workers']
+    return {
+        'in_flight': in_flight,
+        'leases': leases,
+        'worker': {
+            **worker,
+            'saved_calls': saved,
+            'saved_rate': round(100.0 * saved / requests_served, 1) if requests_served else None
+        }
+    }
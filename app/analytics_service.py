@@ -0,0 +1,162 @@
+"""Attendance rollup used by the analytics endpoints.
+
+``attendance_daily_rollup`` holds one row per (date, department, status)
+with the number of attendance records, where department is the employee's
+current department. It is kept in step with Attendance writes (and with
+employees changing department) by mapper events, so analytics over any
+date window read a few hundred rollup rows instead of scanning attendance.
+
+Run ``flask rebuild-rollup`` after bulk SQL edits that bypass the ORM.
+"""
+from sqlalchemy import event, func, select
+from app.models import db, Employee, Attendance, AttendanceDailyRollup
+from app.stats_service import _previous, _add_counts, _set_counts
+
+DEFAULT_STATUS = 'Present'
+
+
+def _bump(connection, day, department, status, delta):
+    """Adjust one rollup cell, removing it once it drops to zero."""
+    table = AttendanceDailyRollup.__table__
+    key = (table.c.date == day) & (table.c.department == department) & (table.c.status == status)
+    if delta > 0:
+        _add_counts(connection, table, {'date': day, 'department': department, 'status': status}, {'count': delta})
+        return
+    connection.execute(table.update().where(key).values(count=table.c.count + delta))
+    connection.execute(table.delete().where(key, table.c.count <= 0))
+
+
+def _department_of(connection, employee_id):
+    emp = Employee.__table__
+    return connection.execute(select(emp.c.department).where(emp.c.id == employee_id)).scalar()
+
+
+# ==================== ORM EVENT LISTENERS ====================
+@event.listens_for(Attendance, 'after_insert')
+def _attendance_inserted(mapper, connection, target):
+    department = _department_of(connection, target.employee_id)
+    _bump(connection, target.date, department, target.status or DEFAULT_STATUS, 1)
+
+
+@event.listens_for(Attendance, 'after_update')
+def _attendance_updated(mapper, connection, target):
+    old_key = (
+        _previous(target, 'date'),
+        _department_of(connection, _previous(target, 'employee_id')),
+        _previous(target, 'status') or DEFAULT_STATUS
+    )
+    new_key = (
+        target.date,
+        _department_of(connection, target.employee_id),
+        target.status or DEFAULT_STATUS
+    )
+    if old_key != new_key:
+        _bump(connection, *old_key, -1)
+        _bump(connection, *new_key, 1)
+
+
+@event.listens_for(Attendance, 'after_delete')
+def _attendance_deleted(mapper, connection, target):
+    # Cascaded attendance deletes are flushed before their employee row,
+    # so the department lookup still succeeds.
+    department = _department_of(connection, _previous(target, 'employee_id'))
+    _bump(connection, _previous(target, 'date'), department, _previous(target, 'status') or DEFAULT_STATUS, -1)
+
+
+@event.listens_for(Employee, 'after_update')
+def _employee_moved(mapper, connection, target):
+    old_department = _previous(target, 'department')
+    if old_department == target.department:
+        return
+
+    att = Attendance.__table__
+    rows = connection.execute(
+        select(att.c.date, att.c.status, func.count(att.c.id))
+        .where(att.c.employee_id == target.id)
+        .group_by(att.c.date, att.c.status)
+    ).all()
+    for day, status, count in rows:
+        _bump(connection, day, old_department, status or DEFAULT_STATUS, -count)
+        _bump(connection, day, target.department, status or DEFAULT_STATUS, count)
+
+
+# ==================== REBUILD ====================
+def _source(day=None):
+    """``(date, department, status, count)`` rows recomputed from attendance."""
+    emp = Employee.__table__
+    att = Attendance.__table__
+    status = func.coalesce(att.c.status, DEFAULT_STATUS)
+    source = (
+        select(att.c.date, emp.c.department, status, func.count(att.c.id))
+        .join(emp, emp.c.id == att.c.employee_id)
+        .group_by(att.c.date, emp.c.department, status)
+    )
+    return source if day is None else source.where(att.c.date == day)
+
+
+def rebuild_rollup():
+    """Recompute the rollup from attendance; the caller commits."""
+    connection = db.session.connection()
+    table = AttendanceDailyRollup.__table__
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(['date', 'department', 'status', 'count'], _source()))
+    return connection.execute(select(func.count()).select_from(table)).scalar()
+
+
+def refresh_rollup_day(connection, day):
+    """Recompute the rollup cells of a single date (after bulk attendance writes).
+
+    Call after :func:`app.stats_service.refresh_attendance_day`, whose lock
+    on the day serialises refreshes. Cells are upserted with their new
+    counts; only cells that no longer have records are deleted.
+    """
+    table = AttendanceDailyRollup.__table__
+    cells = {(department, status): count for _, department, status, count in connection.execute(_source(day))}
+    _set_counts(connection, table, ['date', 'department', 'status'], [
+        {'date': day, 'department': department, 'status': status, 'count': count}
+        for (department, status), count in cells.items()
+    ])
+    stale = [key for key in connection.execute(
+        select(table.c.department, table.c.status).where(table.c.date == day)
+    ) if tuple(key) not in cells]
+    for department, status in stale:
+        connection.execute(table.delete().where(
+            table.c.date == day, table.c.department == department, table.c.status == status
+        ))
+
+
+def ensure_rollup():
+    """Build the rollup on first start when attendance already has rows."""
+    has_rollup = db.session.query(AttendanceDailyRollup.date).first() is not None
+    if not has_rollup and db.session.query(Attendance.id).first() is not None:
+        rebuild_rollup()
+        db.session.commit()
+
+
+# ==================== QUERIES ====================
+def _window(query, start=None, end=None):
+    if start:
+        query = query.filter(AttendanceDailyRollup.date >= start)
+    if end:
+        query = query.filter(AttendanceDailyRollup.date <= end)
+    return query
+
+
+def attendance_by_department(start=None, end=None, status='Present'):
+    """Return ``{department: count}`` for records with ``status`` in the window."""
+    query = db.session.query(
+        AttendanceDailyRollup.department,
+        func.sum(AttendanceDailyRollup.count)
+    ).filter(AttendanceDailyRollup.status == status)
+    query = _window(query, start, end).group_by(AttendanceDailyRollup.department)
+    return {department: int(count or 0) for department, count in query.all()}
+
+
+def department_status_counts(department, start=None, end=None):
+    """Return ``{status: count}`` for one department in the window."""
+    query = db.session.query(
+        AttendanceDailyRollup.status,
+        func.sum(AttendanceDailyRollup.count)
+    ).filter(AttendanceDailyRollup.department == department)
+    query = _window(query, start, end).group_by(AttendanceDailyRollup.status)
+    return {status: int(count or 0) for status, count in query.all()}
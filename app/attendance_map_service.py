@@ -0,0 +1,291 @@
+"""Compact per-employee attendance maps.
+
+``attendance_month_maps`` stores one row per (employee, month) holding a
+31-byte array: byte ``d - 1`` is the status code of day ``d`` (0 when there
+is no record). A year of one employee's attendance is twelve small rows,
+and a department's month is one ``frombuffer``/``reshape`` away from a
+NumPy matrix, so range counts, streaks and calendar heatmaps are computed
+with array operations instead of scanning ``attendance``.
+
+The maps follow Attendance writes through mapper events (and explicit
+calls from bulk paths via :func:`apply_changes`). Run
+``flask rebuild-attendance-maps`` after SQL edits that bypass both.
+"""
+import calendar
+import numpy as np
+from sqlalchemy import event, select, bindparam, func
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import db, Employee, Attendance, AttendanceMonthMap
+from app.stats_service import _previous
+
+STATUS_CODES = {'Present': 1, 'Absent': 2, 'Late': 3, 'Sick Leave': 4, 'Casual Leave': 5}
+OTHER_CODE = 6
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+STATUS_NAMES[OTHER_CODE] = 'Other'
+ATTENDED_CODES = (STATUS_CODES['Present'], STATUS_CODES['Late'])
+EMPTY_MONTH = bytes(31)
+IN_CHUNK_SIZE = 1000
+REBUILD_BATCH_SIZE = 1000
+
+_DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def status_code(status):
+    """Byte code for an attendance status (a missing status counts as Present)."""
+    return STATUS_CODES.get(status or 'Present', OTHER_CODE)
+
+
+def _month_key(day):
+    return day.strftime('%Y-%m')
+
+
+# ==================== MAINTENANCE ====================
+def apply_changes(connection, changes):
+    """Write day codes into the maps.
+
+    ``changes`` is an iterable of ``(employee_id, date, code)``; code 0
+    clears the day. Maps that will receive a code are first created empty
+    with ``INSERT ... ON CONFLICT DO NOTHING``, then every touched map is
+    read ``FOR UPDATE`` (one query per month), edited and written back with
+    one executemany. Concurrent writers to the same employee-month thus
+    queue on the row lock instead of overwriting each other's days.
+    """
+    table = AttendanceMonthMap.__table__
+    pending = {}
+    for employee_id, day, code in changes:
+        pending.setdefault((employee_id, _month_key(day)), []).append((day.day - 1, code))
+    if not pending:
+        return
+
+    insert = _DIALECT_INSERTS.get(connection.dialect.name)
+    if insert is not None:
+        missing = [{'employee_id': employee_id, 'month': month, 'days': EMPTY_MONTH}
+                   for (employee_id, month), day_codes in pending.items() if any(code for _, code in day_codes)]
+        if missing:
+            connection.execute(insert(table).on_conflict_do_nothing(index_elements=['employee_id', 'month']), missing)
+
+    existing = {}
+    for month in {month for _, month in pending}:
+        employee_ids = [employee_id for employee_id, key_month in pending if key_month == month]
+        for start in range(0, len(employee_ids), IN_CHUNK_SIZE):
+            rows = connection.execute(
+                select(table.c.employee_id, table.c.days)
+                .where(table.c.month == month, table.c.employee_id.in_(employee_ids[start:start + IN_CHUNK_SIZE]))
+                .with_for_update()
+            )
+            for employee_id, days in rows:
+                existing[(employee_id, month)] = days
+
+    updates, inserts = [], []
+    for (employee_id, month), day_codes in pending.items():
+        days = bytearray(existing.get((employee_id, month), EMPTY_MONTH))
+        for index, code in day_codes:
+            days[index] = code
+        if (employee_id, month) in existing:
+            updates.append({'b_employee_id': employee_id, 'b_month': month, 'b_days': bytes(days)})
+        elif any(days):
+            # Only on dialects without an upsert
+            inserts.append({'employee_id': employee_id, 'month': month, 'days': bytes(days)})
+
+    if updates:
+        connection.execute(
+            table.update()
+            .where(table.c.employee_id == bindparam('b_employee_id'), table.c.month == bindparam('b_month'))
+            .values(days=bindparam('b_days')),
+            updates
+        )
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+
+@event.listens_for(Attendance, 'after_insert')
+def _attendance_inserted(mapper, connection, target):
+    apply_changes(connection, [(target.employee_id, target.date, status_code(target.status))])
+
+
+@event.listens_for(Attendance, 'after_update')
+def _attendance_updated(mapper, connection, target):
+    old = (_previous(target, 'employee_id'), _previous(target, 'date'))
+    new = (target.employee_id, target.date)
+    changes = [(*new, status_code(target.status))]
+    if old != new:
+        changes.insert(0, (*old, 0))
+    elif status_code(_previous(target, 'status')) == changes[0][2]:
+        return
+    apply_changes(connection, changes)
+
+
+@event.listens_for(Attendance, 'after_delete')
+def _attendance_deleted(mapper, connection, target):
+    apply_changes(connection, [(_previous(target, 'employee_id'), _previous(target, 'date'), 0)])
+
+
+@event.listens_for(Employee, 'after_delete')
+def _employee_deleted(mapper, connection, target):
+    table = AttendanceMonthMap.__table__
+    connection.execute(table.delete().where(table.c.employee_id == target.id))
+
+
+def rebuild_attendance_maps():
+    """Recompute every map from attendance; the caller commits."""
+    connection = db.session.connection()
+    table = AttendanceMonthMap.__table__
+    att = Attendance.__table__
+    connection.execute(table.delete())
+
+    batch, current_key, days, written = [], None, None, 0
+    rows = connection.execution_options(yield_per=REBUILD_BATCH_SIZE).execute(
+        select(att.c.employee_id, att.c.date, att.c.status).order_by(att.c.employee_id, att.c.date)
+    )
+    for employee_id, day, status in rows:
+        key = (employee_id, _month_key(day))
+        if key != current_key:
+            if current_key is not None:
+                batch.append({'employee_id': current_key[0], 'month': current_key[1], 'days': bytes(days)})
+            current_key, days = key, bytearray(EMPTY_MONTH)
+        days[day.day - 1] = status_code(status)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            connection.execute(table.insert(), batch)
+            written += len(batch)
+            batch = []
+    if current_key is not None:
+        batch.append({'employee_id': current_key[0], 'month': current_key[1], 'days': bytes(days)})
+    if batch:
+        connection.execute(table.insert(), batch)
+        written += len(batch)
+    return written
+
+
+def ensure_attendance_maps():
+    """Build the maps on first start when attendance already has rows."""
+    has_maps = db.session.query(AttendanceMonthMap.employee_id).first() is not None
+    if not has_maps and db.session.query(Attendance.id).first() is not None:
+        rebuild_attendance_maps()
+        db.session.commit()
+
+
+# ==================== QUERIES ====================
+def _months(start, end):
+    """``[(month_key, days_in_month), ...]`` covering ``start..end``."""
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((f'{year:04d}-{month:02d}', calendar.monthrange(year, month)[1]))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _grid(rows, start, end, row_index):
+    """Matrix of day codes (one row per key of ``row_index``, one column per day)."""
+    months = _months(start, end)
+    offsets, offset = {}, 0
+    for month, length in months:
+        offsets[month] = (offset, length)
+        offset += length
+
+    grid = np.zeros((len(row_index), offset), dtype=np.uint8)
+    for key, month, days in rows:
+        position, length = offsets[month]
+        grid[row_index[key], position:position + length] = np.frombuffer(days, dtype=np.uint8)[:length]
+    first_column = start.day - 1
+    return grid[:, first_column:first_column + (end - start).days + 1]
+
+
+def _status_counts(codes):
+    counts = np.bincount(codes.ravel(), minlength=OTHER_CODE + 1)
+    return {STATUS_NAMES[code]: int(counts[code]) for code in range(1, OTHER_CODE + 1) if counts[code]}
+
+
+def _streaks(codes):
+    """Current and longest runs of attended days, ignoring days without a record."""
+    recorded = codes[codes != 0]
+    attended = np.isin(recorded, ATTENDED_CODES).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], attended, [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    return {
+        'current': int(lengths[-1]) if len(lengths) and ends[-1] == len(attended) else 0,
+        'longest': int(lengths.max()) if len(lengths) else 0
+    }
+
+
+def _month_rows(query_filter, start, end, key_column):
+    table = AttendanceMonthMap.__table__
+    months = [month for month, _ in _months(start, end)]
+    return db.session.execute(
+        select(key_column, table.c.month, table.c.days).where(table.c.month.in_(months), query_filter)
+    ).all()
+
+
+def employee_days(employee_id, start, end):
+    """Array of day codes for one employee, one entry per day from ``start`` to ``end``."""
+    table = AttendanceMonthMap.__table__
+    rows = _month_rows(table.c.employee_id == employee_id, start, end, table.c.employee_id)
+    return _grid(rows, start, end, {employee_id: 0})[0]
+
+
+def employee_status_counts(employee_id, start, end):
+    """``{status: days}`` for one employee over ``start..end``."""
+    return _status_counts(employee_days(employee_id, start, end))
+
+
+def employees_status_counts(employee_ids, start, end):
+    """``{employee_id: {status: days}}`` for many employees over ``start..end``."""
+    table = AttendanceMonthMap.__table__
+    employee_ids = list(employee_ids)
+    row_index = {employee_id: index for index, employee_id in enumerate(employee_ids)}
+    rows = []
+    for offset in range(0, len(employee_ids), IN_CHUNK_SIZE):
+        chunk = employee_ids[offset:offset + IN_CHUNK_SIZE]
+        rows.extend(_month_rows(table.c.employee_id.in_(chunk), start, end, table.c.employee_id))
+    codes = _grid(rows, start, end, row_index)
+    return {employee_id: _status_counts(codes[index]) for employee_id, index in row_index.items()}
+
+
+def employee_heatmap(employee_id, start, end):
+    """Calendar heatmap payload for one employee."""
+    codes = employee_days(employee_id, start, end)
+    recorded = int(np.count_nonzero(codes))
+    attended = int(np.isin(codes, ATTENDED_CODES).sum())
+    return {
+        'employee_id': employee_id,
+        'from': start.strftime('%Y-%m-%d'),
+        'to': end.strftime('%Y-%m-%d'),
+        'codes': {str(code): status for code, status in STATUS_NAMES.items()},
+        'days': codes.tolist(),
+        'counts': _status_counts(codes),
+        'recorded_days': recorded,
+        'attendance_rate': round(100.0 * attended / recorded, 1) if recorded else None,
+        'streaks': _streaks(codes)
+    }
+
+
+def department_heatmap(department, start, end):
+    """Calendar heatmap payload for a department (employees' current department)."""
+    table = AttendanceMonthMap.__table__
+    members = select(Employee.id).where(Employee.department == department)
+    rows = _month_rows(table.c.employee_id.in_(members), start, end, table.c.employee_id)
+    employee_count = db.session.query(func.count(Employee.id)).filter(Employee.department == department).scalar()
+
+    row_index = {employee_id: index for index, employee_id in enumerate(sorted({row[0] for row in rows}))}
+    codes = _grid(rows, start, end, row_index)
+    present = (codes == STATUS_CODES['Present']).sum(axis=0)
+    attended = np.isin(codes, ATTENDED_CODES).sum(axis=0)
+    recorded = (codes != 0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(recorded > 0, np.round(100.0 * attended / np.maximum(recorded, 1), 1), np.nan)
+
+    return {
+        'department': department,
+        'employees': employee_count,
+        'from': start.strftime('%Y-%m-%d'),
+        'to': end.strftime('%Y-%m-%d'),
+        'present': present.tolist(),
+        'attended': attended.tolist(),
+        'recorded': recorded.tolist(),
+        'rates': [None if np.isnan(rate) else float(rate) for rate in rates],
+        'counts': _status_counts(codes)
+    }
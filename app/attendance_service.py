@@ -0,0 +1,71 @@
+"""Set-based bulk attendance marking.
+
+A day's attendance for many employees is written with one
+``INSERT ... ON CONFLICT (employee_id, date) DO UPDATE`` per chunk against
+the ``_employee_date_uc`` constraint (PostgreSQL and SQLite both support it)
+instead of a SELECT plus INSERT/UPDATE per employee.
+
+Core upserts bypass the mapper events that maintain the dashboard counters
+and the analytics rollup, so both are recomputed for the affected date, the
+attendance maps are patched for the marked employees, their cached AI
+responses are invalidated and the ``attendance`` data version is bumped
+explicitly.
+"""
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import db, Attendance
+from app.stats_service import refresh_attendance_day
+from app.analytics_service import refresh_rollup_day
+from app.attendance_map_service import apply_changes, status_code
+from app.ai_cache_service import invalidate as invalidate_ai_cache
+from app.versioning import mark_changed
+
+STATUSES = ('Present', 'Absent', 'Late', 'Sick Leave', 'Casual Leave')
+CHUNK_SIZE = 500
+
+_DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _upsert(connection, rows):
+    insert = _DIALECT_INSERTS.get(connection.dialect.name)
+    if insert is None:
+        raise RuntimeError(f'Bulk attendance upsert is not supported on {connection.dialect.name}')
+    statement = insert(Attendance.__table__).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['employee_id', 'date'],
+        set_={'status': statement.excluded.status, 'notes': statement.excluded.notes}
+    )
+    connection.execute(statement)
+
+
+def bulk_upsert_attendance(day, entries, chunk_size=CHUNK_SIZE):
+    """Insert or update attendance for ``day``.
+
+    ``entries`` is an iterable of ``(employee_id, status, notes)``; later
+    entries for the same employee win. Runs in the caller's transaction
+    (commit afterwards) and returns the number of employees marked.
+    """
+    marked = {}
+    for employee_id, status, notes in entries:
+        marked[employee_id] = (status, notes)
+    if not marked:
+        return 0
+
+    connection = db.session.connection()
+    created_at = datetime.utcnow()
+    rows = [
+        {'employee_id': employee_id, 'date': day, 'status': status, 'notes': notes, 'created_at': created_at}
+        for employee_id, (status, notes) in marked.items()
+    ]
+    for start in range(0, len(rows), chunk_size):
+        _upsert(connection, rows[start:start + chunk_size])
+
+    refresh_attendance_day(connection, day)
+    refresh_rollup_day(connection, day)
+    apply_changes(connection, [(employee_id, day, status_code(status)) for employee_id, (status, _) in marked.items()])
+    invalidate_ai_cache(connection, marked)
+    mark_changed(db.session, 'attendance')
+    return len(rows)
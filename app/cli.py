@@ -0,0 +1,135 @@
+"""Flask CLI commands for maintenance tasks (run with ``flask --app wsgi <command>``)."""
+import click
+from app.models import db
+
+
+def register_commands(app):
+    """Attach maintenance commands to the application's CLI."""
+
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        """Rebuild the dashboard counter tables from scratch."""
+        from app.stats_service import rebuild_stats
+        counts = rebuild_stats()
+        db.session.commit()
+        click.echo(
+            f"Dashboard stats rebuilt: {counts['total_employees']} employees, "
+            f"{counts['active_employees']} active, {counts['departments']} departments"
+        )
+
+    @app.cli.command('rebuild-rollup')
+    def rebuild_rollup_command():
+        """Rebuild the attendance_daily_rollup table from attendance."""
+        from app.analytics_service import rebuild_rollup
+        cells = rebuild_rollup()
+        db.session.commit()
+        click.echo(f'Attendance rollup rebuilt: {cells} (date, department, status) rows')
+
+    @app.cli.command('rebuild-attendance-maps')
+    def rebuild_attendance_maps_command():
+        """Rebuild the per-employee monthly attendance maps from attendance."""
+        from app.attendance_map_service import rebuild_attendance_maps
+        maps = rebuild_attendance_maps()
+        db.session.commit()
+        click.echo(f'Attendance maps rebuilt: {maps} (employee, month) rows')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Re-populate the employee search index."""
+        from app.search_service import rebuild_search_index
+        backend = rebuild_search_index()
+        db.session.commit()
+        if backend:
+            click.echo(f'Employee search index rebuilt ({backend})')
+        else:
+            click.echo('No search index available; searches use an ILIKE scan')
+
+    @app.cli.command('import-employees')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows per staging batch.')
+    def import_employees_command(path, batch_size):
+        """Bulk-import employees from a CSV file."""
+        from app.import_service import import_employees
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            report = import_employees(f, batch_size=batch_size)
+        db.session.commit()
+        for error in report.errors:
+            click.echo(f"Row {error['row']}: {error['error']}" + (f" ({error['email']})" if error['email'] else ''))
+        if report.error_count > len(report.errors):
+            click.echo(f'... {report.error_count - len(report.errors)} more errors not shown')
+        click.echo(
+            f'Imported {report.imported} of {report.rows} rows, {report.error_count} skipped '
+            f'in {report.seconds:.2f}s ({report.rows_per_second or 0} rows/s)'
+        )
+
+    @app.cli.command('load-payroll-rules')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    def load_payroll_rules_command(path):
+        """Load payroll rule sets from a JSON file ({"*": {...}, "<department>": {...}})."""
+        import json
+        from app.payroll_service import save_rule_set
+        with open(path, encoding='utf-8') as f:
+            rule_sets = json.load(f)
+        if not isinstance(rule_sets, dict):
+            raise click.ClickException('Expected a JSON object mapping department (or "*") to rules')
+        for department, rules in rule_sets.items():
+            try:
+                save_rule_set(department, rules)
+            except ValueError as e:
+                db.session.rollback()
+                raise click.ClickException(f'{department}: {e}')
+        db.session.commit()
+        click.echo(f'Loaded {len(rule_sets)} payroll rule set(s)')
+
+    @app.cli.command('payroll-run')
+    @click.argument('month')
+    @click.option('--chunk-size', type=int, default=None, help='Employees per checkpoint (default PAYROLL_CHUNK_SIZE).')
+    def payroll_run_command(month, chunk_size):
+        """Generate MONTH's (YYYY-MM) payroll, resuming its run if one exists."""
+        from app.payroll_run_service import create_run, process_run, PayrollRunExists
+        try:
+            run = create_run(month)
+            click.echo(f'Created payroll run {run.id} for {month}: {run.total} employees')
+        except PayrollRunExists as e:
+            run = e.run
+            if run.status == 'Completed':
+                click.echo(f'Payroll for {month} is already complete ({run.processed} records)')
+                return
+            click.echo(f'Resuming payroll run {run.id} for {month} at {run.processed}/{run.total}')
+
+        def report(progress):
+            data = progress.to_dict()
+            click.echo(f"  {data['processed']}/{data['total']} ({data['percent']}%), "
+                       f"{data['rate'] or 0} records/s, ETA {data['eta_seconds'] or 0}s")
+
+        finished = process_run(run.id, chunk_size=chunk_size, on_chunk=report)
+        if finished is None:
+            raise click.ClickException(f'Payroll run {run.id} is being processed by another worker')
+        click.echo(f'Payroll run {finished.id} completed: {finished.processed} records')
+
+    @app.cli.command('ai-precompute')
+    @click.option('--concurrency', type=int, default=None, help='Upstream calls in flight (default AI_PRECOMPUTE_CONCURRENCY).')
+    @click.option('--rate', type=float, default=None, help='Calls per second (default AI_PRECOMPUTE_RATE).')
+    @click.option('--burst', type=int, default=None, help='Token bucket capacity (default AI_PRECOMPUTE_BURST).')
+    @click.option('--batch-size', type=int, default=None,
+                  help='Insights per upstream request (default AI_BATCH_MAX_ITEMS, 1 disables batching).')
+    @click.option('--force', is_flag=True, help='Regenerate insights that are still fresh.')
+    def ai_precompute_command(concurrency, rate, burst, batch_size, force):
+        """Generate missing or stale AI insights for all active employees and departments."""
+        from app.ai_service import get_ai_client
+        from app.ai_insight_service import precompute_insights
+        ai = get_ai_client()
+        if ai is None:
+            raise click.ClickException('AI service not available - check OPENROUTER_API_KEY')
+
+        def report(progress):
+            click.echo(f'  {progress.generated + progress.failed + progress.unavailable} attempted, '
+                       f'{progress.generated} generated, {progress.requests} upstream requests')
+
+        result = precompute_insights(ai, concurrency=concurrency, rate=rate, burst=burst, force=force,
+                                     batch_size=batch_size, on_progress=report)
+        click.echo(
+            f'AI insights: {result.generated} generated, {result.fresh} already fresh, '
+            f'{result.failed} failed, {result.unavailable} unavailable '
+            f'of {result.considered} in {result.seconds:.1f}s ({result.requests} upstream requests)'
+        )
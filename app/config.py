@@ -30,6 +30,48 @@ class Config:
     # Security Headers
     PREFERRED_URL_SCHEME = 'https'
     
+    # Live dashboard stream (Server-Sent Events)
+    STATS_STREAM_INTERVAL = float(os.environ.get('STATS_STREAM_INTERVAL', 2))  # seconds between change checks
+    STATS_STREAM_HEARTBEAT = float(os.environ.get('STATS_STREAM_HEARTBEAT', 15))  # keep-alive comment interval
+    STATS_STREAM_MAX_SECONDS = float(os.environ.get('STATS_STREAM_MAX_SECONDS', 300))  # client reconnects after this
+    STATS_STREAM_MAX_CLIENTS = int(os.environ.get('STATS_STREAM_MAX_CLIENTS', 4))  # open streams per worker; more get 503
+    
+    # Payroll runs (chunked, resumable salary generation)
+    PAYROLL_CHUNK_SIZE = int(os.environ.get('PAYROLL_CHUNK_SIZE', 500))  # employees per checkpointed transaction
+    PAYROLL_LEASE_SECONDS = int(os.environ.get('PAYROLL_LEASE_SECONDS', 60))  # run counts as stalled after this
+    
+    # AI response cache (shared by all workers through the database)
+    AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', 24 * 3600))  # seconds a cached completion stays valid
+    AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 5000))  # least recently used beyond this are evicted
+    
+    # Concurrent AI calls (combined employee insights)
+    AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', 8))  # upstream calls in flight per worker
+    AI_INSIGHTS_TIMEOUT = float(os.environ.get('AI_INSIGHTS_TIMEOUT', 25))  # seconds before partial results are returned
+    
+    # AI circuit breaker (state shared by all workers through the database)
+    AI_BREAKER_WINDOW_SECONDS = int(os.environ.get('AI_BREAKER_WINDOW_SECONDS', 60))  # rolling window of call outcomes
+    AI_BREAKER_MIN_CALLS = int(os.environ.get('AI_BREAKER_MIN_CALLS', 5))  # calls in the window before it can trip
+    AI_BREAKER_FAILURE_RATE = float(os.environ.get('AI_BREAKER_FAILURE_RATE', 0.5))  # failed or slow share that opens it
+    AI_BREAKER_SLOW_SECONDS = float(os.environ.get('AI_BREAKER_SLOW_SECONDS', 10))  # successful calls slower than this count as bad
+    AI_BREAKER_COOLDOWN_SECONDS = int(os.environ.get('AI_BREAKER_COOLDOWN_SECONDS', 30))  # open time before a trial call
+    AI_BREAKER_PROBE_SECONDS = int(os.environ.get('AI_BREAKER_PROBE_SECONDS', 40))  # trial call deadline while half-open
+    
+    # Stored AI insights and the `flask ai-precompute` job
+    AI_INSIGHT_MAX_AGE_HOURS = float(os.environ.get('AI_INSIGHT_MAX_AGE_HOURS', 7 * 24))  # regenerate older insights
+    AI_PRECOMPUTE_CONCURRENCY = int(os.environ.get('AI_PRECOMPUTE_CONCURRENCY', 4))  # upstream calls in flight
+    AI_PRECOMPUTE_RATE = float(os.environ.get('AI_PRECOMPUTE_RATE', 2))  # token bucket refill, calls per second
+    AI_PRECOMPUTE_BURST = int(os.environ.get('AI_PRECOMPUTE_BURST', 4))  # token bucket capacity
+    
+    # Batched AI prompts (several insights per upstream request)
+    AI_BATCH_MAX_ITEMS = int(os.environ.get('AI_BATCH_MAX_ITEMS', 10))  # insights per request at most; 1 disables batching
+    AI_BATCH_PROMPT_TOKENS = int(os.environ.get('AI_BATCH_PROMPT_TOKENS', 4000))  # estimated prompt budget per request
+    AI_BATCH_COMPLETION_TOKENS = int(os.environ.get('AI_BATCH_COMPLETION_TOKENS', 2000))  # answer budget per request
+    AI_BATCH_ATTEMPTS = int(os.environ.get('AI_BATCH_ATTEMPTS', 3))  # tries per insight before giving up
+    
+    # Single-flight coalescing of identical concurrent AI calls
+    AI_SINGLEFLIGHT_LEASE_SECONDS = int(os.environ.get('AI_SINGLEFLIGHT_LEASE_SECONDS', 45))  # other workers take over after this
+    AI_SINGLEFLIGHT_POLL_SECONDS = float(os.environ.get('AI_SINGLEFLIGHT_POLL_SECONDS', 0.2))  # how often waiting workers check
+    
     # JSON Configuration
     JSON_SORT_KEYS = False
     JSONIFY_PRETTYPRINT_REGULAR = False
@@ -59,6 +101,7 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # SQLite's in-memory StaticPool takes no pool sizing
     WTF_CSRF_ENABLED = False
 
 
@@ -0,0 +1,102 @@
+"""Per-employee attendance summary shared by the profile page and AI endpoints.
+
+All status counts for an employee's recent window come from the compact
+attendance maps (see :mod:`app.attendance_map_service`), a few small rows
+per employee rather than a scan of ``attendance``. The result is memoised per request (in ``flask.g``) and per worker
+until the ``attendance`` data version changes, so the profile page and the
+AI endpoints it calls reuse the same numbers instead of recounting.
+"""
+from collections import OrderedDict
+from datetime import date, timedelta
+from threading import Lock
+from flask import g, has_app_context
+from app.attendance_map_service import employee_status_counts, employees_status_counts
+from app.versioning import get_versions
+
+DEFAULT_WINDOW_DAYS = 30
+_CACHE_SIZE = 1024
+_cache = OrderedDict()
+_cache_lock = Lock()
+
+
+class EmployeeSummary:
+    """Attendance status counts for one employee over ``start..end``."""
+
+    def __init__(self, employee_id, start, end, status_counts):
+        self.employee_id = employee_id
+        self.start = start
+        self.end = end
+        self.status_counts = status_counts
+
+    @property
+    def total_days(self):
+        return sum(self.status_counts.values())
+
+    @property
+    def present_days(self):
+        return self.status_counts.get('Present', 0)
+
+    @property
+    def absent_days(self):
+        """Days marked exactly 'Absent'."""
+        return self.status_counts.get('Absent', 0)
+
+    @property
+    def missed_days(self):
+        """Recorded days that were not 'Present' (absent, late, leave)."""
+        return self.total_days - self.present_days
+
+    @property
+    def attendance_score(self):
+        return (self.present_days / self.total_days * 100) if self.total_days > 0 else 0
+
+    def to_dict(self):
+        return {
+            'employee_id': self.employee_id,
+            'from': self.start.strftime('%Y-%m-%d'),
+            'to': self.end.strftime('%Y-%m-%d'),
+            'status_counts': dict(self.status_counts),
+            'total_days': self.total_days,
+            'present_days': self.present_days,
+            'absent_days': self.absent_days,
+            'attendance_score': round(self.attendance_score, 1)
+        }
+
+
+def _load(employee_id, start, end):
+    return EmployeeSummary(employee_id, start, end, employee_status_counts(employee_id, start, end))
+
+
+def get_employee_summary(employee_id, days=DEFAULT_WINDOW_DAYS, today=None):
+    """Return the :class:`EmployeeSummary` for the last ``days`` days (inclusive of today)."""
+    end = today or date.today()
+    start = end - timedelta(days=days)
+    request_key = (employee_id, start, end)
+
+    memo = g.setdefault('employee_summaries', {}) if has_app_context() else {}
+    if request_key in memo:
+        return memo[request_key]
+
+    key = (request_key, get_versions('attendance')['attendance'])
+    with _cache_lock:
+        summary = _cache.get(key)
+        if summary is not None:
+            _cache.move_to_end(key)
+    if summary is None:
+        summary = _load(employee_id, start, end)
+        with _cache_lock:
+            _cache[key] = summary
+            if len(_cache) > _CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    memo[request_key] = summary
+    return summary
+
+
+def get_employee_summaries(employee_ids, days=DEFAULT_WINDOW_DAYS, today=None):
+    """Return ``{employee_id: EmployeeSummary}`` for many employees, reading their maps in chunks."""
+    end = today or date.today()
+    start = end - timedelta(days=days)
+    counts = employees_status_counts(employee_ids, start, end)
+    return {employee_id: EmployeeSummary(employee_id, start, end, status_counts)
+            for employee_id, status_counts in counts.items()}
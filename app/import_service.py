@@ -0,0 +1,249 @@
+"""Bulk employee import from CSV.
+
+The file is parsed as a stream and each row validated on its own. Valid
+rows go into a temporary staging table in batches: ``COPY ... FROM STDIN``
+on PostgreSQL, ``executemany`` elsewhere. Then everything is set-based:
+
+1. one query finds staged emails that already exist in ``employees``;
+2. one ``INSERT ... SELECT`` moves the remaining rows across;
+3. dashboard counters, data versions and cached AI department insights are
+   adjusted for the new rows, because the ORM events that normally maintain
+   them do not fire.
+
+The whole import runs in the caller's transaction; commit afterwards.
+"""
+import csv
+import time
+from datetime import datetime
+from io import StringIO
+from sqlalchemy import Table, Column, Integer, String, Float, DateTime, MetaData, select, func, case, exists, literal
+from app.models import db, Employee
+from app.stats_service import record_bulk_employee_insert
+from app.versioning import mark_changed
+from app.ai_cache_service import invalidate as invalidate_ai_cache
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+STATUSES = ('Active', 'Inactive', 'On Leave')
+
+# Accepted header spellings (case-insensitive), including the export's headers
+_COLUMNS = {
+    'name': 'name',
+    'email': 'email',
+    'phone': 'phone',
+    'department': 'department',
+    'position': 'position',
+    'salary': 'salary',
+    'joining date': 'joining_date',
+    'joining_date': 'joining_date',
+    'status': 'status',
+}
+_REQUIRED = ('name', 'email', 'department', 'position', 'salary')
+
+_staging_metadata = MetaData()
+_staging = Table(
+    'employee_import_staging', _staging_metadata,
+    Column('line_no', Integer, primary_key=True),
+    Column('name', String(120)),
+    Column('email', String(120)),
+    Column('phone', String(20)),
+    Column('department', String(80)),
+    Column('position', String(100)),
+    Column('salary', Float),
+    Column('joining_date', DateTime),
+    Column('status', String(20)),
+    prefixes=['TEMPORARY'],
+)
+_FIELDS = ['line_no', 'name', 'email', 'phone', 'department', 'position', 'salary', 'joining_date', 'status']
+
+
+class ImportReport:
+    """Outcome of one import: counts, per-row errors and throughput."""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.errors = []
+        self.error_count = 0
+        self.seconds = 0.0
+
+    def add_error(self, line_no, message, email=None):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line_no, 'email': email, 'error': message})
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds, 1) if self.seconds else None
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'failed': self.error_count,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors),
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': self.rows_per_second
+        }
+
+
+def _clean(raw, line_no):
+    """Validate one CSV row; return a staging dict or raise ``ValueError``."""
+    values = {field: (raw.get(field) or '').strip() for field in set(_COLUMNS.values())}
+
+    missing = [field for field in _REQUIRED if not values.get(field)]
+    if missing:
+        raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+    if '@' not in values['email']:
+        raise ValueError('Invalid email address')
+
+    try:
+        salary = float(values['salary'])
+    except ValueError:
+        raise ValueError(f"Invalid salary '{values['salary']}'")
+    if salary < 0:
+        raise ValueError('Salary cannot be negative')
+
+    joining_date = datetime.utcnow()
+    if values.get('joining_date'):
+        try:
+            joining_date = datetime.strptime(values['joining_date'], '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"Invalid joining date '{values['joining_date']}' (expected YYYY-MM-DD)")
+
+    status = values.get('status') or 'Active'
+    if status not in STATUSES:
+        raise ValueError(f"Invalid status '{status}'")
+
+    for field, column in (('name', Employee.name), ('email', Employee.email), ('phone', Employee.phone),
+                          ('department', Employee.department), ('position', Employee.position)):
+        if len(values.get(field) or '') > column.type.length:
+            raise ValueError(f'{field} is longer than {column.type.length} characters')
+
+    return {
+        'line_no': line_no,
+        'name': values['name'],
+        'email': values['email'],
+        'phone': values.get('phone') or None,
+        'department': values['department'],
+        'position': values['position'],
+        'salary': salary,
+        'joining_date': joining_date,
+        'status': status,
+    }
+
+
+def _copy_batch(connection, rows):
+    """Load a batch into staging with COPY (PostgreSQL)."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if row[f] is None else row[f] for f in _FIELDS])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {_staging.name} ({', '.join(_FIELDS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _load_batch(connection, rows):
+    if not rows:
+        return
+    if connection.dialect.name == 'postgresql':
+        _copy_batch(connection, rows)
+    else:
+        connection.execute(_staging.insert(), rows)
+
+
+def import_employees(lines, batch_size=BATCH_SIZE):
+    """Import employees from an iterable of CSV text lines (e.g. an open file).
+
+    Returns an :class:`ImportReport`. Rows are validated individually; an
+    invalid row or an email that already exists is reported and skipped
+    without affecting the rest of the file.
+    """
+    started = time.perf_counter()
+    report = ImportReport()
+    connection = db.session.connection()
+    _staging.create(connection, checkfirst=True)
+    connection.execute(_staging.delete())
+
+    reader = csv.DictReader(lines)
+    reader.fieldnames = [_COLUMNS.get((h or '').strip().lower(), h) for h in (reader.fieldnames or [])]
+    missing = [field for field in _REQUIRED if field not in reader.fieldnames]
+    if missing:
+        report.add_error(1, f"Missing column(s): {', '.join(missing)}")
+        report.seconds = time.perf_counter() - started
+        return report
+
+    seen_emails = set()
+    batch = []
+    for raw in reader:
+        report.rows += 1
+        line_no = reader.line_num
+        try:
+            row = _clean(raw, line_no)
+        except ValueError as e:
+            report.add_error(line_no, str(e), (raw.get('email') or '').strip() or None)
+            continue
+        if row['email'] in seen_emails:
+            report.add_error(line_no, 'Duplicate email within the file', row['email'])
+            continue
+        seen_emails.add(row['email'])
+
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _load_batch(connection, batch)
+            batch = []
+    _load_batch(connection, batch)
+    del seen_emails
+
+    emp = Employee.__table__
+    collides = exists().where(emp.c.email == _staging.c.email)
+
+    # 1. Email collisions with existing employees, in a single query
+    for line_no, email in connection.execute(
+        select(_staging.c.line_no, _staging.c.email).where(collides).order_by(_staging.c.line_no)
+    ):
+        report.add_error(line_no, 'Email already exists', email)
+
+    # 2. Counters for the rows about to be inserted
+    department_counts = {}
+    active_count = 0
+    for department, count, active in connection.execute(
+        select(
+            _staging.c.department,
+            func.count(),
+            func.sum(case((_staging.c.status == 'Active', 1), else_=0))
+        ).where(~collides).group_by(_staging.c.department)
+    ):
+        department_counts[department] = count
+        active_count += int(active or 0)
+
+    # 3. Move the rows across in one statement
+    now = datetime.utcnow()
+    source = select(
+        _staging.c.name, _staging.c.email, _staging.c.phone, _staging.c.department,
+        _staging.c.position, _staging.c.salary, _staging.c.joining_date, _staging.c.status,
+        literal(now, DateTime).label('created_at'), literal(now, DateTime).label('updated_at')
+    ).where(~collides).order_by(_staging.c.line_no)
+    connection.execute(Employee.__table__.insert().from_select(
+        ['name', 'email', 'phone', 'department', 'position', 'salary',
+         'joining_date', 'status', 'created_at', 'updated_at'],
+        source
+    ))
+    connection.execute(_staging.delete())
+
+    report.imported = sum(department_counts.values())
+    if report.imported:
+        record_bulk_employee_insert(connection, department_counts, active_count)
+        invalidate_ai_cache(connection, departments=department_counts)
+        mark_changed(db.session, 'employees')
+    report.errors.sort(key=lambda error: error['row'])
+    report.seconds = time.perf_counter() - started
+    return report
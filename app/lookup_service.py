@@ -0,0 +1,152 @@
+"""In-memory prefix index behind the employee typeahead.
+
+Each worker keeps a sorted array of ``(key, employee_id)`` pairs where the
+keys are the lower-cased full name, every later word of the name (so
+"smi" finds "John Smith") and the email address. A lookup is a binary
+search to the first key >= the query followed by a short forward scan.
+
+The index follows the ``employees`` data version (see :mod:`app.versioning`).
+When another request or worker commits a change, the next lookup re-reads
+the rows whose ``updated_at`` is at most ``_WATERMARK_OVERLAP`` older than
+the newest one seen, and drops ids that no longer exist (the id set is only
+read when the row count shows deletions), instead of rebuilding from
+scratch. A transaction can stamp ``updated_at`` and commit after another
+worker's refresh has moved past that time; the overlap catches those, and a
+full rebuild every ``_FULL_REBUILD_INTERVAL`` bounds anything slower.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+from sqlalchemy import func
+from app.models import db, Employee
+from app.versioning import get_versions
+
+# Re-read rows this far behind the watermark: covers late commits and clock skew between workers
+_WATERMARK_OVERLAP = timedelta(minutes=5)
+_FULL_REBUILD_INTERVAL = 15 * 60  # seconds
+
+
+class EmployeePrefixIndex:
+    """Sorted-array prefix index over employee names and emails."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._records = {}
+        self._entries = {}
+        self._version = None
+        self._watermark = None
+        self._rebuilt_at = None
+
+    @staticmethod
+    def _keys_for(name, email):
+        words = (name or '').lower().split()
+        keys = {' '.join(words[i:]) for i in range(len(words))}
+        if email:
+            keys.add(email.lower())
+        return keys
+
+    def _remove(self, employee_id):
+        for entry in self._entries.pop(employee_id, ()):
+            position = bisect_left(self._keys, entry)
+            if position < len(self._keys) and self._keys[position] == entry:
+                del self._keys[position]
+        self._records.pop(employee_id, None)
+
+    def _index(self, row):
+        """Record ``row`` and return its ``(key, employee_id)`` entries (not yet in ``_keys``)."""
+        entries = [(key, row.id) for key in self._keys_for(row.name, row.email)]
+        self._entries[row.id] = entries
+        self._records[row.id] = {
+            'id': row.id,
+            'name': row.name,
+            'email': row.email,
+            'department': row.department,
+            'status': row.status
+        }
+        return entries
+
+    def _upsert(self, row):
+        record = self._records.get(row.id)
+        if record is not None and (record['name'], record['email'], record['department'], record['status']) == \
+                (row.name, row.email, row.department, row.status):
+            return  # re-read inside the overlap, unchanged
+        self._remove(row.id)
+        for entry in self._index(row):
+            insort(self._keys, entry)
+
+    def _load(self, since=None):
+        query = db.session.query(
+            Employee.id, Employee.name, Employee.email,
+            Employee.department, Employee.status, Employee.updated_at
+        )
+        if since is not None:
+            query = query.filter(Employee.updated_at >= since - _WATERMARK_OVERLAP)
+        return query.all()
+
+    def _advance_watermark(self, row):
+        if row.updated_at and (self._watermark is None or row.updated_at > self._watermark):
+            self._watermark = row.updated_at
+
+    def _rebuild(self):
+        """Full load: collect every entry, then sort once."""
+        self._keys, self._records, self._entries, self._watermark = [], {}, {}, None
+        for row in self._load():
+            self._keys.extend(self._index(row))
+            self._advance_watermark(row)
+        self._keys.sort()
+        self._rebuilt_at = time.monotonic()
+
+    def _refresh(self, version):
+        if self._version is None or time.monotonic() - self._rebuilt_at >= _FULL_REBUILD_INTERVAL:
+            self._rebuild()
+        else:
+            for row in self._load(since=self._watermark):
+                self._upsert(row)
+                self._advance_watermark(row)
+            # Only read the id set when the row count shows the index is off
+            live_count = db.session.query(func.count(Employee.id)).scalar()
+            if live_count != len(self._records):
+                live_ids = {row_id for (row_id,) in db.session.query(Employee.id)}
+                for employee_id in set(self._records) - live_ids:
+                    self._remove(employee_id)
+                if live_ids - set(self._records):
+                    # Rows committed with an updated_at older than the watermark
+                    self._rebuild()
+        self._version = version
+
+    def ensure_current(self):
+        """Bring the index up to date with the ``employees`` data version."""
+        version = get_versions('employees')['employees']
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._refresh(version)
+
+    def lookup(self, prefix, limit=10, active_only=False):
+        """Return up to ``limit`` employees whose name, a name word or email starts with ``prefix``."""
+        self.ensure_current()
+        prefix = (prefix or '').strip().lower()
+
+        results, seen = [], set()
+        with self._lock:
+            keys, records = self._keys, self._records
+            position = bisect_left(keys, (prefix,))
+            while position < len(keys) and len(results) < limit:
+                key, employee_id = keys[position]
+                if not key.startswith(prefix):
+                    break
+                position += 1
+                record = records.get(employee_id)
+                if employee_id in seen or record is None:
+                    continue
+                if active_only and record['status'] != 'Active':
+                    continue
+                seen.add(employee_id)
+                results.append(dict(record))
+        return results
+
+
+employee_index = EmployeePrefixIndex()
@@ -24,6 +24,13 @@ class Employee(db.Model):
     attendances = db.relationship('Attendance', backref='employee', lazy=True, cascade='all, delete-orphan')
     salary_records = db.relationship('SalaryRecord', backref='employee', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_employees_name_id', 'name', 'id'),  # keyset pagination
+        db.Index('ix_employees_salary_id', 'salary', 'id'),
+        db.Index('ix_employees_department_id', 'department', 'id'),
+        db.Index('ix_employees_updated_at', 'updated_at'),  # typeahead index refresh
+    )
+    
     def __repr__(self):
         return f'<Employee {self.name}>'
     
@@ -54,10 +61,23 @@ class Attendance(db.Model):
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('employee_id', 'date', name='_employee_date_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'date', name='_employee_date_uc'),
+        db.Index('ix_attendance_date_id', 'date', 'id'),  # keyset pagination
+    )
     
     def __repr__(self):
         return f'<Attendance {self.employee_id} - {self.date}>'
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'employee_id': self.employee_id,
+            'date': self.date.strftime('%Y-%m-%d') if self.date else None,
+            'status': self.status,
+            'notes': self.notes
+        }
 
 
 class SalaryRecord(db.Model):
@@ -75,10 +95,27 @@ class SalaryRecord(db.Model):
     payment_date = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('employee_id', 'month', name='_employee_month_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'month', name='_employee_month_uc'),
+        db.Index('ix_salary_records_month_id', 'month', 'id'),  # keyset pagination
+    )
     
     def __repr__(self):
         return f'<SalaryRecord {self.employee_id} - {self.month}>'
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'employee_id': self.employee_id,
+            'month': self.month,
+            'basic_salary': self.basic_salary,
+            'allowances': self.allowances,
+            'deductions': self.deductions,
+            'net_salary': self.net_salary,
+            'payment_status': self.payment_status,
+            'payment_date': self.payment_date.strftime('%Y-%m-%d %H:%M:%S') if self.payment_date else None
+        }
 
 
 class Admin(db.Model):
@@ -107,3 +144,243 @@ class Admin(db.Model):
     def __repr__(self):
         return f'<Admin {self.username}>'
 
+
+
+class StatsSnapshot(db.Model):
+    """Single-row snapshot of dashboard counters, maintained by ORM events"""
+    __tablename__ = 'stats_snapshot'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    total_employees = db.Column(db.Integer, nullable=False, default=0)
+    active_employees = db.Column(db.Integer, nullable=False, default=0)
+    departments = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StatsSnapshot {self.total_employees} employees>'
+
+
+class DepartmentStat(db.Model):
+    """Per-department employee counter backing the dashboard breakdown"""
+    __tablename__ = 'department_stats'
+    
+    department = db.Column(db.String(80), primary_key=True)
+    employee_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DepartmentStat {self.department}: {self.employee_count}>'
+
+
+class AttendanceDayStat(db.Model):
+    """Per-day attendance counters (all records and Present only)"""
+    __tablename__ = 'attendance_day_stats'
+    
+    date = db.Column(db.Date, primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<AttendanceDayStat {self.date}: {self.present}/{self.total}>'
+
+
+class DataVersion(db.Model):
+    """Monotonic per-table version, bumped whenever a commit writes to the table"""
+    __tablename__ = 'data_versions'
+    
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DataVersion {self.table_name}={self.version}>'
+
+
+class AttendanceDailyRollup(db.Model):
+    """Attendance counts per (date, department, status), maintained on write"""
+    __tablename__ = 'attendance_daily_rollup'
+    
+    date = db.Column(db.Date, primary_key=True)
+    department = db.Column(db.String(80), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.Index('ix_rollup_department_date', 'department', 'date'),)
+    
+    def __repr__(self):
+        return f'<AttendanceDailyRollup {self.date} {self.department} {self.status}: {self.count}>'
+
+
+class PayrollRuleSet(db.Model):
+    """Payroll components (allowances, deductions, tax slabs) for all or one department"""
+    __tablename__ = 'payroll_rule_sets'
+    
+    DEFAULT_SCOPE = '*'  # company-wide rules; other rows override them per department
+    
+    id = db.Column(db.Integer, primary_key=True)
+    department = db.Column(db.String(80), unique=True, nullable=False, default=DEFAULT_SCOPE)
+    rules = db.Column(db.JSON, nullable=False, default=dict)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PayrollRuleSet {self.department}>'
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'department': self.department,
+            'rules': self.rules,
+            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+        }
+
+
+class PayrollRun(db.Model):
+    """One month's payroll generation, processed in checkpointed chunks"""
+    __tablename__ = 'payroll_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), unique=True, nullable=False)  # one run per month (run-level lock)
+    status = db.Column(db.String(20), nullable=False, default='Pending')  # Pending, Running, Completed, Failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    last_employee_id = db.Column(db.Integer, nullable=False, default=0)  # checkpoint
+    processing_seconds = db.Column(db.Float, nullable=False, default=0)
+    rule_sets = db.Column(db.JSON, nullable=False, default=dict)  # rules snapshot taken at creation
+    exceptions = db.Column(db.JSON, nullable=False, default=dict)  # {employee_id: [allowances, deductions]}
+    error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<PayrollRun {self.month} {self.status} {self.processed}/{self.total}>'
+    
+    @property
+    def is_stalled(self):
+        """Unfinished and not held by any live worker (crashed, failed or never started)"""
+        if self.status == 'Completed':
+            return False
+        return self.lease_expires_at is None or self.lease_expires_at < datetime.utcnow()
+    
+    def to_dict(self):
+        """Convert model to dictionary, including progress figures"""
+        rate = self.processed / self.processing_seconds if self.processing_seconds else None
+        remaining = max(self.total - self.processed, 0)
+        return {
+            'id': self.id,
+            'month': self.month,
+            'status': self.status,
+            'processed': self.processed,
+            'total': self.total,
+            'percent': 100.0 if self.status == 'Completed' else (
+                round(100.0 * self.processed / self.total, 1) if self.total else 0.0),
+            'rate': round(rate, 1) if rate else None,  # records per second
+            'eta_seconds': 0 if self.status == 'Completed' else (round(remaining / rate, 1) if rate else None),
+            'stalled': self.is_stalled,
+            'error': self.error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+
+
+class AttendanceMonthMap(db.Model):
+    """One employee-month of attendance as a byte per day (0 = no record, else a status code)"""
+    __tablename__ = 'attendance_month_maps'
+    
+    employee_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # Format: YYYY-MM
+    days = db.Column(db.LargeBinary(31), nullable=False)
+    
+    __table_args__ = (db.Index('ix_attendance_month_maps_month', 'month'),)
+    
+    def __repr__(self):
+        return f'<AttendanceMonthMap {self.employee_id} {self.month}>'
+
+
+class AIResponseCache(db.Model):
+    """Cached OpenRouter completion keyed by a hash of (model, prompt, temperature)"""
+    __tablename__ = 'ai_response_cache'
+    
+    key = db.Column(db.String(64), primary_key=True)  # sha256 hex
+    scope = db.Column(db.String(120), nullable=True, index=True)  # e.g. employee:12, department:Sales
+    model = db.Column(db.String(100), nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    hits = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<AIResponseCache {self.key[:12]} {self.scope}>'
+
+
+class AICircuitBreaker(db.Model):
+    """Circuit breaker state for an AI upstream, shared by all workers"""
+    __tablename__ = 'ai_circuit_breakers'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    state = db.Column(db.String(10), nullable=False, default='closed')  # closed, open, half_open
+    opened_at = db.Column(db.DateTime, nullable=True)
+    open_until = db.Column(db.DateTime, nullable=True)  # end of the cool-down while open
+    probe_until = db.Column(db.DateTime, nullable=True)  # trial call deadline while half-open
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AICircuitBreaker {self.name} {self.state}>'
+
+
+class AICircuitBucket(db.Model):
+    """Call outcomes for one breaker in one time bucket (rolling window building block)"""
+    __tablename__ = 'ai_circuit_buckets'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    bucket_start = db.Column(db.Integer, primary_key=True)  # unix seconds, multiple of the bucket size
+    calls = db.Column(db.Integer, default=0, nullable=False)
+    failures = db.Column(db.Integer, default=0, nullable=False)
+    slow_calls = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<AICircuitBucket {self.name} {self.bucket_start}>'
+
+
+class AIInFlight(db.Model):
+    """Lease on an upstream AI call in progress, so other workers wait for its result instead of repeating it"""
+    __tablename__ = 'ai_inflight'
+    
+    key = db.Column(db.String(64), primary_key=True)  # response cache key of the prompt
+    locked_by = db.Column(db.String(120), nullable=False)  # host:pid:thread of the worker making the call
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    lease_expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<AIInFlight {self.key[:12]} {self.locked_by}>'
+
+
+class AIInsight(db.Model):
+    """Stored AI insight for an employee or department, regenerated when stale"""
+    __tablename__ = 'ai_insights'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # salary, performance, attendance, department
+    scope = db.Column(db.String(120), nullable=False, index=True)  # employee:<id> or department:<name>
+    prompt_hash = db.Column(db.String(64), nullable=False)  # prompt the text answers; a new prompt makes it stale
+    model = db.Column(db.String(100), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    __table_args__ = (db.UniqueConstraint('kind', 'scope', name='_ai_insight_kind_scope_uc'),)
+    
+    def __repr__(self):
+        return f'<AIInsight {self.kind} {self.scope}>'
+    
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'scope': self.scope,
+            'text': self.text,
+            'model': self.model,
+            'generated_at': self.generated_at.isoformat() if self.generated_at else None
+        }
@@ -0,0 +1,164 @@
+"""Keyset (seek) pagination for the list pages.
+
+``Query.paginate()`` issues ``OFFSET n`` plus a ``COUNT(*)`` for every page,
+so deep pages get slower as tables grow. Keyset pagination instead orders by
+a stable, unique composite key such as ``(date, id)`` and asks for rows
+strictly after (or before) the key of the last row shown, which an index
+on the key columns serves in constant time at any depth.
+
+The position is carried in an opaque ``cursor`` query parameter. Total
+counts are not needed to page; when shown, they are cached per data
+version (see :mod:`app.versioning`) rather than recomputed per page.
+"""
+import base64
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from flask import request, url_for
+from sqlalchemy import tuple_
+from app.versioning import get_versions
+
+_COUNT_CACHE_SIZE = 256
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+# ==================== CURSORS ====================
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(values, backward=False):
+    payload = {'k': [_encode_value(v) for v in values], 'b': backward}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(values, backward)``; raises ``ValueError`` for a bad cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return [_decode_value(v) for v in payload['k']], bool(payload.get('b'))
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+
+# ==================== PAGE ====================
+class KeysetPage:
+    """One page of results plus the cursors to move either way."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def url(self, cursor=None):
+        """URL of the current view with the same filters and ``cursor``."""
+        args = request.args.to_dict()
+        args.pop('cursor', None)
+        args.pop('page', None)
+        if cursor:
+            args['cursor'] = cursor
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+    @property
+    def first_url(self):
+        return self.url()
+
+    @property
+    def next_url(self):
+        return self.url(self.next_cursor) if self.next_cursor else None
+
+    @property
+    def prev_url(self):
+        return self.url(self.prev_cursor) if self.prev_cursor else None
+
+    def to_dict(self, serialize):
+        data = {
+            'items': [serialize(item) for item in self.items],
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+        }
+        if self.total is not None:
+            data['total'] = self.total
+        return data
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=20, descending=False):
+    """Return a :class:`KeysetPage` of ``query`` ordered by ``keys``.
+
+    ``keys`` is a list of column expressions forming a unique sort key (end
+    it with the primary key), all sorted in the same direction. Any
+    ``ORDER BY`` already on ``query`` is replaced.
+    """
+    values, backward = decode_cursor(cursor) if cursor else (None, False)
+    # Walking backwards flips the scan direction; rows are re-reversed below
+    scan_descending = descending != backward
+
+    query = query.add_columns(*keys).order_by(None)
+    if values is not None:
+        if scan_descending:
+            query = query.filter(tuple_(*keys) < tuple_(*values))
+        else:
+            query = query.filter(tuple_(*keys) > tuple_(*values))
+    query = query.order_by(*[k.desc() if scan_descending else k.asc() for k in keys])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage([])
+
+    has_next = True if backward else has_more
+    has_prev = has_more if backward else values is not None
+    first_key, last_key = list(rows[0][1:]), list(rows[-1][1:])
+    return KeysetPage(
+        [row[0] for row in rows],
+        next_cursor=encode_cursor(last_key) if has_next else None,
+        prev_cursor=encode_cursor(first_key, backward=True) if has_prev else None
+    )
+
+
+# ==================== CACHED COUNTS ====================
+def cached_count(query, tables, cache_key):
+    """``query.count()`` memoised per worker until one of ``tables`` changes."""
+    versions = tuple(sorted(get_versions(*tables).items()))
+    key = (cache_key, versions)
+    with _count_cache_lock:
+        if key in _count_cache:
+            _count_cache.move_to_end(key)
+            return _count_cache[key]
+
+    total = query.order_by(None).count()
+    with _count_cache_lock:
+        _count_cache[key] = total
+        if len(_count_cache) > _COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return total
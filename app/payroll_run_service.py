@@ -0,0 +1,197 @@
+"""Resumable, chunked payroll runs.
+
+Generating a month's payroll is a persisted :class:`~app.models.PayrollRun`.
+The run snapshots the payroll rules and the per-employee adjustments when it
+is created, then processes active employees in id order, ``chunk_size`` at a
+time. Each chunk inserts its salary records and advances the run's checkpoint
+(``last_employee_id``, ``processed``) in the same transaction, so a crash
+loses at most the chunk in flight and a resumed run continues exactly where
+the last commit left off.
+
+Only one run may exist per month (unique ``month``), which replaces the old
+"salary already generated" check. Only one worker may process a run at a
+time: it holds a lease (``locked_by``/``lease_expires_at``) that is renewed
+with every checkpoint and only honoured while it has not expired. A run
+whose lease has lapsed without completing counts as stalled and can be
+resumed by anyone.
+"""
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, select, func, exists
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Employee, SalaryRecord, PayrollRun
+from app.payroll_service import snapshot_rule_sets, load_rule_sets, calculate_payroll, insert_payroll
+
+
+class PayrollRunExists(Exception):
+    """Raised when a payroll run for the month already exists."""
+
+    def __init__(self, run):
+        super().__init__(f'A payroll run for {run.month} already exists')
+        self.run = run
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def _settings(chunk_size=None, lease_seconds=None):
+    return (
+        chunk_size or current_app.config.get('PAYROLL_CHUNK_SIZE', 500),
+        lease_seconds or current_app.config.get('PAYROLL_LEASE_SECONDS', 60)
+    )
+
+
+def create_run(month, exceptions=None):
+    """Create and commit the run for ``month``.
+
+    ``exceptions`` maps employee id -> ``(extra_allowances, extra_deductions)``.
+    Raises :class:`PayrollRunExists` if the month already has a run.
+    """
+    existing = PayrollRun.query.filter_by(month=month).first()
+    if existing is not None:
+        raise PayrollRunExists(existing)
+
+    total = db.session.execute(
+        select(func.count(Employee.id))
+        .where(Employee.status == 'Active')
+        .where(~exists().where(SalaryRecord.employee_id == Employee.id, SalaryRecord.month == month))
+    ).scalar()
+    run = PayrollRun(
+        month=month,
+        status='Pending',
+        total=total,
+        rule_sets=snapshot_rule_sets(),
+        exceptions={str(employee_id): list(extra) for employee_id, extra in (exceptions or {}).items()}
+    )
+    db.session.add(run)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request created the month's run first
+        db.session.rollback()
+        raise PayrollRunExists(PayrollRun.query.filter_by(month=month).one())
+    return run
+
+
+def _claim(run_id, worker, lease_seconds):
+    """Take the run's lease if it is free or expired; return whether we hold it."""
+    table = PayrollRun.__table__
+    now = datetime.utcnow()
+    result = db.session.execute(
+        table.update()
+        .where(
+            table.c.id == run_id,
+            table.c.status != 'Completed',
+            or_(table.c.lease_expires_at.is_(None), table.c.lease_expires_at < now)
+        )
+        .values(
+            status='Running',
+            error=None,
+            locked_by=worker,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            updated_at=now
+        )
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _held(run_id, worker):
+    table = PayrollRun.__table__
+    return (table.c.id == run_id) & (table.c.locked_by == worker) & (table.c.lease_expires_at >= datetime.utcnow())
+
+
+def process_run(run_id, chunk_size=None, lease_seconds=None, on_chunk=None):
+    """Process a run to completion, resuming from its last checkpoint.
+
+    Returns the run, or ``None`` when another worker currently holds it.
+    ``on_chunk(run)`` is called after every committed chunk. On error the
+    run is marked Failed (and can be resumed) and the exception re-raised.
+    """
+    chunk_size, lease_seconds = _settings(chunk_size, lease_seconds)
+    worker = _worker_id()
+    if not _claim(run_id, worker, lease_seconds):
+        return None
+
+    table = PayrollRun.__table__
+    run = db.session.get(PayrollRun, run_id)
+    month = run.month
+    rule_sets = load_rule_sets(run.rule_sets)
+    exceptions = {int(employee_id): tuple(extra) for employee_id, extra in (run.exceptions or {}).items()}
+
+    try:
+        while True:
+            started = time.perf_counter()
+            payroll = calculate_payroll(
+                exceptions, rule_sets, after_id=run.last_employee_id, limit=chunk_size, month=month
+            )
+            if not len(payroll):
+                break
+            inserted = insert_payroll(payroll, month)
+
+            # Checkpoint with the inserts, but only while we still hold the lease
+            result = db.session.execute(
+                table.update()
+                .where(_held(run_id, worker))
+                .values(
+                    processed=table.c.processed + inserted,
+                    last_employee_id=int(payroll.employee_ids[-1]),
+                    processing_seconds=table.c.processing_seconds + (time.perf_counter() - started),
+                    lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds),
+                    updated_at=datetime.utcnow()
+                )
+            )
+            if result.rowcount == 0:
+                db.session.rollback()
+                current_app.logger.warning(f'Payroll run {run_id}: lease lost, stopping')
+                return None
+            db.session.commit()
+            if on_chunk:
+                on_chunk(run)
+
+        now = datetime.utcnow()
+        db.session.execute(
+            table.update()
+            .where(_held(run_id, worker))
+            .values(status='Completed', finished_at=now, updated_at=now, locked_by=None, lease_expires_at=None)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        db.session.execute(
+            table.update()
+            .where(table.c.id == run_id, table.c.locked_by == worker)
+            .values(status='Failed', error=str(e), updated_at=datetime.utcnow(), locked_by=None, lease_expires_at=None)
+        )
+        db.session.commit()
+        raise
+
+    db.session.refresh(run)
+    return run
+
+
+def _process_in_background(app, run_id):
+    with app.app_context():
+        try:
+            process_run(run_id)
+        except Exception:
+            app.logger.exception(f'Payroll run {run_id} failed')
+        finally:
+            db.session.remove()
+
+
+def start_run(run_id):
+    """Process the run in a background thread of this worker."""
+    thread = threading.Thread(
+        target=_process_in_background,
+        args=(current_app._get_current_object(), run_id),
+        name=f'payroll-run-{run_id}',
+        daemon=True
+    )
+    thread.start()
+    return thread
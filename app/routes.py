@@ -1,10 +1,28 @@
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify, flash, g
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, flash, g, Response, stream_with_context, current_app
 from datetime import datetime, date, timedelta
-from app.models import db, Employee, Attendance, SalaryRecord
+import itertools
+import time
+from io import TextIOWrapper
+from app.models import db, Employee, Attendance, SalaryRecord, PayrollRuleSet, PayrollRun
 from app.auth import login_required
-from sqlalchemy import and_, or_, func
-import csv
-from io import StringIO
+from app.stats_service import get_dashboard_stats, get_department_breakdown, iter_stats_events, stats_broadcaster
+from app.sse import sse_frame
+from app.versioning import versioned_json
+from app.analytics_service import attendance_by_department
+from app.search_service import search_subquery
+from app.pagination import keyset_paginate, cached_count
+from app.lookup_service import employee_index
+from app.export_service import csv_response, iter_rows
+from app.import_service import import_employees
+from app.attendance_service import bulk_upsert_attendance, STATUSES as ATTENDANCE_STATUSES
+from app.payroll_service import save_rule_set
+from app.payroll_run_service import create_run, start_run, PayrollRunExists
+from app.simulation_service import simulate
+from app.salary_payment_service import mark_paid, reconcile
+from app.employee_summary_service import get_employee_summary
+from app.attendance_map_service import employee_heatmap, department_heatmap
+from sqlalchemy import and_, or_, func, select
+from sqlalchemy.orm import joinedload
 
 # Define blueprints
 main_bp = Blueprint('main', __name__)
@@ -13,24 +31,27 @@ attendance_bp = Blueprint('attendance', __name__)
 salary_bp = Blueprint('salary', __name__)
 
 
+def _count_key():
+    """Cache key for list totals: the view plus its filters, minus paging args"""
+    args = request.args.to_dict()
+    for name in ('cursor', 'page', 'format', 'include_total', 'sort_by'):
+        args.pop(name, None)
+    return (request.endpoint, tuple(sorted(args.items())))
+
+
 # ==================== MAIN ROUTES ====================
 @main_bp.route('/')
 @login_required
 def index():
     """Dashboard with statistics"""
-    total_employees = Employee.query.count()
-    active_employees = Employee.query.filter_by(status='Active').count()
-    departments = db.session.query(Employee.department, func.count(Employee.id)).group_by(Employee.department).all()
-    
-    # Today's attendance
-    today = date.today()
-    today_attendance = Attendance.query.filter_by(date=today).count()
+    counters = get_dashboard_stats()
+    departments = get_department_breakdown()
     
     stats = {
-        'total_employees': total_employees,
-        'active_employees': active_employees,
-        'departments': len(departments),
-        'today_attendance': today_attendance
+        'total_employees': counters['total_employees'],
+        'active_employees': counters['active_employees'],
+        'departments': counters['departments'],
+        'today_records': counters['today_records']
     }
     
     return render_template('dashboard.html', stats=stats, departments=departments)
@@ -47,15 +68,18 @@ def about():
 @employee_bp.route('/')
 @login_required
 def list_employees():
-    """List all employees with search and filter"""
-    page = request.args.get('page', 1, type=int)
+    """List all employees with search and filter (keyset paginated)"""
+    cursor = request.args.get('cursor')
     per_page = 10
     
     query = Employee.query
     
-    # Search functionality
-    search = request.args.get('search', '')
-    if search:
+    # Search functionality (indexed, with ILIKE scan as fallback)
+    search = request.args.get('search', '').strip()
+    match = search_subquery(search) if search else None
+    if match is not None:
+        query = query.join(match, match.c.id == Employee.id)
+    elif search:
         query = query.filter(
             or_(
                 Employee.name.ilike(f'%{search}%'),
@@ -74,16 +98,27 @@ def list_employees():
     if status:
         query = query.filter_by(status=status)
     
-    # Sort
-    sort_by = request.args.get('sort_by', 'name')
+    # Sort (each key ends with the id so it is unique for keyset pagination)
+    sort_by = request.args.get('sort_by', 'relevance')
     if sort_by == 'salary':
-        query = query.order_by(Employee.salary.desc())
+        keys, descending = [Employee.salary, Employee.id], True
     elif sort_by == 'department':
-        query = query.order_by(Employee.department)
+        keys, descending = [Employee.department, Employee.id], False
+    elif sort_by == 'relevance' and match is not None:
+        keys, descending = [match.c.score, Employee.id], True
     else:
-        query = query.order_by(Employee.name)
+        keys, descending = [Employee.name, Employee.id], False
+    
+    try:
+        employees = keyset_paginate(query, keys, cursor=cursor, per_page=per_page, descending=descending)
+    except ValueError:
+        return redirect(url_for('employees.list_employees'))
     
-    employees = query.paginate(page=page, per_page=per_page)
+    if request.args.get('format') == 'json':
+        if request.args.get('include_total'):
+            employees.total = cached_count(query, ['employees'], _count_key())
+        return jsonify(employees.to_dict(Employee.to_dict))
+    employees.total = cached_count(query, ['employees'], _count_key())
     
     # Get unique departments for filter dropdown
     departments = db.session.query(Employee.department).distinct().all()
@@ -94,6 +129,7 @@ def list_employees():
                          search=search, 
                          department=department,
                          status=status,
+                         sort_by=sort_by,
                          departments=departments)
 
 
@@ -139,14 +175,15 @@ def view_employee(employee_id):
     """View employee details"""
     employee = Employee.query.get_or_404(employee_id)
     
-    # Get attendance for last 30 days
-    last_30_days = date.today() - timedelta(days=30)
+    summary = get_employee_summary(employee_id)
+    
+    # Latest attendance entries for the profile card
     recent_attendance = Attendance.query.filter(
         and_(
             Attendance.employee_id == employee_id,
-            Attendance.date >= last_30_days
+            Attendance.date >= summary.start
         )
-    ).order_by(Attendance.date.desc()).all()
+    ).order_by(Attendance.date.desc()).limit(5).all()
     
     # Get current month salary record
     current_month = datetime.now().strftime('%Y-%m')
@@ -155,23 +192,13 @@ def view_employee(employee_id):
         month=current_month
     ).first()
     
-    # Calculate attendance stats
-    present_count = Attendance.query.filter_by(
-        employee_id=employee_id,
-        status='Present'
-    ).filter(Attendance.date >= last_30_days).count()
-    
-    absent_count = Attendance.query.filter_by(
-        employee_id=employee_id,
-        status='Absent'
-    ).filter(Attendance.date >= last_30_days).count()
-    
     return render_template('employees/view.html', 
                          employee=employee,
                          recent_attendance=recent_attendance,
                          salary_record=salary_record,
-                         present_count=present_count,
-                         absent_count=absent_count)
+                         summary=summary,
+                         present_count=summary.present_days,
+                         absent_count=summary.absent_days)
 
 
 @employee_bp.route('/<int:employee_id>/edit', methods=['GET', 'POST'])
@@ -232,37 +259,64 @@ def delete_employee(employee_id):
 @employee_bp.route('/export/csv')
 @login_required
 def export_csv():
-    """Export employees to CSV"""
-    from flask import make_response
-    
-    employees = Employee.query.all()
-    
-    si = StringIO()
-    cw = csv.writer(si)
-    cw.writerow(['ID', 'Name', 'Email', 'Phone', 'Department', 'Position', 'Salary', 'Joining Date', 'Status'])
-    
-    for emp in employees:
-        cw.writerow([
-            emp.id,
-            emp.name,
-            emp.email,
-            emp.phone,
-            emp.department,
-            emp.position,
-            emp.salary,
-            emp.joining_date.strftime('%Y-%m-%d') if emp.joining_date else '',
-            emp.status
-        ])
-    
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=employees.csv"
-    output.headers["Content-type"] = "text/csv"
-    return output
+    """Export employees to CSV (streamed)"""
+    statement = select(
+        Employee.id, Employee.name, Employee.email, Employee.phone, Employee.department,
+        Employee.position, Employee.salary, Employee.joining_date, Employee.status
+    ).order_by(Employee.id)
+    
+    def convert(row):
+        return [*row[:7], row.joining_date.strftime('%Y-%m-%d') if row.joining_date else '', row.status]
+    
+    return csv_response(
+        'employees.csv',
+        ['ID', 'Name', 'Email', 'Phone', 'Department', 'Position', 'Salary', 'Joining Date', 'Status'],
+        iter_rows(statement, convert)
+    )
+
+
+@employee_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_employees_csv():
+    """Bulk-import employees from an uploaded CSV"""
+    if request.method == 'GET':
+        return render_template('employees/import.html', report=None)
+    
+    wants_json = request.args.get('format') == 'json'
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        if wants_json:
+            return jsonify({'error': 'No file uploaded (expected form field "file")'}), 400
+        flash('Please choose a CSV file to import.', 'danger')
+        return redirect(url_for('employees.import_employees_csv'))
+    
+    try:
+        report = import_employees(TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''))
+        db.session.commit()
+    except UnicodeDecodeError:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': 'File is not valid UTF-8 text'}), 400
+        flash('File is not valid UTF-8 text.', 'danger')
+        return redirect(url_for('employees.import_employees_csv'))
+    except Exception as e:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': str(e)}), 500
+        flash(f'Error: {str(e)}', 'danger')
+        return redirect(url_for('employees.import_employees_csv'))
+    
+    if wants_json:
+        return jsonify(report.to_dict())
+    flash(f'Imported {report.imported} of {report.rows} employees '
+          f'({report.error_count} skipped).', 'success' if report.imported else 'warning')
+    return render_template('employees/import.html', report=report)
 
 
 # ======= Simple JSON API for real-time UI updates =======
 @main_bp.route('/api/employees')
 @login_required
+@versioned_json('employees')
 def api_employees():
     """Return a JSON list of recent employees"""
     employees = Employee.query.order_by(Employee.id.desc()).limit(100).all()
@@ -276,65 +330,144 @@ def api_employees():
     } for e in employees])
 
 
+@main_bp.route('/api/employees/lookup')
+@login_required
+def api_employee_lookup():
+    """Typeahead: employees whose name, a name word or email starts with ?q="""
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    active_only = bool(request.args.get('active'))
+    return jsonify(employee_index.lookup(request.args.get('q', ''), limit=limit, active_only=active_only))
+
+
 @main_bp.route('/api/stats')
 @login_required
+@versioned_json('employees', 'attendance', extra=date.today)
 def api_stats():
     """Return simple statistics used by the dashboard"""
-    total = Employee.query.count()
-    active = Employee.query.filter_by(status='Active').count()
-    departments = db.session.query(Employee.department, db.func.count(Employee.id)).group_by(Employee.department).all()
-    today = date.today()
-    today_att = Attendance.query.filter(Attendance.date == today, Attendance.status == 'Present').count()
+    counters = get_dashboard_stats()
     return jsonify({
-        'total_employees': total,
-        'active_employees': active,
-        'departments': len(departments),
-        'today_attendance': today_att
+        'total_employees': counters['total_employees'],
+        'active_employees': counters['active_employees'],
+        'departments': counters['departments'],
+        'today_attendance': counters['today_attendance'],
+        'today_records': counters['today_records']
     })
 
 
-# ==================== ATTENDANCE ROUTES ====================
-@attendance_bp.route('/')
+@main_bp.route('/api/stats/stream')
 @login_required
-def attendance_list():
-    """View attendance records"""
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
+def api_stats_stream():
+    """Push dashboard statistics as Server-Sent Events when they change"""
+    config = current_app.config
+    admitted = stats_broadcaster.subscribe(
+        current_app._get_current_object(),
+        interval=config['STATS_STREAM_INTERVAL'],
+        max_clients=config['STATS_STREAM_MAX_CLIENTS']
+    )
+    if not admitted:
+        # Keep request threads for regular requests; the dashboard falls back to polling /api/stats
+        response = jsonify({'error': 'Too many live dashboards on this worker; poll /api/stats instead'})
+        response.headers['Retry-After'] = str(int(config['STATS_STREAM_MAX_SECONDS']))
+        return response, 503
     
-    query = Attendance.query
+    events = iter_stats_events(
+        stats_broadcaster,
+        interval=config['STATS_STREAM_INTERVAL'],
+        heartbeat=config['STATS_STREAM_HEARTBEAT'],
+        max_seconds=config['STATS_STREAM_MAX_SECONDS']
+    )
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.call_on_close(stats_broadcaster.unsubscribe)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # disable proxy buffering (nginx)
+    return response
+
+
+# ==================== ATTENDANCE ROUTES ====================
+def _attendance_filters():
+    """Filter conditions from ?employee_id=&from_date=&to_date=&status="""
+    conditions = []
     
     # Filter by employee
     employee_id = request.args.get('employee_id', '')
     if employee_id:
-        query = query.filter_by(employee_id=int(employee_id))
+        conditions.append(Attendance.employee_id == int(employee_id))
     
     # Filter by date range
     from_date = request.args.get('from_date', '')
     to_date = request.args.get('to_date', '')
     
     if from_date:
-        query = query.filter(Attendance.date >= datetime.strptime(from_date, '%Y-%m-%d').date())
+        conditions.append(Attendance.date >= datetime.strptime(from_date, '%Y-%m-%d').date())
     
     if to_date:
-        query = query.filter(Attendance.date <= datetime.strptime(to_date, '%Y-%m-%d').date())
+        conditions.append(Attendance.date <= datetime.strptime(to_date, '%Y-%m-%d').date())
     
     # Filter by status
     status = request.args.get('status', '')
     if status:
-        query = query.filter_by(status=status)
+        conditions.append(Attendance.status == status)
+    
+    return conditions, employee_id, from_date, to_date, status
+
+
+@attendance_bp.route('/')
+@login_required
+def attendance_list():
+    """View attendance records (keyset paginated on date, id)"""
+    cursor = request.args.get('cursor')
+    per_page = 20
     
-    attendance_records = query.order_by(Attendance.date.desc()).paginate(page=page, per_page=per_page)
-    employees = Employee.query.all()
+    query = Attendance.query.options(joinedload(Attendance.employee))
+    conditions, employee_id, from_date, to_date, status = _attendance_filters()
+    query = query.filter(*conditions)
+    
+    try:
+        attendance_records = keyset_paginate(
+            query, [Attendance.date, Attendance.id], cursor=cursor, per_page=per_page, descending=True
+        )
+    except ValueError:
+        return redirect(url_for('attendance.attendance_list'))
+    
+    if request.args.get('format') == 'json':
+        if request.args.get('include_total'):
+            attendance_records.total = cached_count(query, ['attendance'], _count_key())
+        return jsonify(attendance_records.to_dict(
+            lambda record: dict(record.to_dict(), employee_name=record.employee.name)
+        ))
+    attendance_records.total = cached_count(query, ['attendance'], _count_key())
+    selected_employee = db.session.get(Employee, int(employee_id)) if employee_id else None
     
     return render_template('attendance/list.html',
                          attendance_records=attendance_records,
-                         employees=employees,
+                         selected_employee=selected_employee,
                          employee_id=employee_id,
                          from_date=from_date,
                          to_date=to_date,
                          status=status)
 
 
+@attendance_bp.route('/export/csv')
+@login_required
+def export_attendance_csv():
+    """Export attendance to CSV (streamed), honouring the list filters"""
+    conditions = _attendance_filters()[0]
+    statement = select(
+        Attendance.id, Attendance.employee_id, Employee.name, Employee.department,
+        Attendance.date, Attendance.status, Attendance.notes
+    ).join(Employee, Employee.id == Attendance.employee_id).where(*conditions).order_by(Attendance.date, Attendance.id)
+    
+    def convert(row):
+        return [row.id, row.employee_id, row.name, row.department,
+                row.date.strftime('%Y-%m-%d'), row.status, row.notes or '']
+    
+    return csv_response(
+        'attendance.csv',
+        ['ID', 'Employee ID', 'Employee Name', 'Department', 'Date', 'Status', 'Notes'],
+        iter_rows(statement, convert)
+    )
+
+
 @attendance_bp.route('/mark', methods=['GET', 'POST'])
 @login_required
 def mark_attendance():
@@ -376,44 +509,26 @@ def mark_attendance():
             db.session.rollback()
             flash(f'Error: {str(e)}', 'danger')
     
-    employees = Employee.query.filter_by(status='Active').all()
-    return render_template('attendance/mark.html', employees=employees)
+    return render_template('attendance/mark.html')
 
 
 @attendance_bp.route('/bulk-mark', methods=['GET', 'POST'])
 @login_required
 def bulk_mark_attendance():
-    """Mark attendance for multiple employees at once"""
+    """Mark attendance for multiple employees at once (form or JSON body)"""
+    if request.method == 'POST' and request.is_json:
+        return _bulk_mark_attendance_json()
+    
     if request.method == 'POST':
         try:
             date_str = request.form.get('date')
             date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
             
-            employees = Employee.query.filter_by(status='Active').all()
-            success_count = 0
-            
-            for emp in employees:
-                status = request.form.get(f'status_{emp.id}', 'Present')
-                notes = request.form.get(f'notes_{emp.id}', '')
-                
-                existing = Attendance.query.filter_by(
-                    employee_id=emp.id,
-                    date=date_obj
-                ).first()
-                
-                if existing:
-                    existing.status = status
-                    existing.notes = notes
-                else:
-                    attendance = Attendance(
-                        employee_id=emp.id,
-                        date=date_obj,
-                        status=status,
-                        notes=notes
-                    )
-                    db.session.add(attendance)
-                
-                success_count += 1
+            employee_ids = [row_id for (row_id,) in db.session.query(Employee.id).filter_by(status='Active')]
+            success_count = bulk_upsert_attendance(date_obj, (
+                (emp_id, request.form.get(f'status_{emp_id}', 'Present'), request.form.get(f'notes_{emp_id}', ''))
+                for emp_id in employee_ids
+            ))
             
             db.session.commit()
             flash(f'Attendance marked for {success_count} employees!', 'success')
@@ -427,89 +542,252 @@ def bulk_mark_attendance():
     return render_template('attendance/bulk_mark.html', employees=employees)
 
 
-# ==================== SALARY ROUTES ====================
-@salary_bp.route('/')
-@login_required
-def salary_list():
-    """View salary records"""
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
+def _bulk_mark_attendance_json():
+    """JSON body: {"date": "YYYY-MM-DD", "records": [{"employee_id", "status", "notes"}]}"""
+    payload = request.get_json(silent=True) or {}
+    try:
+        date_obj = datetime.strptime(str(payload.get('date')), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'date is required (YYYY-MM-DD)'}), 400
+    records = payload.get('records')
+    if not isinstance(records, list):
+        return jsonify({'error': 'records must be a list'}), 400
+    
+    entries, errors = [], []
+    for index, record in enumerate(records):
+        try:
+            employee_id = int(record.get('employee_id'))
+        except (AttributeError, TypeError, ValueError):
+            errors.append({'index': index, 'error': 'Invalid employee_id'})
+            continue
+        status = record.get('status') or 'Present'
+        if status not in ATTENDANCE_STATUSES:
+            errors.append({'index': index, 'employee_id': employee_id, 'error': f"Invalid status '{status}'"})
+            continue
+        entries.append((index, employee_id, status, record.get('notes') or ''))
     
-    query = SalaryRecord.query
+    requested = {employee_id for _, employee_id, _, _ in entries}
+    known = {row_id for (row_id,) in db.session.query(Employee.id).filter(Employee.id.in_(requested))} if requested else set()
+    for index, employee_id, _, _ in entries:
+        if employee_id not in known:
+            errors.append({'index': index, 'employee_id': employee_id, 'error': 'Employee not found'})
+    
+    try:
+        marked = bulk_upsert_attendance(date_obj, (
+            (employee_id, status, notes) for _, employee_id, status, notes in entries if employee_id in known
+        ))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    errors.sort(key=lambda error: error['index'])
+    return jsonify({'date': date_obj.strftime('%Y-%m-%d'), 'marked': marked, 'errors': errors})
+
+
+# ==================== SALARY ROUTES ====================
+def _salary_filters():
+    """Filter conditions from ?employee_id=&month=&status="""
+    conditions = []
     
     # Filter by employee
     employee_id = request.args.get('employee_id', '')
     if employee_id:
-        query = query.filter_by(employee_id=int(employee_id))
+        conditions.append(SalaryRecord.employee_id == int(employee_id))
     
     # Filter by month
     month = request.args.get('month', '')
     if month:
-        query = query.filter_by(month=month)
+        conditions.append(SalaryRecord.month == month)
     
     # Filter by status
     status = request.args.get('status', '')
     if status:
-        query = query.filter_by(payment_status=status)
+        conditions.append(SalaryRecord.payment_status == status)
     
-    salary_records = query.order_by(SalaryRecord.month.desc()).paginate(page=page, per_page=per_page)
-    employees = Employee.query.all()
+    return conditions, employee_id, month, status
+
+
+@salary_bp.route('/')
+@login_required
+def salary_list():
+    """View salary records (keyset paginated on month, id)"""
+    cursor = request.args.get('cursor')
+    per_page = 20
+    
+    query = SalaryRecord.query.options(joinedload(SalaryRecord.employee))
+    conditions, employee_id, month, status = _salary_filters()
+    query = query.filter(*conditions)
+    
+    try:
+        salary_records = keyset_paginate(
+            query, [SalaryRecord.month, SalaryRecord.id], cursor=cursor, per_page=per_page, descending=True
+        )
+    except ValueError:
+        return redirect(url_for('salary.salary_list'))
+    
+    if request.args.get('format') == 'json':
+        if request.args.get('include_total'):
+            salary_records.total = cached_count(query, ['salary_records'], _count_key())
+        return jsonify(salary_records.to_dict(
+            lambda record: dict(record.to_dict(), employee_name=record.employee.name)
+        ))
+    salary_records.total = cached_count(query, ['salary_records'], _count_key())
+    selected_employee = db.session.get(Employee, int(employee_id)) if employee_id else None
     
     return render_template('salary/list.html',
                          salary_records=salary_records,
-                         employees=employees,
+                         selected_employee=selected_employee,
                          employee_id=employee_id,
                          month=month,
                          status=status)
 
 
+@salary_bp.route('/export/csv')
+@login_required
+def export_salary_csv():
+    """Export salary records to CSV (streamed), honouring the list filters"""
+    conditions = _salary_filters()[0]
+    statement = select(
+        SalaryRecord.id, SalaryRecord.employee_id, Employee.name, Employee.department, SalaryRecord.month,
+        SalaryRecord.basic_salary, SalaryRecord.allowances, SalaryRecord.deductions, SalaryRecord.net_salary,
+        SalaryRecord.payment_status, SalaryRecord.payment_date
+    ).join(Employee, Employee.id == SalaryRecord.employee_id).where(*conditions).order_by(SalaryRecord.month, SalaryRecord.id)
+    
+    def convert(row):
+        return [*row[:10], row.payment_date.strftime('%Y-%m-%d %H:%M:%S') if row.payment_date else '']
+    
+    return csv_response(
+        f"salary_{request.args.get('month') or 'all'}.csv",
+        ['ID', 'Employee ID', 'Employee Name', 'Department', 'Month', 'Basic Salary',
+         'Allowances', 'Deductions', 'Net Salary', 'Payment Status', 'Payment Date'],
+        iter_rows(statement, convert)
+    )
+
+
+def _payroll_exceptions():
+    """Per-employee extra allowances/deductions from the generate form's exception rows"""
+    exceptions = {}
+    rows = zip(
+        request.form.getlist('exception_employee_id'),
+        request.form.getlist('exception_allowances'),
+        request.form.getlist('exception_deductions')
+    )
+    for employee_id, allowances, deductions in rows:
+        if not employee_id:
+            continue
+        extra_allowances, extra_deductions = exceptions.get(int(employee_id), (0.0, 0.0))
+        exceptions[int(employee_id)] = (
+            extra_allowances + float(allowances or 0),
+            extra_deductions + float(deductions or 0)
+        )
+    return exceptions
+
+
 @salary_bp.route('/generate', methods=['GET', 'POST'])
 @login_required
 def generate_salary():
-    """Generate salary for a month"""
+    """Start (or show) the payroll run for a month"""
     if request.method == 'POST':
         try:
             month = request.form.get('month')
+            datetime.strptime(month or '', '%Y-%m')
             
-            # Check if salary already exists for this month
-            existing = SalaryRecord.query.filter_by(month=month).first()
-            if existing:
+            # Months generated before payroll runs existed have records but no run
+            existing_run = PayrollRun.query.filter_by(month=month).first()
+            if existing_run is None and SalaryRecord.query.filter_by(month=month).first():
                 flash('Salary already generated for this month!', 'warning')
                 return redirect(url_for('salary.generate_salary'))
             
-            employees = Employee.query.filter_by(status='Active').all()
-            success_count = 0
-            
-            for emp in employees:
-                allowances = float(request.form.get(f'allowances_{emp.id}', 0))
-                deductions = float(request.form.get(f'deductions_{emp.id}', 0))
-                
-                net_salary = emp.salary + allowances - deductions
-                
-                salary_record = SalaryRecord(
-                    employee_id=emp.id,
-                    month=month,
-                    basic_salary=emp.salary,
-                    allowances=allowances,
-                    deductions=deductions,
-                    net_salary=net_salary,
-                    payment_status='Pending'
-                )
-                db.session.add(salary_record)
-                success_count += 1
-            
-            db.session.commit()
-            flash(f'Salary generated for {success_count} employees!', 'success')
-            return redirect(url_for('salary.salary_list'))
+            run = create_run(month, _payroll_exceptions())
+            start_run(run.id)
+            flash(f'Payroll run for {month} started for {run.total} employees.', 'success')
+            return redirect(url_for('salary.payroll_run', run_id=run.id))
         
+        except PayrollRunExists as e:
+            flash(f'Salary for {e.run.month} is already {"generated" if e.run.status == "Completed" else "being generated"}.', 'warning')
+            return redirect(url_for('salary.payroll_run', run_id=e.run.id))
+        except ValueError as e:
+            db.session.rollback()
+            flash(f'Invalid input data: {str(e)}', 'danger')
         except Exception as e:
             db.session.rollback()
             flash(f'Error: {str(e)}', 'danger')
     
-    employees = Employee.query.filter_by(status='Active').all()
+    active_count = Employee.query.filter_by(status='Active').count()
+    rule_sets = PayrollRuleSet.query.order_by(PayrollRuleSet.department).all()
+    recent_runs = PayrollRun.query.order_by(PayrollRun.id.desc()).limit(12).all()
     current_month = datetime.now().strftime('%Y-%m')
     
-    return render_template('salary/generate.html', employees=employees, current_month=current_month)
+    return render_template('salary/generate.html', active_count=active_count, rule_sets=rule_sets,
+                           recent_runs=recent_runs, current_month=current_month)
+
+
+@salary_bp.route('/runs/<int:run_id>')
+@login_required
+def payroll_run(run_id):
+    """Progress page for a payroll run"""
+    run = PayrollRun.query.get_or_404(run_id)
+    return render_template('salary/run.html', run=run)
+
+
+@main_bp.route('/api/payroll/runs/<int:run_id>')
+@login_required
+def api_payroll_run(run_id):
+    """Payroll run progress: processed/total, rate, ETA"""
+    run = PayrollRun.query.get_or_404(run_id)
+    return jsonify(run.to_dict())
+
+
+@main_bp.route('/api/payroll/runs/<int:run_id>/resume', methods=['POST'])
+@login_required
+def api_resume_payroll_run(run_id):
+    """Resume a failed or stalled payroll run from its last checkpoint"""
+    run = PayrollRun.query.get_or_404(run_id)
+    if run.status == 'Completed':
+        return jsonify({'error': 'Payroll run already completed', 'run': run.to_dict()}), 409
+    if not run.is_stalled:
+        return jsonify({'error': 'Payroll run is in progress', 'run': run.to_dict()}), 409
+    start_run(run.id)
+    return jsonify(run.to_dict()), 202
+
+
+@main_bp.route('/api/payroll/rules')
+@login_required
+def api_payroll_rules():
+    """List payroll rule sets ('*' is the company-wide set)"""
+    rule_sets = PayrollRuleSet.query.order_by(PayrollRuleSet.department).all()
+    return jsonify([rule_set.to_dict() for rule_set in rule_sets])
+
+
+@main_bp.route('/api/payroll/rules/<path:department>', methods=['PUT', 'DELETE'])
+@login_required
+def api_payroll_rule_set(department):
+    """Create/replace (PUT, JSON body) or delete a payroll rule set"""
+    if request.method == 'DELETE':
+        rule_set = PayrollRuleSet.query.filter_by(department=department).first_or_404()
+        db.session.delete(rule_set)
+        db.session.commit()
+        return jsonify({'deleted': department})
+    
+    try:
+        rule_set = save_rule_set(department, request.get_json(silent=True))
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    return jsonify(rule_set.to_dict())
+
+
+@main_bp.route('/api/salary/simulate', methods=['POST'])
+@login_required
+def api_salary_simulate():
+    """What-if salary adjustments; JSON body {"rules": [...], "active_only": true}. Writes nothing."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        return jsonify(simulate(payload.get('rules', []), active_only=payload.get('active_only', True)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 
 @salary_bp.route('/<int:salary_id>/mark-paid', methods=['POST'])
@@ -530,8 +808,94 @@ def mark_salary_paid(salary_id):
     return redirect(url_for('salary.salary_list'))
 
 
+@salary_bp.route('/mark-paid', methods=['POST'])
+@login_required
+def bulk_mark_salary_paid():
+    """Mark all unpaid records matching month/department/ids as paid (form or JSON body)"""
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        month, department, ids = payload.get('month'), payload.get('department'), payload.get('ids')
+    else:
+        month, department = request.form.get('month'), request.form.get('department')
+        ids = [salary_id for value in request.form.getlist('ids') for salary_id in value.split(',') if salary_id.strip()]
+    
+    try:
+        result = mark_paid(month=month, department=department, ids=ids)
+        db.session.commit()
+    except (ValueError, TypeError) as e:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({'error': str(e)}), 400
+        flash(f'Error: {str(e)}', 'danger')
+        return redirect(url_for('salary.salary_list', month=month or None))
+    except Exception as e:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({'error': str(e)}), 500
+        flash(f'Error: {str(e)}', 'danger')
+        return redirect(url_for('salary.salary_list', month=month or None))
+    
+    if request.is_json:
+        return jsonify(result)
+    flash(f"{result['updated']} salary records marked as paid ({result['already_paid']} were already paid).", 'success')
+    return redirect(url_for('salary.salary_list', month=month or None))
+
+
+@salary_bp.route('/reconcile', methods=['GET', 'POST'])
+@login_required
+def reconcile_salary_payments():
+    """Apply a bank payment confirmation CSV"""
+    if request.method == 'GET':
+        return render_template('salary/reconcile.html', report=None)
+    
+    wants_json = request.args.get('format') == 'json'
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        if wants_json:
+            return jsonify({'error': 'No file uploaded (expected form field "file")'}), 400
+        flash('Please choose a CSV file to reconcile.', 'danger')
+        return redirect(url_for('salary.reconcile_salary_payments'))
+    
+    try:
+        report = reconcile(TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''))
+        db.session.commit()
+    except UnicodeDecodeError:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': 'File is not valid UTF-8 text'}), 400
+        flash('File is not valid UTF-8 text.', 'danger')
+        return redirect(url_for('salary.reconcile_salary_payments'))
+    except Exception as e:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': str(e)}), 500
+        flash(f'Error: {str(e)}', 'danger')
+        return redirect(url_for('salary.reconcile_salary_payments'))
+    
+    if wants_json:
+        return jsonify(report.to_dict())
+    flash(f'Reconciled {report.rows} rows: {report.updated} updated, {report.already_paid} already paid, '
+          f'{report.unmatched} unmatched.', 'success' if report.updated else 'warning')
+    return render_template('salary/reconcile.html', report=report)
+
+
 # ======= AI-Powered Insights API =======
-from app.ai_service import get_ai_client
+from app.ai_service import get_ai_client, FALLBACKS as AI_FALLBACKS
+from app.ai_breaker_service import openrouter_breaker, CircuitOpenError
+from app.ai_singleflight_service import get_singleflight_stats
+from app.ai_cache_service import employee_scope, department_scope, get_cache_stats, clear as clear_ai_cache
+from app.ai_insight_service import (
+    years_of_experience, months_employed, employee_insight_messages, department_attendance
+)
+
+
+def _ai_unavailable(error):
+    """503 with Retry-After while the AI circuit breaker is open"""
+    response = jsonify({'error': 'AI service temporarily unavailable', 'retry_after': error.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 
 @main_bp.route('/api/ai/salary-recommendation/<int:employee_id>')
 @login_required
@@ -547,21 +911,20 @@ def api_salary_recommendation(employee_id):
             error_msg = f'AI service not available (API key present: {has_key})'
             return jsonify({'error': error_msg}), 503
         
-        # Calculate years of experience
-        years_exp = None
-        if employee.joining_date:
-            delta = datetime.now() - employee.joining_date
-            years_exp = delta.days / 365.25
+        years_exp = years_of_experience(employee)
         
         recommendation = ai.get_salary_recommendation(
             employee.name,
             employee.position,
             employee.department,
             employee.salary,
-            years_exp
+            years_exp,
+            scope=employee_scope(employee.id)
         )
         
         return jsonify({'recommendation': recommendation})
+    except CircuitOpenError as e:
+        return _ai_unavailable(e)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -581,35 +944,21 @@ def api_performance_insight(employee_id):
             return jsonify({'error': 'AI service not available'}), 503
         
         # Calculate attendance score
-        last_30_days = date.today() - timedelta(days=30)
-        total_days = Attendance.query.filter(
-            and_(
-                Attendance.employee_id == employee_id,
-                Attendance.date >= last_30_days
-            )
-        ).count()
-        
-        present_days = Attendance.query.filter_by(
-            employee_id=employee_id,
-            status='Present'
-        ).filter(Attendance.date >= last_30_days).count()
+        attendance_score = get_employee_summary(employee_id).attendance_score
         
-        attendance_score = (present_days / total_days * 100) if total_days > 0 else 0
-        
-        # Calculate months employed
-        months_employed = 0
-        if employee.joining_date:
-            delta = datetime.now() - employee.joining_date
-            months_employed = delta.days // 30
+        employed_months = months_employed(employee)
         
         insight = ai.get_performance_insight(
             employee.name,
             employee.department,
             attendance_score,
-            months_employed
+            employed_months,
+            scope=employee_scope(employee.id)
         )
         
         return jsonify({'insight': insight})
+    except CircuitOpenError as e:
+        return _ai_unavailable(e)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -628,29 +977,19 @@ def api_attendance_analysis(employee_id):
         if not ai:
             return jsonify({'error': 'AI service not available'}), 503
         
-        last_30_days = date.today() - timedelta(days=30)
-        total_days = Attendance.query.filter(
-            and_(
-                Attendance.employee_id == employee_id,
-                Attendance.date >= last_30_days
-            )
-        ).count()
-        
-        present_days = Attendance.query.filter_by(
-            employee_id=employee_id,
-            status='Present'
-        ).filter(Attendance.date >= last_30_days).count()
-        
-        absent_days = total_days - present_days
+        summary = get_employee_summary(employee_id)
         
         analysis = ai.get_attendance_analysis(
             employee.name,
-            present_days,
-            absent_days,
-            total_days
+            summary.present_days,
+            summary.missed_days,
+            summary.total_days,
+            scope=employee_scope(employee.id)
         )
         
         return jsonify({'analysis': analysis})
+    except CircuitOpenError as e:
+        return _ai_unavailable(e)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -658,42 +997,96 @@ def api_attendance_analysis(employee_id):
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
-@main_bp.route('/api/ai/department-insights/<department>')
+@main_bp.route('/api/ai/employee-insights/<int:employee_id>')
 @login_required
-def api_department_insights(department):
-    """Get AI insights for a department"""
+def api_employee_insights(employee_id):
+    """Salary, performance and attendance insights for an employee in one request"""
     try:
+        employee = Employee.query.get_or_404(employee_id)
         ai = get_ai_client()
         
         if not ai:
             return jsonify({'error': 'AI service not available'}), 503
         
-        employees = Employee.query.filter_by(department=department).all()
-        total_employees = len(employees)
+        started = time.perf_counter()
+        summary = get_employee_summary(employee_id)
+        results = ai.call_concurrently(
+            employee_insight_messages(ai, employee, summary),
+            scope=employee_scope(employee.id),
+            timeout=current_app.config['AI_INSIGHTS_TIMEOUT']
+        )
         
-        if total_employees == 0:
-            return jsonify({'insight': 'No employees in this department'})
+        unavailable = [result for result in results.values() if result['status'] == 'unavailable']
+        if len(unavailable) == len(results):
+            raise CircuitOpenError(max(result['retry_after'] for result in unavailable))
+        for name, result in results.items():
+            if result['status'] == 'failed':
+                result['text'] = AI_FALLBACKS[name]
         
-        avg_salary = sum(e.salary for e in employees) / total_employees
+        return jsonify({
+            'employee_id': employee.id,
+            'insights': results,
+            'complete': all(result['status'] == 'ok' for result in results.values()),
+            'seconds': round(time.perf_counter() - started, 3)
+        })
+    except CircuitOpenError as e:
+        return _ai_unavailable(e)
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        print(f'Error in employee insights: {error_details}')
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+def _department_insight_inputs(department, start, end):
+    """(total_employees, avg_salary, avg_attendance, kind) for the department prompt, None if it is empty"""
+    total_employees, avg_salary = db.session.query(
+        func.count(Employee.id),
+        func.avg(Employee.salary)
+    ).filter(Employee.department == department).one()
+    
+    if total_employees == 0:
+        return None
+    
+    # Calculate average attendance from the daily rollup
+    avg_attendance = department_attendance(department, start, end)
+    
+    # Only the default window is stored (and precomputed); custom windows are cached only
+    custom_window = bool(request.args.get('from_date') or request.args.get('to_date'))
+    return total_employees, avg_salary, avg_attendance, None if custom_window else 'department'
+
+
+@main_bp.route('/api/ai/department-insights/<department>')
+@login_required
+def api_department_insights(department):
+    """Get AI insights for a department"""
+    try:
+        start, end = _analytics_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        ai = get_ai_client()
         
-        # Calculate average attendance
-        last_30_days = date.today() - timedelta(days=30)
-        all_attendance = Attendance.query.filter(
-            Attendance.employee_id.in_([e.id for e in employees]),
-            Attendance.date >= last_30_days
-        ).all()
+        if not ai:
+            return jsonify({'error': 'AI service not available'}), 503
         
-        present_count = sum(1 for a in all_attendance if a.status == 'Present')
-        avg_attendance = (present_count / len(all_attendance) * 100) if all_attendance else 0
+        inputs = _department_insight_inputs(department, start, end)
+        if inputs is None:
+            return jsonify({'insight': 'No employees in this department'})
+        total_employees, avg_salary, avg_attendance, kind = inputs
         
         insight = ai.get_department_insights(
             department,
             total_employees,
             avg_salary,
-            avg_attendance
+            avg_attendance,
+            scope=department_scope(department),
+            kind=kind
         )
         
         return jsonify({'insight': insight})
+    except CircuitOpenError as e:
+        return _ai_unavailable(e)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -701,7 +1094,162 @@ def api_department_insights(department):
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 
+# ---- Streaming (Server-Sent Events) variants ----
+_STREAM_KINDS = {
+    'salary-recommendation': 'salary',
+    'performance-insight': 'performance',
+    'attendance-analysis': 'attendance',
+}
+
+
+def _sse_response(events):
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # disable proxy buffering (nginx)
+    return response
+
+
+def _ai_stream_response(ai, messages, scope, kind, fallback):
+    """Stream one insight as ``token`` events followed by ``done``.
+    
+    The first piece is awaited before the response starts, so an open
+    circuit breaker still yields a plain 503 with Retry-After. A failure
+    after that ends the stream with an ``error`` event.
+    """
+    pieces = ai.stream_api(messages, temperature=ai.insight_temperature, scope=scope, kind=kind)
+    first = next(pieces, None)
+    
+    def events():
+        text = []
+        try:
+            for piece in itertools.chain([first] if first else [], pieces):
+                text.append(piece)
+                yield sse_frame('token', {'text': piece})
+        except Exception as e:
+            current_app.logger.exception('AI insight stream failed')
+            yield sse_frame('error', {'error': f'Server error: {str(e)}'})
+            return
+        answer = ''.join(text).strip()
+        yield sse_frame('done', {'text': answer or fallback, 'status': 'ok' if answer else 'failed'})
+    
+    return _sse_response(events())
+
+
+@main_bp.route('/api/ai/<any("salary-recommendation", "performance-insight", "attendance-analysis"):insight>'
+               '/<int:employee_id>/stream')
+@login_required
+def api_employee_insight_stream(insight, employee_id):
+    """Stream one AI insight for an employee token by token"""
+    employee = Employee.query.get_or_404(employee_id)
+    try:
+        ai = get_ai_client()
+        
+        if not ai:
+            return jsonify({'error': 'AI service not available'}), 503
+        
+        kind = _STREAM_KINDS[insight]
+        messages = employee_insight_messages(ai, employee, get_employee_summary(employee_id))[kind]
+        return _ai_stream_response(ai, messages, employee_scope(employee.id), kind, AI_FALLBACKS[kind])
+    except CircuitOpenError as e:
+        return _ai_unavailable(e)
+    except Exception as e:
+        import traceback
+        print(f'Error in employee insight stream: {traceback.format_exc()}')
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+@main_bp.route('/api/ai/employee-insights/<int:employee_id>/stream')
+@login_required
+def api_employee_insights_stream(employee_id):
+    """Stream all three employee insights, interleaved, over one connection"""
+    employee = Employee.query.get_or_404(employee_id)
+    ai = get_ai_client()
+    
+    if not ai:
+        return jsonify({'error': 'AI service not available'}), 503
+    
+    requests_by_kind = employee_insight_messages(ai, employee, get_employee_summary(employee_id))
+    stream = ai.stream_concurrently(requests_by_kind, scope=employee_scope(employee.id),
+                                    timeout=current_app.config['AI_INSIGHTS_TIMEOUT'])
+    
+    def events():
+        try:
+            for kind, event, payload in stream:
+                if event == 'token':
+                    yield sse_frame('token', {'kind': kind, 'text': payload})
+                else:
+                    if payload['status'] == 'failed':
+                        payload['text'] = AI_FALLBACKS[kind]
+                    yield sse_frame('done', {'kind': kind, **payload})
+        except Exception as e:
+            current_app.logger.exception('AI employee insights stream failed')
+            yield sse_frame('error', {'error': f'Server error: {str(e)}'})
+            return
+        yield sse_frame('end', {})
+    
+    return _sse_response(events())
+
+
+@main_bp.route('/api/ai/department-insights/<department>/stream')
+@login_required
+def api_department_insights_stream(department):
+    """Stream the AI insight for a department token by token"""
+    try:
+        start, end = _analytics_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        ai = get_ai_client()
+        
+        if not ai:
+            return jsonify({'error': 'AI service not available'}), 503
+        
+        inputs = _department_insight_inputs(department, start, end)
+        if inputs is None:
+            return _sse_response(iter([sse_frame('done', {'text': 'No employees in this department', 'status': 'ok'})]))
+        total_employees, avg_salary, avg_attendance, kind = inputs
+        
+        messages = ai.department_insights_messages(department, total_employees, avg_salary, avg_attendance)
+        return _ai_stream_response(ai, messages, department_scope(department), kind, AI_FALLBACKS['department'])
+    except CircuitOpenError as e:
+        return _ai_unavailable(e)
+    except Exception as e:
+        import traceback
+        print(f'Error in department insights stream: {traceback.format_exc()}')
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+@main_bp.route('/api/ai/status')
+@login_required
+def api_ai_status():
+    """AI availability, circuit breaker state and request coalescing counters"""
+    return jsonify({
+        'enabled': get_ai_client() is not None,
+        'breaker': openrouter_breaker.status(),
+        'coalescing': get_singleflight_stats()
+    })
+
+
+@main_bp.route('/api/ai/cache', methods=['GET', 'DELETE'])
+@login_required
+def api_ai_cache():
+    """AI response cache statistics; DELETE empties the cache"""
+    if request.method == 'DELETE':
+        removed = clear_ai_cache()
+        return jsonify({'removed': removed, **get_cache_stats()})
+    return jsonify(get_cache_stats())
+
+
 # ==================== ANALYTICS PAGE & API ====================
+def _analytics_window():
+    """Date window from ?from_date=&to_date= (YYYY-MM-DD), default last 30 days"""
+    from_date = request.args.get('from_date', '')
+    to_date = request.args.get('to_date', '')
+    start = datetime.strptime(from_date, '%Y-%m-%d').date() if from_date else date.today() - timedelta(days=30)
+    end = datetime.strptime(to_date, '%Y-%m-%d').date() if to_date else None
+    return start, end
+
+
 @main_bp.route('/analytics')
 @login_required
 def analytics_page():
@@ -713,8 +1261,13 @@ def analytics_page():
 
 @main_bp.route('/api/analytics/overview')
 @login_required
+@versioned_json('employees', 'attendance', extra=date.today)
 def api_analytics_overview():
     """Return traditional analytics: counts and avg salary per department."""
+    try:
+        start, end = _analytics_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         # Employees per department
         dept_counts = db.session.query(Employee.department, func.count(Employee.id)).group_by(Employee.department).all()
@@ -725,10 +1278,8 @@ def api_analytics_overview():
         counts = {d: int(c) for d, c in dept_counts}
         avg_salary = {d: float(round(s or 0, 2)) for d, s in dept_avg_salary}
 
-        # Recent attendance by department (last 30 days)
-        last_30 = date.today() - timedelta(days=30)
-        attendance_rows = db.session.query(Employee.department, func.count(Attendance.id)).join(Attendance, Employee.id == Attendance.employee_id).filter(Attendance.date >= last_30, Attendance.status == 'Present').group_by(Employee.department).all()
-        attendance = {d: int(c) for d, c in attendance_rows}
+        # Present attendance by department (last 30 days unless a window is given)
+        attendance = attendance_by_department(start, end, status='Present')
 
         return jsonify({
             'counts': counts,
@@ -739,3 +1290,44 @@ def api_analytics_overview():
         import traceback
         print(f'Error in analytics overview: {traceback.format_exc()}')
         return jsonify({'error': str(e)}), 500
+
+
+HEATMAP_DEFAULT_DAYS = 365
+HEATMAP_MAX_DAYS = 3 * 366
+
+
+def _heatmap_window():
+    """Date window from ?from_date=&to_date= (YYYY-MM-DD), default the last year"""
+    end = datetime.strptime(request.args['to_date'], '%Y-%m-%d').date() if request.args.get('to_date') else date.today()
+    from_date = request.args.get('from_date', '')
+    start = datetime.strptime(from_date, '%Y-%m-%d').date() if from_date else end - timedelta(days=HEATMAP_DEFAULT_DAYS - 1)
+    if start > end:
+        raise ValueError('from_date must not be after to_date')
+    if (end - start).days >= HEATMAP_MAX_DAYS:
+        raise ValueError(f'Date range is limited to {HEATMAP_MAX_DAYS} days')
+    return start, end
+
+
+@main_bp.route('/api/attendance/heatmap/employee/<int:employee_id>')
+@login_required
+@versioned_json('attendance', extra=date.today)
+def api_employee_heatmap(employee_id):
+    """Daily attendance codes, counts and streaks for one employee."""
+    Employee.query.get_or_404(employee_id)
+    try:
+        start, end = _heatmap_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(employee_heatmap(employee_id, start, end))
+
+
+@main_bp.route('/api/attendance/heatmap/department/<path:department>')
+@login_required
+@versioned_json('employees', 'attendance', extra=date.today)
+def api_department_heatmap(department):
+    """Daily present/recorded counts and attendance rate for a department."""
+    try:
+        start, end = _heatmap_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(department_heatmap(department, start, end))
@@ -0,0 +1,244 @@
+"""Batch payment status updates for salary records.
+
+:func:`mark_paid` marks every unpaid record matching a filter (month,
+department, explicit ids) as Paid with a single ``UPDATE ... WHERE``.
+
+:func:`reconcile` applies a bank confirmation CSV. The file is read once;
+its references are resolved with a few ``IN`` queries and the confirmed
+records are updated with one statement per (status, payment date) group
+instead of one request and commit per record.
+
+Both run in the caller's transaction; commit afterwards.
+"""
+import csv
+from datetime import datetime
+from sqlalchemy import select, update, tuple_
+from app.models import db, Employee, SalaryRecord
+from app.versioning import mark_changed
+
+IN_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+AMOUNT_TOLERANCE = 0.01
+
+_COLUMNS = {
+    'id': 'salary_id',
+    'salary_id': 'salary_id',
+    'salary id': 'salary_id',
+    'record id': 'salary_id',
+    'employee id': 'employee_id',
+    'employee_id': 'employee_id',
+    'month': 'month',
+    'amount': 'amount',
+    'net salary': 'amount',
+    'net_salary': 'amount',
+    'status': 'status',
+    'payment status': 'status',
+    'payment_status': 'status',
+    'date': 'payment_date',
+    'paid date': 'payment_date',
+    'payment date': 'payment_date',
+    'payment_date': 'payment_date',
+}
+_PAID = {'paid', 'success', 'successful', 'completed', 'settled'}
+_FAILED = {'failed', 'rejected', 'returned', 'bounced'}
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# ==================== BATCH MARK PAID ====================
+def mark_paid(month=None, department=None, ids=None, paid_at=None):
+    """Mark unpaid records matching all given filters as Paid.
+
+    At least one filter is required. Returns ``{'updated', 'already_paid'}``.
+    """
+    if not month and not department and not ids:
+        raise ValueError('Provide at least one of month, department or ids')
+
+    conditions = []
+    if month:
+        conditions.append(SalaryRecord.month == month)
+    if department:
+        conditions.append(SalaryRecord.employee_id.in_(
+            select(Employee.id).where(Employee.department == department)
+        ))
+    if ids:
+        conditions.append(SalaryRecord.id.in_([int(salary_id) for salary_id in ids]))
+
+    already_paid = db.session.query(SalaryRecord.id).filter(
+        *conditions, SalaryRecord.payment_status == 'Paid'
+    ).count()
+    result = db.session.execute(
+        update(SalaryRecord)
+        .where(*conditions, SalaryRecord.payment_status != 'Paid')
+        .values(payment_status='Paid', payment_date=paid_at or datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        mark_changed(db.session, 'salary_records')
+    return {'updated': result.rowcount, 'already_paid': already_paid}
+
+
+# ==================== BANK RECONCILIATION ====================
+class ReconciliationReport:
+    """Counts and per-row problems from one bank confirmation file."""
+
+    def __init__(self):
+        self.rows = 0
+        self.updated = 0
+        self.already_paid = 0
+        self.already_failed = 0
+        self.unmatched = 0
+        self.amount_mismatches = 0
+        self.errors = []
+        self.error_count = 0
+
+    def add_error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line_no, 'error': message})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'updated': self.updated,
+            'already_paid': self.already_paid,
+            'already_failed': self.already_failed,
+            'unmatched': self.unmatched,
+            'amount_mismatches': self.amount_mismatches,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors)
+        }
+
+
+def _parse_row(raw):
+    """Return ``(reference, status, payment_date, amount)`` or raise ``ValueError``."""
+    if raw.get('salary_id'):
+        try:
+            reference = int(raw['salary_id'])
+        except ValueError:
+            raise ValueError(f"Invalid salary ID '{raw['salary_id']}'")
+    elif raw.get('employee_id') and raw.get('month'):
+        try:
+            reference = (int(raw['employee_id']), raw['month'])
+        except ValueError:
+            raise ValueError(f"Invalid employee ID '{raw['employee_id']}'")
+    else:
+        raise ValueError('Row needs a salary ID, or an employee ID and month')
+
+    status = (raw.get('status') or 'paid').lower()
+    if status in _PAID:
+        status = 'Paid'
+    elif status in _FAILED:
+        status = 'Failed'
+    else:
+        raise ValueError(f"Unknown status '{raw['status']}'")
+
+    payment_date = None
+    if raw.get('payment_date'):
+        for date_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+            try:
+                payment_date = datetime.strptime(raw['payment_date'], date_format)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Invalid payment date '{raw['payment_date']}'")
+
+    amount = None
+    if raw.get('amount'):
+        try:
+            amount = float(raw['amount'].replace(',', ''))
+        except ValueError:
+            raise ValueError(f"Invalid amount '{raw['amount']}'")
+    return reference, status, payment_date, amount
+
+
+def _load_records(salary_ids, employee_months):
+    """Fetch the referenced records: ``{reference: (id, net_salary, payment_status)}``."""
+    columns = (SalaryRecord.id, SalaryRecord.employee_id, SalaryRecord.month,
+               SalaryRecord.net_salary, SalaryRecord.payment_status)
+    records = {}
+    for chunk in _chunks(salary_ids):
+        for row in db.session.execute(select(*columns).where(SalaryRecord.id.in_(chunk))):
+            records[row.id] = (row.id, row.net_salary, row.payment_status)
+    for chunk in _chunks(employee_months):
+        for row in db.session.execute(
+            select(*columns).where(tuple_(SalaryRecord.employee_id, SalaryRecord.month).in_(chunk))
+        ):
+            records[(row.employee_id, row.month)] = (row.id, row.net_salary, row.payment_status)
+    return records
+
+
+def reconcile(lines):
+    """Apply a bank confirmation CSV given as an iterable of text lines.
+
+    Rows reference a record by ``ID`` (as in the salary export) or by
+    ``Employee ID`` + ``Month``. Optional columns: ``Status`` (paid/failed,
+    default paid), ``Payment Date`` and ``Amount``; a row whose amount differs
+    from the record's net salary is reported and left unchanged.
+    """
+    report = ReconciliationReport()
+    reader = csv.DictReader(lines)
+    reader.fieldnames = [_COLUMNS.get((h or '').strip().lower(), h) for h in (reader.fieldnames or [])]
+    if 'salary_id' not in reader.fieldnames and not {'employee_id', 'month'} <= set(reader.fieldnames):
+        report.add_error(1, 'File needs an ID column, or Employee ID and Month columns')
+        return report
+
+    confirmations = []
+    for raw in reader:
+        report.rows += 1
+        raw = {key: (value or '').strip() for key, value in raw.items() if isinstance(key, str)}
+        try:
+            confirmations.append((reader.line_num, *_parse_row(raw)))
+        except ValueError as e:
+            report.unmatched += 1
+            report.add_error(reader.line_num, str(e))
+
+    records = _load_records(
+        {reference for _, reference, *_ in confirmations if isinstance(reference, int)},
+        {reference for _, reference, *_ in confirmations if isinstance(reference, tuple)}
+    )
+
+    now = datetime.utcnow()
+    groups = {}
+    seen = set()
+    for line_no, reference, status, payment_date, amount in confirmations:
+        record = records.get(reference)
+        if record is None:
+            report.unmatched += 1
+            report.add_error(line_no, 'No matching salary record')
+            continue
+        salary_id, net_salary, current_status = record
+        if salary_id in seen:
+            report.add_error(line_no, f'Salary record {salary_id} appears more than once; row ignored')
+            continue
+        seen.add(salary_id)
+        if amount is not None and abs(amount - (net_salary or 0)) > AMOUNT_TOLERANCE:
+            report.amount_mismatches += 1
+            report.add_error(line_no, f'Amount {amount:.2f} does not match net salary {net_salary:.2f}')
+            continue
+        if current_status == status:
+            if status == 'Paid':
+                report.already_paid += 1
+            else:
+                report.already_failed += 1
+            continue
+        groups.setdefault((status, payment_date or now), []).append(salary_id)
+
+    for (status, payment_date), salary_ids in groups.items():
+        for chunk in _chunks(salary_ids):
+            result = db.session.execute(
+                update(SalaryRecord)
+                .where(SalaryRecord.id.in_(chunk))
+                .values(payment_status=status, payment_date=payment_date if status == 'Paid' else None)
+                .execution_options(synchronize_session=False)
+            )
+            report.updated += result.rowcount
+    if report.updated:
+        mark_changed(db.session, 'salary_records')
+    report.errors.sort(key=lambda error: error['row'])
+    return report
@@ -0,0 +1,217 @@
+"""Indexed employee search for the ``search`` box on the employee list.
+
+Backends, picked at startup from the database dialect:
+
+* SQLite - an FTS5 virtual table (``employee_search``) with the trigram
+  tokenizer over name, email and position. It is an external-content table
+  kept in sync with ``employees`` by triggers, so ORM writes, bulk inserts
+  and raw SQL are all reflected.
+* PostgreSQL - a ``pg_trgm`` GIN index over the concatenated columns, which
+  serves ``ILIKE '%term%'`` and the ``<%`` similarity operator.
+
+Matching first looks for the term as a case-insensitive substring (the
+behaviour of the old ``ilike`` search) ranked by relevance. When nothing
+matches, it falls back to fuzzy trigram matching so small typos still find
+the employee. Terms shorter than three characters cannot use a trigram
+index; for those, and whenever no index is available (old SQLite without
+FTS5, no permission to create ``pg_trgm``), callers fall back to the
+original ``ilike`` scan.
+"""
+import re
+from flask import current_app
+from sqlalchemy import event, text, Integer, Float
+from app.models import db
+
+MIN_TERM_LENGTH = 3
+FUZZY_THRESHOLD = 0.3
+FUZZY_CANDIDATES = 500
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS employee_search USING fts5(
+        name, email, position,
+        content='employees', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS employees_search_ai AFTER INSERT ON employees BEGIN
+        INSERT INTO employee_search(rowid, name, email, position)
+        VALUES (new.id, new.name, new.email, new.position);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS employees_search_ad AFTER DELETE ON employees BEGIN
+        INSERT INTO employee_search(employee_search, rowid, name, email, position)
+        VALUES ('delete', old.id, old.name, old.email, old.position);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS employees_search_au AFTER UPDATE OF name, email, position ON employees BEGIN
+        INSERT INTO employee_search(employee_search, rowid, name, email, position)
+        VALUES ('delete', old.id, old.name, old.email, old.position);
+        INSERT INTO employee_search(rowid, name, email, position)
+        VALUES (new.id, new.name, new.email, new.position);
+    END""",
+]
+
+_PG_EXPR = "(name || ' ' || email || ' ' || position)"
+_PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_employees_search_trgm ON employees USING gin ({_PG_EXPR} gin_trgm_ops)",
+]
+
+
+# ==================== TRIGRAM SIMILARITY ====================
+def _trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def word_similarity(term, value):
+    """Best trigram (Jaccard) similarity between ``term`` and any word of ``value``.
+
+    Mirrors pg_trgm's word similarity closely enough to rank SQLite fuzzy
+    candidates with the same threshold as PostgreSQL.
+    """
+    if not term or not value:
+        return 0.0
+    wanted = _trigrams(term.lower())
+    best = 0.0
+    for word in re.split(r'[^0-9a-z]+', value.lower()):
+        if not word:
+            continue
+        grams = _trigrams(word)
+        best = max(best, len(wanted & grams) / len(wanted | grams))
+    return best
+
+
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function('word_similarity', 2, word_similarity, deterministic=True)
+
+
+# ==================== SETUP ====================
+def _setup_sqlite(connection):
+    created = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'employee_search'"
+    )).first() is None
+    for statement in _SQLITE_DDL:
+        connection.execute(text(statement))
+    if created:
+        connection.execute(text("INSERT INTO employee_search(employee_search) VALUES ('rebuild')"))
+
+
+def _setup_postgresql(connection):
+    for statement in _PG_DDL:
+        connection.execute(text(statement))
+
+
+def init_search_index(app):
+    """Create the search index for the current database and record the backend.
+
+    Must run inside an application context after ``db.create_all()``.
+    """
+    dialect = db.engine.dialect.name
+    backend = None
+    try:
+        with db.engine.begin() as connection:
+            if dialect == 'sqlite':
+                _setup_sqlite(connection)
+                backend = 'fts5'
+            elif dialect == 'postgresql':
+                _setup_postgresql(connection)
+                backend = 'pg_trgm'
+    except Exception as e:
+        app.logger.warning(f'Employee search index unavailable, using ILIKE scan: {e}')
+        backend = None
+
+    if backend == 'fts5':
+        event.listen(db.engine, 'connect', _register_sqlite_functions)
+        if db.engine.url.database in (None, '', ':memory:'):
+            # An in-memory database lives in its single pooled connection; disposing would drop it
+            with db.engine.connect() as connection:
+                _register_sqlite_functions(connection.connection.driver_connection, None)
+        else:
+            # Connections opened before the listener existed lack the function
+            db.engine.dispose()
+
+    app.extensions['employee_search'] = backend
+    return backend
+
+
+def rebuild_search_index():
+    """Re-populate the search index from ``employees``."""
+    backend = current_app.extensions.get('employee_search')
+    if backend == 'fts5':
+        db.session.execute(text("INSERT INTO employee_search(employee_search) VALUES ('rebuild')"))
+    elif backend == 'pg_trgm':
+        db.session.execute(text('REINDEX INDEX ix_employees_search_trgm'))
+    return backend
+
+
+# ==================== QUERIES ====================
+def _fts_phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _sqlite_queries(term):
+    exact = text(
+        "SELECT rowid AS id, -bm25(employee_search) AS score "
+        "FROM employee_search WHERE employee_search MATCH :match"
+    ).bindparams(match=_fts_phrase(term))
+
+    grams = sorted({term.lower()[i:i + 3] for i in range(len(term) - 2)})
+    fuzzy = text(
+        "SELECT id, score FROM ("
+        "  SELECT rowid AS id, word_similarity(:term, name || ' ' || email || ' ' || position) AS score "
+        "  FROM employee_search WHERE employee_search MATCH :match "
+        "  ORDER BY rank LIMIT :candidates"
+        ") WHERE score >= :threshold"
+    ).bindparams(
+        term=term,
+        match=' OR '.join(_fts_phrase(g) for g in grams),
+        candidates=FUZZY_CANDIDATES,
+        threshold=FUZZY_THRESHOLD
+    )
+    return exact, fuzzy
+
+
+def _postgresql_queries(term):
+    exact = text(
+        f"SELECT id, word_similarity(:term, {_PG_EXPR}) AS score "
+        f"FROM employees WHERE {_PG_EXPR} ILIKE :pattern"
+    ).bindparams(term=term, pattern=_like_pattern(term))
+    fuzzy = text(
+        f"SELECT id, word_similarity(:term, {_PG_EXPR}) AS score "
+        f"FROM employees WHERE :term <% {_PG_EXPR}"
+    ).bindparams(term=term)
+    return exact, fuzzy
+
+
+def search_subquery(term):
+    """Return a subquery of ``(id, score)`` rows matching ``term``, or ``None``.
+
+    ``None`` means the index cannot serve this term and the caller should
+    use its ``ilike`` fallback. Join the subquery on ``Employee.id`` and
+    order by ``score`` descending for relevance ranking.
+    """
+    term = (term or '').strip()
+    backend = current_app.extensions.get('employee_search')
+    if not backend or len(term) < MIN_TERM_LENGTH:
+        return None
+
+    if backend == 'fts5':
+        exact, fuzzy = _sqlite_queries(term)
+    else:
+        exact, fuzzy = _postgresql_queries(term)
+
+    if backend == 'pg_trgm':
+        # The <% operator uses this threshold (default 0.6); scoped to the transaction
+        db.session.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+            {'threshold': str(FUZZY_THRESHOLD)}
+        )
+
+    exact = exact.columns(id=Integer, score=Float)
+    fuzzy = fuzzy.columns(id=Integer, score=Float)
+    has_exact = db.session.execute(
+        db.select(exact.subquery().c.id).limit(1)
+    ).first() is not None
+    return (exact if has_exact else fuzzy).subquery('search_match')
@@ -0,0 +1,209 @@
+"""Salary what-if simulations, computed in memory without writing anything.
+
+Each worker keeps employee salaries as compact NumPy arrays: a float64
+salary column plus small integer codes for department, position and status.
+They are loaded once and reloaded only when the ``employees`` data version
+changes (see :mod:`app.versioning`). A simulation applies a list of
+adjustment rules to a copy of the salary array with boolean masks and
+aggregates the result with ``bincount``/``percentile``, so scenarios over
+100k employees answer in milliseconds.
+
+Rules are applied in order; each may filter on ``department`` and/or
+``position`` and either raise salaries or freeze them::
+
+    [
+        {"department": "Engineering", "percent": 5},
+        {"department": "Sales", "freeze": true},
+        {"position": "Intern", "amount": 2000}
+    ]
+
+``percent`` and ``amount`` may be negative. A frozen employee is left
+unchanged by every later rule.
+"""
+import threading
+import numpy as np
+from app.models import db, Employee
+from app.versioning import get_versions
+from app.payroll_service import compute_components, load_rule_sets
+
+PERCENTILES = (0, 10, 25, 50, 75, 90, 100)
+HISTOGRAM_BINS = 10
+
+
+class SalarySnapshot:
+    """One immutable load of the salary columns; replaced whole, never mutated."""
+
+    def __init__(self, version, salary, department, position, active, departments, positions):
+        self.version = version
+        self.salary = salary
+        self.department = department
+        self.position = position
+        self.active = active
+        self.departments = departments
+        self.positions = positions
+
+    def code_of(self, kind, name):
+        """Integer code for a department/position name, or -1 if unknown."""
+        names = self.departments if kind == 'department' else self.positions
+        position = np.searchsorted(names, name)
+        return int(position) if position < len(names) and names[position] == name else -1
+
+
+class SalaryArrays:
+    """Columnar, per-worker copy of employee salary data.
+
+    Each reload builds a new :class:`SalarySnapshot` and publishes it with a
+    single attribute assignment, so a concurrent reader always sees arrays
+    from the same load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.snapshot = SalarySnapshot(None, np.zeros(0), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                                       np.zeros(0, dtype=bool), np.zeros(0, dtype=object), np.zeros(0, dtype=object))
+
+    def _load(self, version):
+        rows = db.session.query(Employee.salary, Employee.department, Employee.position, Employee.status).all()
+        departments, department = np.unique(np.array([row[1] or '' for row in rows], dtype=object),
+                                            return_inverse=True)
+        positions, position = np.unique(np.array([row[2] or '' for row in rows], dtype=object),
+                                        return_inverse=True)
+        return SalarySnapshot(
+            version,
+            salary=np.array([row[0] or 0 for row in rows], dtype=float),
+            department=department.astype(np.int32),
+            position=position.astype(np.int32),
+            active=np.array([row[3] == 'Active' for row in rows], dtype=bool),
+            departments=departments,
+            positions=positions
+        )
+
+    def ensure_current(self):
+        """Reload when the ``employees`` data version has moved; return the current snapshot."""
+        version = get_versions('employees')['employees']
+        snapshot = self.snapshot
+        if version == snapshot.version:
+            return snapshot
+        with self._lock:
+            if version != self.snapshot.version:
+                self.snapshot = self._load(version)
+            return self.snapshot
+
+
+salary_arrays = SalaryArrays()
+
+
+def validate_adjustments(rules):
+    """Check the adjustment list; raise ``ValueError`` describing the first problem."""
+    if not isinstance(rules, list):
+        raise ValueError('rules must be a list')
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise ValueError(f'Rule {index}: must be an object')
+        unknown = set(rule) - {'department', 'position', 'percent', 'amount', 'freeze'}
+        if unknown:
+            raise ValueError(f"Rule {index}: unknown keys {', '.join(sorted(unknown))}")
+        for key in ('department', 'position'):
+            if rule.get(key) is not None and not isinstance(rule[key], str):
+                raise ValueError(f'Rule {index}: {key} must be a string')
+        for key in ('percent', 'amount'):
+            value = rule.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f'Rule {index}: {key} must be a number')
+        if rule.get('percent') is not None and rule['percent'] <= -100:
+            raise ValueError(f'Rule {index}: percent must be greater than -100')
+        if not rule.get('freeze') and rule.get('percent') is None and rule.get('amount') is None:
+            raise ValueError(f'Rule {index}: needs percent, amount or freeze')
+    return rules
+
+
+def _summary(values):
+    if not len(values):
+        return {'mean': 0.0, 'percentiles': {f'p{p}': 0.0 for p in PERCENTILES}}
+    return {
+        'mean': round(float(values.mean()), 2),
+        'percentiles': {f'p{p}': round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    }
+
+
+def _histogram(current, new):
+    if not len(current):
+        return {'edges': [], 'current': [], 'new': []}
+    low = min(current.min(), new.min())
+    high = max(current.max(), new.max())
+    edges = np.linspace(low, high if high > low else low + 1, HISTOGRAM_BINS + 1)
+    return {
+        'edges': [round(float(edge), 2) for edge in edges],
+        'current': np.histogram(current, edges)[0].tolist(),
+        'new': np.histogram(new, edges)[0].tolist()
+    }
+
+
+def _totals(current, new):
+    current_total = float(current.sum())
+    new_total = float(new.sum())
+    return {
+        'current_total': round(current_total, 2),
+        'new_total': round(new_total, 2),
+        'delta': round(new_total - current_total, 2),
+        'delta_percent': round(100.0 * (new_total - current_total) / current_total, 2) if current_total else None
+    }
+
+
+def simulate(rules, active_only=True):
+    """Apply ``rules`` to current salaries and return totals, deltas and distributions."""
+    validate_adjustments(rules)
+    data = salary_arrays.ensure_current()
+
+    selected = data.active if active_only else np.ones(len(data.salary), dtype=bool)
+    current = data.salary[selected]
+    department = data.department[selected]
+    position = data.position[selected]
+    new = current.copy()
+    frozen = np.zeros(len(current), dtype=bool)
+
+    applied = []
+    for rule in rules:
+        mask = ~frozen
+        for kind, codes in (('department', department), ('position', position)):
+            if rule.get(kind) is not None:
+                mask &= codes == data.code_of(kind, rule[kind])
+        if rule.get('percent') is not None:
+            new[mask] *= 1 + rule['percent'] / 100
+        if rule.get('amount') is not None:
+            new[mask] += rule['amount']
+        if rule.get('freeze'):
+            frozen |= mask
+        applied.append({**rule, 'employees': int(mask.sum())})
+    new = np.maximum(new, 0)
+
+    # Per-department aggregates in one pass each
+    groups = len(data.departments)
+    counts = np.bincount(department, minlength=groups)
+    current_by_department = np.bincount(department, weights=current, minlength=groups)
+    new_by_department = np.bincount(department, weights=new, minlength=groups)
+    by_department = [
+        {'department': data.departments[code], 'employees': int(counts[code]),
+         **_totals(current_by_department[code:code + 1], new_by_department[code:code + 1])}
+        for code in np.flatnonzero(counts)
+    ]
+
+    # Monthly payroll cost under the stored payroll rules, before and after
+    department_names = data.departments[department]
+    rule_sets = load_rule_sets()
+    current_allowances, current_deductions = compute_components(current, department_names, rule_sets)
+    new_allowances, new_deductions = compute_components(new, department_names, rule_sets)
+
+    return {
+        'employees': int(len(current)),
+        'totals': _totals(current, new),
+        'net_payroll': _totals(current + current_allowances - current_deductions,
+                               new + new_allowances - new_deductions),
+        'by_department': by_department,
+        'distribution': {
+            'current': _summary(current),
+            'new': _summary(new),
+            'histogram': _histogram(current, new)
+        },
+        'rules': applied
+    }
@@ -0,0 +1,7 @@
+"""Server-Sent Events framing shared by the dashboard and AI streams."""
+import json
+
+
+def sse_frame(event_name, payload):
+    """One ``event:``/``data:`` frame with ``payload`` encoded as JSON."""
+    return f'event: {event_name}\ndata: {json.dumps(payload)}\n\n'
@@ -0,0 +1,405 @@
+"""Incrementally maintained dashboard statistics.
+
+Employee and Attendance writes adjust a small set of counter tables from
+SQLAlchemy mapper events, inside the same transaction as the write itself.
+The dashboard then reads its numbers by primary key instead of running
+COUNT/GROUP BY aggregates on every poll.
+
+Bulk ``Query.update()``/``Query.delete()`` calls and raw SQL bypass mapper
+events; run ``flask rebuild-stats`` after those to resynchronise.
+"""
+import threading
+import time
+from datetime import date
+from sqlalchemy import event, inspect, func, select, case
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import db, Employee, Attendance, StatsSnapshot, DepartmentStat, AttendanceDayStat
+from app.versioning import get_versions
+from app.sse import sse_frame
+
+SNAPSHOT_ID = 1
+
+_DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _previous(target, key):
+    """Return the value an attribute had before the current flush."""
+    history = inspect(target).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, key)
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Assigning to an expired attribute (e.g. after a commit) does not load the
+# old value; ask for it so _previous() can see what the counters hold
+for _attribute in (Employee.department, Employee.status, Attendance.employee_id, Attendance.date,
+                   Attendance.status):
+    event.listen(_attribute, 'set', _load_old_value, active_history=True)
+
+
+def _is_active(status):
+    return (status or 'Active') == 'Active'
+
+
+def _is_present(status):
+    return (status or 'Present') == 'Present'
+
+
+# ==================== COUNTER ADJUSTMENTS ====================
+def _add_counts(connection, table, keys, counts):
+    """Add ``counts`` to the counter row at ``keys``, creating it if missing.
+
+    Uses a single ``INSERT ... ON CONFLICT DO UPDATE`` so concurrent first
+    writes for the same key cannot both insert.
+    """
+    insert = _DIALECT_INSERTS.get(connection.dialect.name)
+    if insert is None:
+        key = [table.c[name] == value for name, value in keys.items()]
+        result = connection.execute(
+            table.update().where(*key).values({name: table.c[name] + delta for name, delta in counts.items()})
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values({**keys, **counts}))
+        return
+    statement = insert(table).values({**keys, **counts})
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: table.c[name] + statement.excluded[name] for name in counts}
+    ))
+
+
+def _set_counts(connection, table, key_names, rows):
+    """Write absolute counter values for ``rows`` (dicts), inserting or overwriting by ``key_names``."""
+    if not rows:
+        return
+    insert = _DIALECT_INSERTS.get(connection.dialect.name)
+    if insert is None:
+        for row in rows:
+            connection.execute(table.delete().where(*[table.c[name] == row[name] for name in key_names]))
+        connection.execute(table.insert(), rows)
+        return
+    statement = insert(table)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=key_names,
+        set_={name: statement.excluded[name] for name in rows[0] if name not in key_names}
+    ), rows)
+
+
+def _bump_department(connection, department, delta):
+    """Adjust one department's employee count, dropping it when it reaches zero."""
+    table = DepartmentStat.__table__
+    if delta > 0:
+        _add_counts(connection, table, {'department': department}, {'employee_count': delta})
+        return
+    connection.execute(
+        table.update()
+        .where(table.c.department == department)
+        .values(employee_count=table.c.employee_count + delta)
+    )
+    connection.execute(
+        table.delete().where(table.c.department == department, table.c.employee_count <= 0)
+    )
+
+
+def _bump_snapshot(connection, total=0, active=0):
+    """Adjust the employee totals and refresh the department count."""
+    table = StatsSnapshot.__table__
+    departments = select(func.count()).select_from(DepartmentStat.__table__).scalar_subquery()
+    result = connection.execute(
+        table.update()
+        .where(table.c.id == SNAPSHOT_ID)
+        .values(
+            total_employees=table.c.total_employees + total,
+            active_employees=table.c.active_employees + active,
+            departments=departments,
+        )
+    )
+    if result.rowcount == 0:
+        # Snapshot row missing (fresh table); the flushed rows are already
+        # visible to this connection, so a rebuild yields the right numbers.
+        _rebuild(connection)
+
+
+def _bump_day(connection, day, total=0, present=0):
+    """Adjust the attendance counters for a single date."""
+    table = AttendanceDayStat.__table__
+    if total > 0:
+        _add_counts(connection, table, {'date': day}, {'total': total, 'present': present})
+        return
+    connection.execute(
+        table.update()
+        .where(table.c.date == day)
+        .values(total=table.c.total + total, present=table.c.present + present)
+    )
+
+
+# ==================== ORM EVENT LISTENERS ====================
+@event.listens_for(Employee, 'after_insert')
+def _employee_inserted(mapper, connection, target):
+    _bump_department(connection, target.department, 1)
+    _bump_snapshot(connection, total=1, active=int(_is_active(target.status)))
+
+
+@event.listens_for(Employee, 'after_update')
+def _employee_updated(mapper, connection, target):
+    old_department = _previous(target, 'department')
+    was_active = _is_active(_previous(target, 'status'))
+    now_active = _is_active(target.status)
+
+    if old_department == target.department and was_active == now_active:
+        return
+
+    if old_department != target.department:
+        _bump_department(connection, old_department, -1)
+        _bump_department(connection, target.department, 1)
+    _bump_snapshot(connection, active=int(now_active) - int(was_active))
+
+
+@event.listens_for(Employee, 'after_delete')
+def _employee_deleted(mapper, connection, target):
+    _bump_department(connection, _previous(target, 'department'), -1)
+    _bump_snapshot(connection, total=-1, active=-int(_is_active(_previous(target, 'status'))))
+
+
+@event.listens_for(Attendance, 'after_insert')
+def _attendance_inserted(mapper, connection, target):
+    _bump_day(connection, target.date, total=1, present=int(_is_present(target.status)))
+
+
+@event.listens_for(Attendance, 'after_update')
+def _attendance_updated(mapper, connection, target):
+    old_date = _previous(target, 'date')
+    was_present = _is_present(_previous(target, 'status'))
+    now_present = _is_present(target.status)
+
+    if old_date != target.date:
+        _bump_day(connection, old_date, total=-1, present=-int(was_present))
+        _bump_day(connection, target.date, total=1, present=int(now_present))
+    elif was_present != now_present:
+        _bump_day(connection, target.date, present=int(now_present) - int(was_present))
+
+
+@event.listens_for(Attendance, 'after_delete')
+def _attendance_deleted(mapper, connection, target):
+    _bump_day(
+        connection,
+        _previous(target, 'date'),
+        total=-1,
+        present=-int(_is_present(_previous(target, 'status')))
+    )
+
+
+def record_bulk_employee_insert(connection, department_counts, active_count):
+    """Apply counters for employees inserted outside the ORM (e.g. CSV import).
+
+    ``department_counts`` maps department -> number of inserted employees.
+    """
+    for department, count in department_counts.items():
+        _bump_department(connection, department, count)
+    _bump_snapshot(connection, total=sum(department_counts.values()), active=active_count)
+
+
+def refresh_attendance_day(connection, day):
+    """Recompute one date's attendance counters (after bulk attendance writes).
+
+    The day's row is upserted first, which locks it until commit: concurrent
+    refreshes of the same day (and per-row writes bumping it) queue there,
+    so the counts read afterwards include everything committed before us.
+    """
+    att = Attendance.__table__
+    table = AttendanceDayStat.__table__
+    _add_counts(connection, table, {'date': day}, {'total': 0, 'present': 0})
+    total, present = connection.execute(
+        select(func.count(att.c.id), func.sum(case((att.c.status == 'Present', 1), else_=0)))
+        .where(att.c.date == day)
+    ).one()
+    if total:
+        _set_counts(connection, table, ['date'], [{'date': day, 'total': total, 'present': present or 0}])
+    else:
+        connection.execute(table.delete().where(table.c.date == day))
+
+
+# ==================== REBUILD & READ ====================
+def _rebuild(connection):
+    """Recompute every counter table from the source tables."""
+    emp = Employee.__table__
+    att = Attendance.__table__
+    snapshot = StatsSnapshot.__table__
+    dept = DepartmentStat.__table__
+    day = AttendanceDayStat.__table__
+
+    connection.execute(dept.delete())
+    connection.execute(dept.insert().from_select(
+        ['department', 'employee_count'],
+        select(emp.c.department, func.count(emp.c.id)).group_by(emp.c.department)
+    ))
+
+    connection.execute(day.delete())
+    connection.execute(day.insert().from_select(
+        ['date', 'total', 'present'],
+        select(
+            att.c.date,
+            func.count(att.c.id),
+            func.sum(case((att.c.status == 'Present', 1), else_=0))
+        ).group_by(att.c.date)
+    ))
+
+    total = connection.execute(select(func.count()).select_from(emp)).scalar()
+    active = connection.execute(select(func.count()).select_from(emp).where(emp.c.status == 'Active')).scalar()
+    departments = connection.execute(select(func.count()).select_from(dept)).scalar()
+
+    connection.execute(snapshot.delete())
+    connection.execute(snapshot.insert().values(
+        id=SNAPSHOT_ID,
+        total_employees=total,
+        active_employees=active,
+        departments=departments
+    ))
+    return {'total_employees': total, 'active_employees': active, 'departments': departments}
+
+
+def rebuild_stats():
+    """Rebuild all dashboard counters in the current session's transaction.
+
+    The caller is responsible for committing.
+    """
+    return _rebuild(db.session.connection())
+
+
+def ensure_stats_snapshot():
+    """Build the snapshot on first start (e.g. after the tables were created)."""
+    if db.session.get(StatsSnapshot, SNAPSHOT_ID) is None:
+        rebuild_stats()
+        db.session.commit()
+
+
+def get_dashboard_stats(day=None):
+    """Return dashboard counters using primary-key reads only."""
+    day = day or date.today()
+    snapshot = db.session.get(StatsSnapshot, SNAPSHOT_ID)
+    if snapshot is None:
+        ensure_stats_snapshot()
+        snapshot = db.session.get(StatsSnapshot, SNAPSHOT_ID)
+    day_stat = db.session.get(AttendanceDayStat, day)
+
+    return {
+        'total_employees': snapshot.total_employees,
+        'active_employees': snapshot.active_employees,
+        'departments': snapshot.departments,
+        'today_attendance': day_stat.present if day_stat else 0,
+        'today_records': day_stat.total if day_stat else 0
+    }
+
+
+def get_department_breakdown():
+    """Return ``(department, employee_count)`` pairs for the dashboard table."""
+    rows = DepartmentStat.query.order_by(DepartmentStat.department).all()
+    return [(row.department, row.employee_count) for row in rows]
+
+
+# ==================== LIVE STREAM ====================
+class StatsBroadcaster:
+    """Per-process watcher that fans dashboard stats out to every open stream.
+
+    One background thread checks the ``employees``/``attendance`` data
+    versions once per interval and recomputes the stats only when they (or
+    the date) change, so the database load does not grow with the number
+    of open dashboards. The thread runs while at least one stream is
+    subscribed. At most ``max_clients`` streams are admitted per process,
+    so streams cannot take every request thread of a worker.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._subscribers = 0
+        self._thread = None
+        self.stats = None
+        self.sequence = 0  # incremented whenever ``stats`` changes
+
+    def subscribe(self, app, interval, max_clients):
+        """Admit one stream; False when this process already serves ``max_clients``."""
+        with self._condition:
+            if self._subscribers >= max_clients:
+                return False
+            self._subscribers += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._watch, args=(app, interval),
+                                                name='stats-broadcaster', daemon=True)
+                self._thread.start()
+            return True
+
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    @property
+    def subscribers(self):
+        with self._condition:
+            return self._subscribers
+
+    def wait(self, sequence, timeout):
+        """Block until stats newer than ``sequence`` exist or ``timeout`` passes; return ``(sequence, stats)``."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence != sequence, timeout)
+            return self.sequence, self.stats
+
+    def _watch(self, app, interval):
+        last_key = None
+        while True:
+            with self._condition:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                with app.app_context():
+                    versions = get_versions('employees', 'attendance')
+                    key = (versions['employees'], versions['attendance'], date.today())
+                    if key != last_key:
+                        stats = get_dashboard_stats()
+                        last_key = key
+                        with self._condition:
+                            if stats != self.stats:
+                                self.stats = stats
+                                self.sequence += 1
+                                self._condition.notify_all()
+            except Exception as e:
+                app.logger.warning('Dashboard stats watcher failed: %s', e)
+            time.sleep(interval)
+
+
+stats_broadcaster = StatsBroadcaster()
+
+
+def iter_stats_events(broadcaster, interval=2.0, heartbeat=15.0, max_seconds=300.0):
+    """Yield Server-Sent Event frames carrying dashboard stats from ``broadcaster``.
+
+    A frame is sent as soon as stats are available and afterwards whenever
+    the broadcaster publishes new ones; writes within one watcher interval
+    collapse into a single frame. A comment line is sent every
+    ``heartbeat`` seconds to keep proxies from closing an idle connection.
+    The stream ends after ``max_seconds`` so the browser reconnects and no
+    worker thread is held indefinitely.
+    """
+    started = time.monotonic()
+    sequence = 0
+
+    # Ask EventSource to reconnect shortly after we close the stream
+    yield f'retry: {int(interval * 1000)}\n\n'
+
+    while True:
+        remaining = max_seconds - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        latest, stats = broadcaster.wait(sequence, min(heartbeat, remaining))
+        if latest != sequence:
+            sequence = latest
+            yield sse_frame('stats', stats)
+        elif remaining > heartbeat:
+            yield ': keep-alive\n\n'
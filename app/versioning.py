@@ -0,0 +1,112 @@
+"""Per-table data versions and conditional (ETag) responses for JSON APIs.
+
+Every commit that writes ORM objects bumps the version of the tables it
+touched, once per commit, inside the same transaction. Read endpoints derive
+a strong ETag from the versions of the tables they depend on, so a client
+holding current data gets ``304 Not Modified`` before any aggregate query runs.
+
+Writes that bypass the ORM unit of work (``Query.update()``, Core
+``insert()``/``update()``) must call :func:`mark_changed` so dependent
+ETags change as well.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+from flask import request, make_response
+from sqlalchemy import event
+from app.models import db, DataVersion
+
+_PENDING_KEY = 'changed_tables'
+
+
+def mark_changed(session, *table_names):
+    """Record tables written outside the ORM so the next commit bumps them."""
+    session.info.setdefault(_PENDING_KEY, set()).update(table_names)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_tables(session, flush_context):
+    changed = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None and table.name != DataVersion.__tablename__:
+            changed.add(table.name)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _bump_versions(session):
+    # Flush first so objects still pending at commit time are accounted for
+    session.flush()
+    changed = session.info.pop(_PENDING_KEY, None)
+    if not changed:
+        return
+
+    table = DataVersion.__table__
+    connection = session.connection()
+    now = datetime.utcnow()
+    for name in sorted(changed):
+        result = connection.execute(
+            table.update()
+            .where(table.c.table_name == name)
+            .values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(table_name=name, version=1, updated_at=now))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changed_tables(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def ensure_data_versions(*table_names):
+    """Create version rows up front so concurrent first writes only UPDATE."""
+    existing = {row.table_name for row in DataVersion.query.all()}
+    for name in table_names:
+        if name not in existing:
+            db.session.add(DataVersion(table_name=name, version=0))
+    db.session.commit()
+
+
+def get_versions(*table_names):
+    """Return ``{table_name: version}`` with a single query."""
+    rows = db.session.query(DataVersion.table_name, DataVersion.version).filter(
+        DataVersion.table_name.in_(table_names)
+    ).all()
+    versions = {name: 0 for name in table_names}
+    versions.update({name: version for name, version in rows})
+    return versions
+
+
+def compute_etag(*table_names, extra=None):
+    """Build a strong ETag from table versions, the request URL and ``extra``."""
+    versions = get_versions(*table_names)
+    parts = [request.path, request.query_string.decode('utf-8', 'replace')]
+    parts.extend(f'{name}:{versions[name]}' for name in table_names)
+    if extra is not None:
+        parts.append(str(extra))
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def versioned_json(*table_names, extra=None):
+    """Decorator for JSON views whose payload depends only on ``table_names``.
+
+    ``extra`` is an optional callable returning anything else the payload
+    depends on (e.g. today's date). When the client's ``If-None-Match``
+    matches, the view is not called at all.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = compute_etag(*table_names, extra=extra() if extra else None)
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
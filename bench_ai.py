@@ -0,0 +1,295 @@
+"""Benchmark the /api/ai/* endpoints offline against the OpenRouter stub.
+
+Starts :mod:`openrouter_stub` in a background thread (or uses ``--upstream``),
+builds a throwaway SQLite database with synthetic employees and drives each
+scenario through the Flask app with ``--concurrency`` client threads. Every
+client thread stands in for one gunicorn worker thread. Each scenario starts
+with empty AI tables (response cache, stored insights, breaker state), so
+repeated targets within a run show the effect of caching and coalescing.
+
+Reported per scenario:
+
+* latency p50/p95/p99 of complete responses, plus time to the first
+  token for the streaming endpoints
+* throughput (completed requests per second) and HTTP statuses
+* worker saturation - mean and peak share of client threads busy with a
+  request, sampled every 10 ms
+* upstream calls made and peak upstream concurrency (from the stub), and
+  the peak backlog of the app's shared OpenRouter thread pool
+
+Usage:
+    python bench_ai.py [--concurrency 16] [--requests 200] [--targets 20] [--scenarios salary,department-stream]
+    python bench_ai.py --latency uniform:0.2,2 --error-rate 0.1
+
+See ``python bench_ai.py --help`` for the stub options (latency
+distribution, error and hang rates, streaming speed).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from openrouter_stub import add_stub_arguments, stub_config, start_stub
+
+SCENARIOS = {
+    'salary': '/api/ai/salary-recommendation/{employee_id}',
+    'performance': '/api/ai/performance-insight/{employee_id}',
+    'attendance': '/api/ai/attendance-analysis/{employee_id}',
+    'department': '/api/ai/department-insights/{department}',
+    'employee-insights': '/api/ai/employee-insights/{employee_id}',
+    'salary-stream': '/api/ai/salary-recommendation/{employee_id}/stream',
+    'department-stream': '/api/ai/department-insights/{department}/stream',
+    'employee-insights-stream': '/api/ai/employee-insights/{employee_id}/stream',
+}
+DEFAULT_SCENARIOS = 'salary,department,employee-insights,salary-stream,employee-insights-stream'
+DEPARTMENTS = ['Engineering', 'Product', 'Design', 'Sales', 'HR', 'Finance', 'Operations']
+POSITIONS = ['Software Engineer', 'Product Manager', 'Designer', 'Sales Executive', 'HR Specialist', 'Accountant']
+SAMPLE_SECONDS = 0.01
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the AI endpoints against a local OpenRouter stub')
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads (default: 16)')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario (default: 200)')
+    parser.add_argument('--employees', type=int, default=200, help='synthetic employees (default: 200)')
+    parser.add_argument('--targets', type=int, default=None,
+                        help='distinct employees/departments requested per scenario (default: all)')
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS,
+                        help=f'comma-separated, from: {", ".join(SCENARIOS)} (default: {DEFAULT_SCENARIOS})')
+    parser.add_argument('--upstream', default=None,
+                        help='base URL of an already running stub instead of starting one')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios.split(',') if name not in SCENARIOS]
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(unknown)}')
+    return args
+
+
+def populate(n, rng):
+    """Insert ``n`` active employees with 30 days of attendance; returns their ids."""
+    from app import db
+    from app.models import Employee, Attendance
+    from app.attendance_map_service import rebuild_attendance_maps
+    from app.analytics_service import rebuild_rollup
+
+    rows = [{
+        'name': f'Bench Employee {i}',
+        'email': f'bench.employee{i}@example.com',
+        'phone': None,
+        'department': DEPARTMENTS[i % len(DEPARTMENTS)],
+        'position': rng.choice(POSITIONS),
+        'salary': rng.randint(3000, 15000),
+        'joining_date': datetime(2018, 1, 1) + timedelta(days=rng.randint(0, 2000)),
+        'status': 'Active',
+    } for i in range(n)]
+    db.session.execute(Employee.__table__.insert(), rows)
+    ids = [employee_id for (employee_id,) in db.session.query(Employee.id).order_by(Employee.id)]
+
+    statuses = ['Present'] * 8 + ['Absent', 'Late']
+    today = date.today()
+    attendance = [{
+        'employee_id': employee_id,
+        'date': today - timedelta(days=day),
+        'status': rng.choice(statuses),
+    } for employee_id in ids for day in range(1, 31)]
+    for start in range(0, len(attendance), 10_000):
+        db.session.execute(Attendance.__table__.insert(), attendance[start:start + 10_000])
+    # Bulk inserts bypass the ORM listeners; rebuild the derived tables the AI prompts read
+    rebuild_rollup()
+    rebuild_attendance_maps()
+    db.session.commit()
+    return ids
+
+
+def reset_ai_state():
+    from app import db
+    from app.models import AIResponseCache, AIInsight, AIInFlight, AICircuitBreaker, AICircuitBucket
+    with db.engine.begin() as connection:
+        for model in (AIResponseCache, AIInsight, AIInFlight, AICircuitBreaker, AICircuitBucket):
+            connection.execute(model.__table__.delete())
+
+
+def make_client(app, admin_id):
+    client = app.test_client()
+    client.environ_base['wsgi.url_scheme'] = 'https'  # session cookies are Secure in production
+    with client.session_transaction() as session:
+        session['admin_id'] = admin_id
+    return client
+
+
+class Sampler(threading.Thread):
+    """Samples busy client threads and the shared pool backlog while a scenario runs."""
+
+    def __init__(self, concurrency):
+        super().__init__(daemon=True)
+        self.concurrency = concurrency
+        self.busy = 0
+        self.busy_lock = threading.Lock()
+        self.samples = []
+        self.backlog = []
+        self.stopped = threading.Event()
+
+    def enter(self):
+        with self.busy_lock:
+            self.busy += 1
+
+    def leave(self):
+        with self.busy_lock:
+            self.busy -= 1
+
+    def run(self):
+        import app.ai_service as ai_service
+        while not self.stopped.wait(SAMPLE_SECONDS):
+            self.samples.append(self.busy / self.concurrency)
+            executor = ai_service._executor
+            self.backlog.append(executor._work_queue.qsize() if executor is not None else 0)
+
+
+def run_scenario(app, admin_id, name, targets, args, stub_stats):
+    template = SCENARIOS[name]
+    streaming = name.endswith('-stream')
+    reset_ai_state()
+    if stub_stats is not None:
+        stub_stats.reset()
+
+    rng = random.Random(name)
+    plan = [rng.choice(targets) for _ in range(args.requests)]
+    plan_lock = threading.Lock()
+    latencies, first_tokens, statuses = [], [], Counter()
+    results_lock = threading.Lock()
+    sampler = Sampler(args.concurrency)
+
+    def worker():
+        client = make_client(app, admin_id)
+        while True:
+            with plan_lock:
+                if not plan:
+                    return
+                employee_id, department = plan.pop()
+            path = template.format(employee_id=employee_id, department=department)
+            sampler.enter()
+            started = time.perf_counter()
+            first_token = None
+            try:
+                response = client.get(path, buffered=not streaming)
+                if streaming and response.mimetype == 'text/event-stream':
+                    for chunk in response.iter_encoded():
+                        if first_token is None and b'event: token' in chunk:
+                            first_token = time.perf_counter() - started
+                    response.close()
+                else:
+                    response.get_data()
+                status = response.status_code
+            except Exception as e:
+                print(f'  request failed: {e}')
+                status = 'exception'
+            finally:
+                sampler.leave()
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+                if first_token is not None:
+                    first_tokens.append(first_token)
+
+    threads = [threading.Thread(target=worker, name=f'bench-{index}') for index in range(args.concurrency)]
+    sampler.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    sampler.stopped.set()
+    sampler.join()
+
+    upstream = stub_stats.to_dict() if stub_stats is not None else {}
+    return {
+        'name': name,
+        'requests': len(latencies),
+        'statuses': statuses,
+        'wall': wall,
+        'latency': np.percentile(latencies, [50, 95, 99]) * 1000 if latencies else None,
+        'first_token': np.percentile(first_tokens, [50, 95, 99]) * 1000 if first_tokens else None,
+        'busy_mean': float(np.mean(sampler.samples)) if sampler.samples else 0.0,
+        'busy_peak': max(sampler.samples, default=0.0),
+        'backlog_peak': max(sampler.backlog, default=0),
+        'upstream_calls': upstream.get('requests'),
+        'upstream_peak': upstream.get('peak_in_flight'),
+    }
+
+
+def report(results):
+    header = (f'{"scenario":<26}{"reqs":>6}{"req/s":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+              f'{"ttft p50":>10}{"busy avg":>10}{"busy max":>10}{"upstream":>10}{"up peak":>9}{"backlog":>9}  statuses')
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        p50, p95, p99 = result['latency'] if result['latency'] is not None else (0, 0, 0)
+        ttft = f'{result["first_token"][0]:.0f}' if result['first_token'] is not None else '-'
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(result['statuses'].items(), key=str))
+        upstream = result['upstream_calls'] if result['upstream_calls'] is not None else '-'
+        upstream_peak = result['upstream_peak'] if result['upstream_peak'] is not None else '-'
+        print(f'{result["name"]:<26}{result["requests"]:>6}{result["requests"] / result["wall"]:>8.1f}'
+              f'{p50:>9.0f}{p95:>9.0f}{p99:>9.0f}{ttft:>10}'
+              f'{result["busy_mean"]:>9.0%}{result["busy_peak"]:>10.0%}'
+              f'{upstream:>10}{upstream_peak:>9}{result["backlog_peak"]:>9}  {statuses}')
+    print('\nbusy = share of client threads (stand-ins for worker threads) inside a request; '
+          'upstream = calls that reached the stub; backlog = peak queued tasks in the shared OpenRouter pool.')
+
+
+def main():
+    args = parse_args()
+    stub_stats = None
+    if args.upstream:
+        base_url = args.upstream
+    else:
+        try:
+            config = stub_config(args)
+        except ValueError as e:
+            sys.exit(str(e))
+        server, base_url = start_stub(config)
+        stub_stats = server.stats
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmpdir}/bench_ai.db'
+    os.environ['OPENROUTER_API_KEY'] = 'stub'
+    os.environ['OPENROUTER_BASE_URL'] = base_url
+
+    from app import create_app, db
+    from app.models import Admin, Employee
+
+    app = create_app('production')
+    rng = random.Random(42)
+    with app.app_context():
+        started = time.perf_counter()
+        ids = populate(args.employees, rng)
+        admin = Admin(email='bench@example.com', username='bench')
+        admin.set_password('bench')
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+        departments = dict(db.session.query(Employee.id, Employee.department))
+        print(f'Inserted {len(ids):,} employees in {time.perf_counter() - started:.1f}s; upstream {base_url}')
+
+    targets = [(employee_id, departments[employee_id]) for employee_id in ids[:args.targets or len(ids)]]
+    print(f'{args.requests} requests per scenario, {args.concurrency} client threads, '
+          f'{len(targets)} distinct employees, {len({department for _, department in targets})} departments\n')
+
+    results = []
+    for name in args.scenarios.split(','):
+        with app.app_context():
+            results.append(run_scenario(app, admin_id, name, targets, args, stub_stats))
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
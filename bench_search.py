@@ -0,0 +1,113 @@
+"""Benchmark employee search: ILIKE table scan vs the search index.
+
+Builds a throwaway SQLite database with 100k synthetic employees (or the
+count given as the first argument), then times the employee-list query for
+a handful of search terms both ways: the original ``ilike('%term%')``
+filter and the indexed ``search_subquery`` join. Each measurement runs the
+same work as one page of ``list_employees`` (COUNT + first 10 rows).
+
+Usage:
+    python bench_search.py [employees] [repeats]
+
+To benchmark PostgreSQL instead, set BENCH_DATABASE_URL to an empty
+scratch database - the script drops and recreates its tables.
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime
+
+N_EMPLOYEES = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+REPEATS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+_tmpdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or f'sqlite:///{_tmpdir}/bench_search.db'
+os.environ.pop('OPENROUTER_API_KEY', None)
+
+from sqlalchemy import or_
+from app import create_app, db
+from app.models import Employee
+from app.search_service import search_subquery
+
+FIRST = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William', 'Elizabeth',
+         'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+         'Priya', 'Arjun', 'Wei', 'Mei', 'Omar', 'Fatima', 'Carlos', 'Sofia', 'Ivan', 'Olga']
+LAST = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+        'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+        'Sharma', 'Patel', 'Chen', 'Wang', 'Haddad', 'Khan', 'Silva', 'Costa', 'Petrov', 'Ivanova']
+POSITIONS = ['Software Engineer', 'Senior Engineer', 'Product Manager', 'Designer', 'Data Analyst',
+             'Sales Executive', 'Account Manager', 'HR Specialist', 'Recruiter', 'Accountant']
+DEPARTMENTS = ['Engineering', 'Product', 'Design', 'Sales', 'HR', 'Finance', 'Operations']
+TERMS = ['smith', 'priya sharma', 'engineer', 'employee123', 'petrvo']
+
+
+def populate(n):
+    rng = random.Random(42)
+    rows = []
+    for i in range(n):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        rows.append({
+            'name': f'{first} {last}',
+            'email': f'{first.lower()}.{last.lower()}.employee{i}@example.com',
+            'phone': None,
+            'department': rng.choice(DEPARTMENTS),
+            'position': rng.choice(POSITIONS),
+            'salary': rng.randint(3000, 15000),
+            'joining_date': datetime(2020, 1, 1),
+            'status': 'Active',
+        })
+    for start in range(0, n, 10_000):
+        db.session.execute(Employee.__table__.insert(), rows[start:start + 10_000])
+    db.session.commit()
+
+
+def page_scan(term):
+    query = Employee.query.filter(or_(
+        Employee.name.ilike(f'%{term}%'),
+        Employee.email.ilike(f'%{term}%'),
+        Employee.position.ilike(f'%{term}%')
+    )).order_by(Employee.name)
+    return query.paginate(page=1, per_page=10, error_out=False)
+
+
+def page_index(term):
+    match = search_subquery(term)
+    if match is None:
+        return page_scan(term)
+    query = Employee.query.join(match, match.c.id == Employee.id).order_by(match.c.score.desc(), Employee.name)
+    return query.paginate(page=1, per_page=10, error_out=False)
+
+
+def best_of(fn, term):
+    timings = []
+    for _ in range(REPEATS):
+        db.session.expire_all()
+        started = time.perf_counter()
+        result = fn(term)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, result.total
+
+
+def main():
+    app = create_app('production')
+    with app.app_context(), app.test_request_context():
+        if os.environ.get('BENCH_DATABASE_URL'):
+            db.drop_all()
+            db.create_all()
+        print(f'Search backend: {app.extensions.get("employee_search") or "none (ILIKE fallback)"}')
+        started = time.perf_counter()
+        populate(N_EMPLOYEES)
+        print(f'Inserted {N_EMPLOYEES:,} employees in {time.perf_counter() - started:.1f}s\n')
+
+        print(f'{"term":<16}{"scan ms":>10}{"hits":>8}{"index ms":>10}{"hits":>8}{"speedup":>9}')
+        for term in TERMS:
+            scan_ms, scan_hits = best_of(page_scan, term)
+            index_ms, index_hits = best_of(page_index, term)
+            print(f'{term:<16}{scan_ms:>10.1f}{scan_hits:>8}{index_ms:>10.1f}{index_hits:>8}{scan_ms / index_ms:>8.1f}x')
+        print('\nA term with 0 scan hits but index hits was answered by fuzzy (typo-tolerant) matching.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""Local stand-in for the OpenRouter chat-completions API.
+
+Answers ``POST <prefix>/chat/completions`` with deterministic text after a
+configurable delay, so the AI paths can be exercised and load-tested
+without an API key or network access:
+
+* **latency** - drawn per request from a distribution (see
+  :func:`parse_latency`), e.g. ``lognormal:0.8,0.5`` or ``uniform:0.2,1.5``.
+* **errors** - a share of requests (``--error-rate``) fails with one of
+  ``--error-statuses``; 429 and 503 carry a ``Retry-After`` header.
+  ``--hang-rate`` requests never answer (the client read timeout fires).
+* **streaming** - ``"stream": true`` requests receive Server-Sent Events
+  chunks, one word every ``--token-delay`` seconds, then ``data: [DONE]``.
+  The latency is then the time to the first token.
+
+Batched prompts (``### Request <n>`` sections, see
+:mod:`app.ai_batch_service`) are answered with the JSON array the batch
+parser expects. ``GET /stats`` returns request counters.
+
+Usage:
+    python openrouter_stub.py [--port 8099] [--latency lognormal:0.8,0.5] [--error-rate 0.02]
+
+then point the app at it::
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:8099/api/v1 OPENROUTER_API_KEY=stub flask --app wsgi run
+
+:func:`start_stub` runs the same server in a background thread (used by
+``bench_ai.py``).
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ('team', 'attendance', 'salary', 'market', 'performance', 'consistent', 'review', 'growth',
+         'recommend', 'quarter', 'department', 'trend', 'stable', 'improve', 'benchmark', 'retention')
+RETRY_AFTER_STATUSES = {429, 503}
+_REQUEST = re.compile(r'^### Request (\d+)$', re.MULTILINE)
+
+
+def parse_latency(spec):
+    """Return a function drawing one latency (seconds) from ``spec``.
+
+    ``fixed:S``, ``uniform:LOW,HIGH``, ``normal:MEAN,STDDEV``,
+    ``lognormal:MEDIAN,SIGMA`` or ``exponential:MEAN``; negative draws are
+    clamped to zero.
+    """
+    name, _, args = spec.partition(':')
+    try:
+        values = [float(value) for value in args.split(',')] if args else []
+    except ValueError:
+        raise ValueError(f'Invalid latency parameters: {spec}')
+    distributions = {
+        'fixed': (1, lambda rng, seconds: seconds),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'normal': (2, lambda rng, mean, stddev: rng.gauss(mean, stddev)),
+        'lognormal': (2, lambda rng, median, sigma: median * rng.lognormvariate(0, sigma)),
+        'exponential': (1, lambda rng, mean: rng.expovariate(1 / mean) if mean > 0 else 0),
+    }
+    if name not in distributions or len(values) != distributions[name][0]:
+        raise ValueError(f'Unknown latency distribution: {spec} '
+                         f'(use fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, lognormal:MEDIAN,SIGMA or exponential:MEAN)')
+    draw = distributions[name][1]
+    return lambda rng: max(0.0, draw(rng, *values))
+
+
+class StubConfig:
+    """Behaviour of the stub server; attributes may be changed while it runs."""
+
+    def __init__(self, latency='lognormal:0.8,0.5', error_rate=0.0, error_statuses=(500, 502, 503, 429),
+                 hang_rate=0.0, token_delay=0.02, chars=400, seed=None):
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.hang_rate = hang_rate
+        self.token_delay = token_delay
+        self.chars = chars
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """``(latency, error_status or None, hang)`` for one request."""
+        with self.lock:
+            latency = self.latency(self.rng)
+            roll = self.rng.random()
+            status = self.rng.choice(self.error_statuses) if roll < self.error_rate else None
+            hang = status is None and roll < self.error_rate + self.hang_rate
+        return latency, status, hang
+
+
+class StubStats:
+    """Request counters, including the peak number of requests in flight."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.streams = 0
+            self.errors = 0
+            self.hangs = 0
+            self.in_flight = 0
+            self.peak_in_flight = 0
+
+    def begin(self, stream):
+        with self.lock:
+            self.requests += 1
+            self.streams += 1 if stream else 0
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'streams': self.streams,
+                'errors': self.errors,
+                'hangs': self.hangs,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight
+            }
+
+
+def answer_text(prompt, chars):
+    """Deterministic answer of about ``chars`` characters for ``prompt``."""
+    seed = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    text = ' '.join(words)
+    if len(text) > chars:
+        text = text[:chars].rsplit(' ', 1)[0]
+    return text.capitalize() + '.'
+
+
+def completion_text(messages, chars):
+    """The answer to a chat request: a JSON array for batched prompts, plain text otherwise."""
+    prompt = messages[-1].get('content', '') if messages else ''
+    numbers = _REQUEST.findall(prompt)
+    if not numbers:
+        return answer_text(prompt, chars)
+    sections = _REQUEST.split(prompt)[1:]
+    answers = [{'id': int(number), 'answer': answer_text(body, min(chars, 300))}
+               for number, body in zip(sections[::2], sections[1::2])]
+    return json.dumps(answers)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None  # set on the per-server subclass
+    stats = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            self._send_json(200, self.stats.to_dict())
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON'}})
+            return
+
+        stream = bool(payload.get('stream'))
+        latency, status, hang = self.config.draw()
+        self.stats.begin(stream)
+        try:
+            if hang:
+                with self.stats.lock:
+                    self.stats.hangs += 1
+                time.sleep(3600)
+                return
+            time.sleep(latency)
+            if status is not None:
+                with self.stats.lock:
+                    self.stats.errors += 1
+                headers = {'Retry-After': '1'} if status in RETRY_AFTER_STATUSES else None
+                self._send_json(status, {'error': {'code': status, 'message': 'Stubbed upstream error'}}, headers)
+                return
+
+            text = completion_text(payload.get('messages') or [], self.config.chars)
+            if stream:
+                self._stream(payload, text)
+            else:
+                self._send_json(200, {
+                    'id': f'stub-{self.stats.requests}',
+                    'object': 'chat.completion',
+                    'model': payload.get('model', 'stub'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                                 'finish_reason': 'stop'}]
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (timeout or truncated stream)
+        finally:
+            self.stats.end()
+
+    def _stream(self, payload, text):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        self.wfile.write(b': OPENROUTER PROCESSING\n\n')
+        for index, word in enumerate(text.split(' ')):
+            chunk = {
+                'object': 'chat.completion.chunk',
+                'model': payload.get('model', 'stub'),
+                'choices': [{'index': 0, 'delta': {'content': word if index == 0 else ' ' + word}}]
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+            if self.config.token_delay:
+                time.sleep(self.config.token_delay)
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+
+def start_stub(config=None, host='127.0.0.1', port=0):
+    """Start a stub server in a daemon thread; returns ``(server, base_url)``.
+
+    ``server.stats`` holds the :class:`StubStats` and ``server.config`` the
+    :class:`StubConfig`. Call ``server.shutdown()`` to stop it.
+    """
+    config = config or StubConfig()
+    handler = type('BoundStubHandler', (StubHandler,), {'config': config, 'stats': StubStats()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.config, server.stats = config, handler.stats
+    threading.Thread(target=server.serve_forever, name='openrouter-stub', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}/api/v1'
+
+
+def add_stub_arguments(parser):
+    parser.add_argument('--latency', default='lognormal:0.8,0.5',
+                        help='upstream latency distribution (default: lognormal:0.8,0.5)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with an error')
+    parser.add_argument('--error-statuses', default='500,502,503,429',
+                        help='comma-separated statuses used for errors (default: 500,502,503,429)')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='share of requests that never answer')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='seconds between streamed words')
+    parser.add_argument('--chars', type=int, default=400, help='length of generated answers')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for reproducible runs')
+
+
+def stub_config(args):
+    return StubConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_statuses.split(',') if status],
+        hang_rate=args.hang_rate,
+        token_delay=args.token_delay,
+        chars=args.chars,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenRouter chat-completions stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    try:
+        config = stub_config(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    server, base_url = start_stub(config, args.host, args.port)
+    print(f'OpenRouter stub listening on {base_url} (latency {args.latency}, error rate {args.error_rate})')
+    print(f'  OPENROUTER_BASE_URL={base_url} OPENROUTER_API_KEY=stub')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
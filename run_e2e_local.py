@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from app import create_app, db
-from app.models import Employee, Attendance
+from app.models import Admin, Employee, Attendance
 from datetime import date
 import re
 
@@ -20,6 +20,10 @@ def find_employee_id_from_list(html, name):
     # Try patterns to find /employees/<id> near the employee name
     # Look for a link with the employee name or an href preceding the name
     m = re.search(rf"/employees/(\d+)[^>]*>\s*{re.escape(name)}", html)
+    if m:
+        return int(m.group(1))
+    # The list renders the name first and the action links later in the same table row
+    m = re.search(rf"{re.escape(name)}</strong>(?:(?!</tr>).)*?/employees/(\d+)", html, re.S)
     if m:
         return int(m.group(1))
     # fallback: find all ids and choose one where the name appears within 200 chars
@@ -37,7 +41,22 @@ def find_employee_id_from_list(html, name):
 def run_tests():
     try:
         app = create_app(APP_CONFIG)
+        with app.app_context():
+            # Every page requires a logged-in admin
+            admin = Admin.query.filter_by(email='e2e_local@example.com').first()
+            if not admin:
+                admin = Admin(email='e2e_local@example.com', username='e2e_local', full_name='E2E Local', is_active=True)
+                admin.set_password('e2e_local')
+                db.session.add(admin)
+                db.session.commit()
+            admin_id = admin.id
+
         with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['admin_id'] = admin_id
+                sess['admin_email'] = 'e2e_local@example.com'
+                sess['admin_username'] = 'e2e_local'
+
             print('1) GET /employees/ (list)')
             r = client.get('/employees/')
             print(' status', r.status_code)
@@ -0,0 +1,43 @@
+"""Shared fixtures: an application on the ``testing`` config (in-memory SQLite)."""
+import itertools
+import os
+import unittest
+from datetime import datetime
+
+os.environ.pop('OPENROUTER_API_KEY', None)  # never call the real upstream from tests
+
+from app import create_app, db
+from app.models import Employee
+
+_serial = itertools.count(1)
+
+
+class AppTestCase(unittest.TestCase):
+    """Runs each test class against a fresh in-memory database inside an app context."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app('testing')
+        cls.context = cls.app.app_context()
+        cls.context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        cls.context.pop()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def add_employees(self, count, department='Engineering', status='Active', salary=30000):
+        """Insert ``count`` employees through the ORM (so the write listeners run) and return them."""
+        employees = []
+        for _ in range(count):
+            serial = next(_serial)
+            employees.append(Employee(
+                name=f'Employee {serial}', email=f'employee{serial}@example.com', department=department,
+                position='Engineer', salary=salary, status=status, joining_date=datetime(2020, 1, 1)
+            ))
+        db.session.add_all(employees)
+        db.session.commit()
+        return employees
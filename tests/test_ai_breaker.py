@@ -0,0 +1,100 @@
+"""Circuit breaker state transitions: closed -> open -> half-open -> closed/open."""
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app.models import db, AICircuitBreaker
+from app.ai_breaker_service import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from tests.base import AppTestCase
+
+
+class CircuitBreakerTest(AppTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.app.config.update(
+            AI_BREAKER_WINDOW_SECONDS=60,
+            AI_BREAKER_MIN_CALLS=4,
+            AI_BREAKER_FAILURE_RATE=0.5,
+            AI_BREAKER_SLOW_SECONDS=10,
+            AI_BREAKER_COOLDOWN_SECONDS=30,
+            AI_BREAKER_PROBE_SECONDS=40,
+        )
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(self.id())
+
+    def _calls(self, *outcomes):
+        """Make calls through the breaker; each outcome is ``(ok, seconds)``."""
+        for ok, seconds in outcomes:
+            probe = self.breaker.before_call()
+            self.breaker.record(probe, ok, seconds)
+
+    def _state(self):
+        return self.breaker.status()['state']
+
+    def _expire(self, column):
+        table = AICircuitBreaker.__table__
+        with db.engine.begin() as connection:
+            connection.execute(update(table).where(table.c.name == self.breaker.name)
+                               .values({column: datetime.utcnow() - timedelta(seconds=1)}))
+
+    def _open(self):
+        self._calls(*[(False, 0.1)] * 4)
+        self.assertEqual(self._state(), OPEN)
+
+    def test_stays_closed_below_min_calls_and_rate(self):
+        self._calls((False, 0.1), (False, 0.1), (False, 0.1))
+        self.assertEqual(self._state(), CLOSED)  # three calls: below the minimum
+
+        self.breaker = CircuitBreaker(self.id() + '-rate')
+        self._calls(*[(True, 0.1)] * 4, (False, 0.1), (False, 0.1), (False, 0.1))
+        self.assertEqual(self._state(), CLOSED)  # 3 of 7 bad: below the rate
+        self.assertEqual(self.breaker.status()['window']['calls'], 7)
+
+    def test_failures_open_and_fail_fast(self):
+        self._calls((True, 0.1), (False, 0.1), (False, 0.1))
+        self.assertEqual(self._state(), CLOSED)
+        self._calls((False, 0.1))
+        self.assertEqual(self._state(), OPEN)
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertTrue(25 <= raised.exception.retry_after <= 30)
+
+    def test_slow_successes_count_as_failures(self):
+        self._calls((True, 0.1), (True, 0.1), (True, 12), (True, 15))
+        self.assertEqual(self._state(), OPEN)
+
+    def test_single_trial_after_cooldown_then_close(self):
+        self._open()
+        self._expire('open_until')
+        self.assertTrue(self.breaker.before_call())
+        self.assertEqual(self._state(), HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.breaker.record(True, True, 0.2)
+        self.assertEqual(self._state(), CLOSED)
+        self.assertEqual(self.breaker.status()['window']['calls'], 0)
+        self.assertFalse(self.breaker.before_call())
+
+    def test_failed_trial_reopens(self):
+        self._open()
+        self._expire('open_until')
+        probe = self.breaker.before_call()
+        self.breaker.record(probe, False, 0.2)
+        self.assertEqual(self._state(), OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_lost_trial_expires(self):
+        self._open()
+        self._expire('open_until')
+        self.assertTrue(self.breaker.before_call())  # this trial never reports back
+        self._expire('probe_until')
+        self.assertTrue(self.breaker.before_call())
+        self.assertEqual(self._state(), HALF_OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
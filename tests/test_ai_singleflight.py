@@ -0,0 +1,145 @@
+"""Single-flight coalescing: one upstream call per key, shared results and errors, and the lease."""
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from app.models import db, AIInFlight
+from app import ai_singleflight_service as singleflight
+from tests.base import AppTestCase
+
+FOLLOWERS = 5
+
+
+def _counters():
+    with singleflight._counters_lock:
+        return dict(singleflight._counters)
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting for followers')
+        time.sleep(0.005)
+
+
+class InWorkerTest(unittest.TestCase):
+    """Threads of one worker; without an app context no lease is taken."""
+
+    def _run_together(self, target, release):
+        """Start a leader and FOLLOWERS threads on ``target``, release the leader once all have joined."""
+        results, errors = [], []
+
+        def run():
+            try:
+                results.append(target())
+            except Exception as e:
+                errors.append(e)
+
+        before = _counters()['shared_in_worker']
+        threads = [threading.Thread(target=run) for _ in range(FOLLOWERS + 1)]
+        for thread in threads:
+            thread.start()
+        _wait_for(lambda: _counters()['shared_in_worker'] - before == FOLLOWERS)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return results, errors
+
+    def test_identical_calls_share_one_upstream_call(self):
+        release, calls = threading.Event(), []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'answer'
+
+        results, errors = self._run_together(
+            lambda: singleflight.call('test-share', compute, lambda: None), release)
+        self.assertEqual((len(calls), errors), (1, []))
+        self.assertEqual(results, ['answer'] * (FOLLOWERS + 1))
+        self.assertNotIn('test-share', singleflight._flights)
+
+    def test_error_reaches_every_caller_and_is_not_cached(self):
+        release, calls = threading.Event(), []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            raise RuntimeError('upstream failed')
+
+        results, errors = self._run_together(
+            lambda: singleflight.call('test-error', compute, lambda: None), release)
+        self.assertEqual((len(calls), results), (1, []))
+        self.assertEqual([str(e) for e in errors], ['upstream failed'] * (FOLLOWERS + 1))
+
+        self.assertEqual(singleflight.call('test-error', lambda: 'recovered', lambda: None), 'recovered')
+
+    def test_stream_followers_receive_the_leaders_pieces(self):
+        release, calls = threading.Event(), []
+
+        def compute():
+            calls.append(1)
+
+            def pieces():
+                yield 'Hello'
+                release.wait(5)
+                yield ', world'
+            return pieces()
+
+        results, errors = self._run_together(
+            lambda: ''.join(singleflight.stream('test-stream', compute, lambda: None)), release)
+        self.assertEqual((len(calls), errors), (1, []))
+        self.assertEqual(results, ['Hello, world'] * (FOLLOWERS + 1))
+
+
+class AcrossWorkersTest(AppTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.app.config.update(AI_SINGLEFLIGHT_LEASE_SECONDS=45, AI_SINGLEFLIGHT_POLL_SECONDS=0.01)
+
+    def test_lease_is_exclusive_until_released_or_expired(self):
+        self.assertTrue(singleflight._claim('test-lease', 'worker-a'))
+        self.assertFalse(singleflight._claim('test-lease', 'worker-b'))
+        singleflight._release('test-lease', 'worker-a')
+        self.assertTrue(singleflight._claim('test-lease', 'worker-b'))
+
+        table = AIInFlight.__table__
+        with db.engine.begin() as connection:
+            connection.execute(table.update().where(table.c.key == 'test-lease')
+                               .values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        self.assertTrue(singleflight._claim('test-lease', 'worker-c'))
+        singleflight._release('test-lease', 'worker-c')
+
+    def test_waits_for_the_other_workers_answer(self):
+        self.assertTrue(singleflight._claim('test-remote', 'other-worker'))
+        lookups, calls = [], []
+
+        def lookup():
+            lookups.append(1)
+            return 'stored answer' if len(lookups) >= 3 else None
+
+        before = _counters()
+        result = singleflight.call('test-remote', lambda: calls.append(1) or 'local answer', lookup)
+        self.assertEqual((result, calls), ('stored answer', []))
+        self.assertEqual(_counters()['shared_across_workers'] - before['shared_across_workers'], 1)
+        singleflight._release('test-remote', 'other-worker')
+
+    def test_takes_over_when_the_other_worker_gives_up(self):
+        self.assertTrue(singleflight._claim('test-takeover', 'other-worker'))
+
+        def lookup():
+            # The other worker fails and releases its lease without storing an answer
+            singleflight._release('test-takeover', 'other-worker')
+            return None
+
+        before = _counters()
+        self.assertEqual(singleflight.call('test-takeover', lambda: 'local answer', lookup), 'local answer')
+        self.assertEqual(_counters()['upstream_calls'] - before['upstream_calls'], 1)
+        self.assertEqual(AIInFlight.query.filter_by(key='test-takeover').count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Write-maintained counters must match a rebuild from the source tables.
+
+Covers the dashboard counters (stats_service), the analytics rollup
+(analytics_service) and the per-employee attendance maps
+(attendance_map_service) after ORM inserts, updates and deletes and the
+bulk attendance upsert.
+"""
+import unittest
+from datetime import date, timedelta
+from app.models import (db, Employee, Attendance, StatsSnapshot, DepartmentStat, AttendanceDayStat,
+                        AttendanceDailyRollup, AttendanceMonthMap)
+from app.stats_service import rebuild_stats, get_dashboard_stats
+from app.analytics_service import rebuild_rollup
+from app.attendance_map_service import rebuild_attendance_maps
+from app.attendance_service import bulk_upsert_attendance
+from app.employee_summary_service import get_employee_summaries
+from tests.base import AppTestCase
+
+
+def _counter_state():
+    """Every maintained counter as plain, comparable values."""
+    return {
+        'snapshot': [(row.total_employees, row.active_employees, row.departments) for row in StatsSnapshot.query],
+        'departments': sorted((row.department, row.employee_count) for row in DepartmentStat.query),
+        'days': sorted((row.date, row.total, row.present) for row in AttendanceDayStat.query if row.total),
+        'rollup': sorted((row.date, row.department, row.status, row.count)
+                         for row in AttendanceDailyRollup.query if row.count),
+        'maps': sorted((row.employee_id, row.month, bytes(row.days))
+                       for row in AttendanceMonthMap.query if any(row.days)),
+    }
+
+
+class CounterDriftTest(AppTestCase):
+
+    def assertMatchesRebuild(self):
+        db.session.expire_all()
+        maintained = _counter_state()
+        rebuild_stats()
+        rebuild_rollup()
+        rebuild_attendance_maps()
+        db.session.commit()
+        db.session.expire_all()
+        self.assertEqual(maintained, _counter_state())
+
+    def test_orm_writes_keep_counters_in_step(self):
+        engineers = self.add_employees(4, department='Engineering')
+        sales = self.add_employees(3, department='Sales', status='Inactive')
+        today = date.today()
+        for offset in range(3):
+            for index, employee in enumerate(engineers + sales):
+                status = ('Present', 'Absent', 'Late')[(index + offset) % 3]
+                db.session.add(Attendance(employee_id=employee.id, date=today - timedelta(days=offset), status=status))
+        db.session.commit()
+        self.assertMatchesRebuild()
+
+        # Department and status changes on instances expired by the last commit
+        engineers[0].department = 'Operations'
+        sales[0].status = 'Active'
+        db.session.commit()
+        self.assertMatchesRebuild()
+
+        record = Attendance.query.filter_by(employee_id=engineers[1].id, date=today).one()
+        record.status = 'Absent' if record.status == 'Present' else 'Present'
+        record.date = today - timedelta(days=40)
+        db.session.commit()
+        self.assertMatchesRebuild()
+
+        db.session.delete(Attendance.query.filter_by(employee_id=sales[1].id).first())
+        for attendance in Attendance.query.filter_by(employee_id=engineers[2].id):
+            db.session.delete(attendance)
+        db.session.delete(engineers[2])
+        db.session.commit()
+        self.assertMatchesRebuild()
+
+    def test_bulk_upsert_keeps_counters_in_step(self):
+        employees = self.add_employees(5, department='Support')
+        day = date.today() - timedelta(days=7)
+        bulk_upsert_attendance(day, [(employee.id, 'Present', None) for employee in employees])
+        db.session.commit()
+        self.assertMatchesRebuild()
+
+        # Overwrite some, add one more employee's record
+        extra = self.add_employees(1, department='Support')[0]
+        bulk_upsert_attendance(day, [(employees[0].id, 'Absent', 'sick'), (extra.id, 'Late', None)])
+        db.session.commit()
+        self.assertMatchesRebuild()
+
+        # Every cell but one drops to zero
+        bulk_upsert_attendance(day, [(employee.id, 'Late', None) for employee in employees])
+        db.session.commit()
+        self.assertMatchesRebuild()
+        self.assertEqual({row.status for row in AttendanceDailyRollup.query.filter_by(date=day)}, {'Late'})
+
+    def test_dashboard_reads_counters(self):
+        self.add_employees(2, department='Finance')
+        self.add_employees(1, department='Finance', status='Inactive')
+        stats = get_dashboard_stats()
+        self.assertEqual(stats['total_employees'], Employee.query.count())
+        self.assertEqual(stats['active_employees'], Employee.query.filter_by(status='Active').count())
+        self.assertEqual(stats['departments'], db.session.query(Employee.department).distinct().count())
+
+    def test_employee_summaries_match_attendance_rows(self):
+        employees = self.add_employees(3, department='Summary')
+        today = date.today()
+        for index, employee in enumerate(employees):
+            for offset in range(0, 45, index + 1):
+                status = ('Present', 'Late', 'Sick Leave')[offset % 3]
+                db.session.add(Attendance(employee_id=employee.id, date=today - timedelta(days=offset), status=status))
+        db.session.commit()
+
+        summaries = get_employee_summaries([employee.id for employee in employees], days=30, today=today)
+        for employee in employees:
+            rows = db.session.query(Attendance.status, db.func.count(Attendance.id)).filter(
+                Attendance.employee_id == employee.id, Attendance.date >= today - timedelta(days=30)
+            ).group_by(Attendance.status).all()
+            self.assertEqual(summaries[employee.id].status_counts, dict(rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
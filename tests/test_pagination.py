@@ -0,0 +1,78 @@
+"""Keyset cursors must visit every row exactly once, in order, in both directions."""
+import unittest
+from datetime import date, datetime
+from app.models import db, Employee
+from app.pagination import keyset_paginate, encode_cursor, decode_cursor, cached_count
+from tests.base import AppTestCase
+
+
+class CursorEncodingTest(unittest.TestCase):
+
+    def test_round_trip_keeps_types(self):
+        values = [date(2024, 2, 29), datetime(2024, 3, 1, 12, 30), 'Sales', 42, 1.5]
+        self.assertEqual(decode_cursor(encode_cursor(values, backward=True)), (values, True))
+        self.assertEqual(decode_cursor(encode_cursor(values)), (values, False))
+
+    def test_bad_cursor_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            decode_cursor('not-a-cursor')
+
+
+class KeysetPaginateTest(AppTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Repeated salaries make the id tie-breaker matter
+        for index in range(23):
+            db.session.add(Employee(name=f'Paged {index}', email=f'paged{index}@example.com', department='Paging',
+                                    position='Engineer', salary=1000 * (index % 4), status='Active'))
+        db.session.commit()
+
+    def _query(self):
+        return Employee.query.filter_by(department='Paging')
+
+    def _walk(self, keys, descending):
+        """Page forward to the end, then back to the start; return both page lists of ids."""
+        forward, cursor = [], None
+        while True:
+            page = keyset_paginate(self._query(), keys, cursor=cursor, per_page=5, descending=descending)
+            forward.append([employee.id for employee in page.items])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        backward = [forward[-1]]
+        while page.has_prev:
+            page = keyset_paginate(self._query(), keys, cursor=page.prev_cursor, per_page=5, descending=descending)
+            backward.append([employee.id for employee in page.items])
+        return forward, backward
+
+    def _check(self, keys, descending, expected):
+        forward, backward = self._walk(keys, descending)
+        self.assertEqual([employee_id for page in forward for employee_id in page], expected)
+        self.assertTrue(all(len(page) == 5 for page in forward[:-1]))
+        self.assertEqual(backward, forward[::-1])
+
+    def test_ascending_by_id(self):
+        expected = [employee.id for employee in self._query().order_by(Employee.id)]
+        self._check([Employee.id], False, expected)
+
+    def test_descending_with_ties(self):
+        expected = [employee.id for employee in self._query().order_by(Employee.salary.desc(), Employee.id.desc())]
+        self._check([Employee.salary, Employee.id], True, expected)
+
+    def test_first_page_has_no_prev(self):
+        page = keyset_paginate(self._query(), [Employee.id], per_page=5)
+        self.assertFalse(page.has_prev)
+        self.assertTrue(page.has_next)
+
+    def test_cached_count_follows_data_version(self):
+        query = Employee.query.filter_by(department='Counting')
+        self.add_employees(2, department='Counting')
+        self.assertEqual(cached_count(query, ['employees'], 'counting'), 2)
+        self.add_employees(1, department='Counting')
+        self.assertEqual(cached_count(query, ['employees'], 'counting'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Payroll rule maths: components, caps, progressive tax and department overrides."""
+import unittest
+import numpy as np
+from app.models import db, Employee
+from app.payroll_service import validate_rules, load_rule_sets, PayrollRules, calculate_payroll
+from tests.base import AppTestCase
+
+RULES = {
+    'allowances': [
+        {'name': 'HRA', 'percent': 40},
+        {'name': 'Transport', 'amount': 1600}
+    ],
+    'deductions': [
+        {'name': 'PF', 'percent': 12, 'cap': 1800},
+        {'name': 'Insurance', 'amount': 500}
+    ],
+    'tax_slabs': [
+        {'up_to': 25000, 'rate': 0},
+        {'up_to': 50000, 'rate': 10},
+        {'rate': 20}
+    ]
+}
+
+
+class PayrollRulesTest(unittest.TestCase):
+
+    def test_components_caps_and_tax(self):
+        allowances, deductions = PayrollRules(RULES).evaluate(np.array([30000.0, 10000.0, 60000.0]))
+        # 30000: HRA 12000 + 1600; gross 43600 -> tax 10% of 18600; PF 3600 capped at 1800
+        # 10000: HRA 4000 + 1600; gross 15600 -> no tax; PF 1200
+        # 60000: HRA 24000 + 1600; gross 85600 -> 2500 + 20% of 35600; PF capped
+        np.testing.assert_allclose(allowances, [13600, 5600, 25600])
+        np.testing.assert_allclose(deductions, [1800 + 500 + 1860, 1200 + 500, 1800 + 500 + 2500 + 7120])
+
+    def test_tax_slab_boundaries(self):
+        rules = PayrollRules({'tax_slabs': RULES['tax_slabs']})
+        np.testing.assert_allclose(rules.tax(np.array([0.0, 25000, 50000, 50001])), [0, 0, 2500, 2500.2])
+
+    def test_no_rules_pay_basic_only(self):
+        allowances, deductions = PayrollRules().evaluate(np.array([5000.0]))
+        np.testing.assert_allclose(allowances, [0])
+        np.testing.assert_allclose(deductions, [0])
+
+    def test_department_override_replaces_by_name(self):
+        default, overrides = load_rule_sets({
+            '*': RULES,
+            'Sales': {'allowances': [{'name': 'HRA', 'percent': 0}, {'name': 'Commission', 'amount': 3000}],
+                      'tax_slabs': []}
+        })
+        allowances, deductions = overrides['Sales'].evaluate(np.array([30000.0]))
+        np.testing.assert_allclose(allowances, [1600 + 3000])
+        np.testing.assert_allclose(deductions, [1800 + 500])
+        np.testing.assert_allclose(default.evaluate(np.array([30000.0]))[0], [13600])
+
+    def test_validation_rejects_bad_rules(self):
+        for rules in (
+            {'bonus': []},
+            {'allowances': [{'name': 'HRA', 'percent': -1}]},
+            {'allowances': [{'name': 'HRA'}, {'name': 'HRA'}]},
+            {'tax_slabs': [{'rate': 10}, {'up_to': 100, 'rate': 20}]},
+            {'tax_slabs': [{'up_to': 100, 'rate': 10}, {'up_to': 50, 'rate': 20}]},
+            {'tax_slabs': [{'rate': 120}]},
+        ):
+            with self.subTest(rules=rules), self.assertRaises(ValueError):
+                validate_rules(rules)
+        self.assertIs(validate_rules(RULES), RULES)
+
+
+class CalculatePayrollTest(AppTestCase):
+
+    def test_exceptions_and_inactive_employees(self):
+        active = self.add_employees(3, department='Payroll', salary=30000)
+        inactive = self.add_employees(1, department='Payroll', status='Inactive')[0]
+        rule_sets = load_rule_sets({'*': RULES})
+        payroll = calculate_payroll({active[1].id: (1000, 250), inactive.id: (5000, 0)}, rule_sets,
+                                    after_id=active[0].id - 1)
+
+        self.assertEqual(list(payroll.employee_ids), [employee.id for employee in active])
+        np.testing.assert_allclose(payroll.allowances, [13600, 14600, 13600])
+        np.testing.assert_allclose(payroll.deductions, [4160, 4410, 4160])
+        np.testing.assert_allclose(payroll.net, [39440, 40190, 39440])
+
+    def test_chunks_follow_id_order(self):
+        employees = self.add_employees(5, department='Chunked')
+        start = employees[0].id - 1
+        ids = [employee_id for (employee_id,) in db.session.query(Employee.id)
+               .filter(Employee.status == 'Active', Employee.id > start).order_by(Employee.id)]
+        first = calculate_payroll(after_id=start, limit=2)
+        second = calculate_payroll(after_id=int(first.employee_ids[-1]), limit=2)
+        self.assertEqual(list(first.employee_ids) + list(second.employee_ids), ids[:4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Chunked payroll runs: checkpoints, resume after a failure, and the lease."""
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app.models import db, Employee, SalaryRecord, PayrollRun
+from app.payroll_run_service import create_run, process_run, PayrollRunExists
+from tests.base import AppTestCase
+
+
+class ChunkFailure(Exception):
+    pass
+
+
+class PayrollRunTest(AppTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.app.config['PAYROLL_CHUNK_SIZE'] = 4
+
+    def setUp(self):
+        if not Employee.query.count():
+            self.add_employees(10, department='Runs', salary=20000)
+            self.add_employees(2, department='Runs', status='Inactive')
+
+    def _records(self, month):
+        return db.session.query(SalaryRecord.employee_id, func.count()).filter_by(month=month) \
+            .group_by(SalaryRecord.employee_id).all()
+
+    def _active_ids(self):
+        return {employee_id for (employee_id,) in db.session.query(Employee.id).filter_by(status='Active')}
+
+    def test_run_pays_every_active_employee_once(self):
+        run = create_run('2031-01')
+        self.assertEqual(run.total, 10)
+        chunks = []
+        run = process_run(run.id, on_chunk=lambda run: chunks.append(run.id))
+        self.assertEqual((run.status, run.processed, len(chunks)), ('Completed', 10, 3))
+        records = self._records('2031-01')
+        self.assertEqual({employee_id for employee_id, _ in records}, self._active_ids())
+        self.assertTrue(all(count == 1 for _, count in records))
+
+    def test_failed_run_resumes_from_checkpoint(self):
+        run = create_run('2031-02')
+
+        def fail_after_first_chunk(run):
+            raise ChunkFailure('worker died')
+
+        with self.assertRaises(ChunkFailure):
+            process_run(run.id, on_chunk=fail_after_first_chunk)
+        db.session.expire_all()
+        failed = db.session.get(PayrollRun, run.id)
+        self.assertEqual((failed.status, failed.processed, failed.error), ('Failed', 4, 'worker died'))
+        self.assertEqual(len(self._records('2031-02')), 4)
+
+        resumed = process_run(run.id)
+        self.assertEqual((resumed.status, resumed.processed), ('Completed', 10))
+        records = self._records('2031-02')
+        self.assertEqual({employee_id for employee_id, _ in records}, self._active_ids())
+        self.assertTrue(all(count == 1 for _, count in records))
+
+    def test_live_lease_blocks_other_workers(self):
+        run = create_run('2031-03')
+        run.locked_by = 'other-host:1:1'
+        run.lease_expires_at = datetime.utcnow() + timedelta(minutes=5)
+        db.session.commit()
+        self.assertIsNone(process_run(run.id))
+        self.assertEqual(self._records('2031-03'), [])
+
+        # Once the lease lapses the run counts as stalled and anyone may finish it
+        run.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        self.assertEqual(process_run(run.id).status, 'Completed')
+
+    def test_one_run_per_month(self):
+        create_run('2031-04')
+        with self.assertRaises(PayrollRunExists):
+            create_run('2031-04')
+
+
+if __name__ == '__main__':
+    unittest.main()